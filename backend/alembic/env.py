@@ -1,7 +1,9 @@
 from logging.config import fileConfig
 from sqlalchemy import engine_from_config
+from sqlalchemy import inspect
 from sqlalchemy import pool
 from alembic import context
+from alembic.script import ScriptDirectory
 import os
 import sys
 from pathlib import Path
@@ -72,10 +74,20 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        empty = not inspect(connection).get_table_names()
+        connection.rollback()
         context.configure(
             connection=connection, target_metadata=target_metadata
         )
 
+        if empty:
+            # New database: create the current schema directly and mark it
+            # as up to date instead of replaying every revision
+            with connection.begin():
+                target_metadata.create_all(connection)
+                context.get_context().stamp(ScriptDirectory.from_config(config), "head")
+            return
+
         with context.begin_transaction():
             context.run_migrations()
 
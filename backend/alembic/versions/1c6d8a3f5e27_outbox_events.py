@@ -0,0 +1,40 @@
+"""Add outbox_events for the transactional event outbox
+
+Revision ID: 1c6d8a3f5e27
+Revises: 8f4c1b7e2a96
+Create Date: 2026-10-19 09:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c6d8a3f5e27'
+down_revision: Union[str, None] = '8f4c1b7e2a96'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases created by create_all after the outbox was added already have it
+    if sa.inspect(op.get_bind()).has_table('outbox_events'):
+        return
+    op.create_table(
+        'outbox_events',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('event_type', sa.String(50), nullable=False),
+        sa.Column('conversation_id', sa.String(36), nullable=True),
+        sa.Column('recipients', sa.Text(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('dispatched_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_outbox_events_pending', 'outbox_events', ['dispatched_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_events_pending', table_name='outbox_events')
+    op.drop_table('outbox_events')
@@ -0,0 +1,30 @@
+"""Add conversations.version for ETags on polled endpoints
+
+Revision ID: 3a7d0c5e8b14
+Revises: 5c1f0e7a9b21
+Create Date: 2026-10-19 09:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a7d0c5e8b14'
+down_revision: Union[str, None] = '5c1f0e7a9b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    columns = [column["name"] for column in sa.inspect(op.get_bind()).get_columns('conversations')]
+    # Databases created by create_all after the column was added already have it
+    if 'version' not in columns:
+        op.add_column('conversations', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,71 @@
+"""Baseline: the original users, conversations and messages tables with text ids
+
+Databases created by the original `Base.metadata.create_all` have exactly
+this schema; mark them with `alembic stamp 5c1f0e7a9b21` before upgrading.
+The revisions after it add everything since.
+
+Revision ID: 5c1f0e7a9b21
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1f0e7a9b21'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+AGENT_TONES = ('SMARTER', 'PROFESSIONAL', 'NICER', 'MEANER', 'SARCASM', 'LOVING', 'ANGRY', 'CUSTOM')
+MESSAGE_STATUSES = ('SENT', 'DELIVERED', 'READ')
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('username', sa.String(50), nullable=False),
+        sa.Column('email', sa.String(100), nullable=True),
+        sa.Column('password_hash', sa.String(255), nullable=True),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_table(
+        'conversations',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('user1_id', sa.String(36), sa.ForeignKey('users.id')),
+        sa.Column('user2_id', sa.String(36), sa.ForeignKey('users.id')),
+        sa.Column('user1_agent_tone', sa.Enum(*AGENT_TONES, name='agenttone')),
+        sa.Column('user2_agent_tone', sa.Enum(*AGENT_TONES, name='agenttone')),
+        sa.Column('user1_custom_prompt', sa.Text(), nullable=True),
+        sa.Column('user2_custom_prompt', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('last_message_at', sa.DateTime()),
+    )
+    op.create_table(
+        'messages',
+        sa.Column('id', sa.String(36), primary_key=True),
+        sa.Column('conversation_id', sa.String(36), sa.ForeignKey('conversations.id')),
+        sa.Column('sender_id', sa.String(36), sa.ForeignKey('users.id')),
+        sa.Column('original_content', sa.Text(), nullable=False),
+        sa.Column('transformed_content', sa.Text(), nullable=False),
+        sa.Column('timestamp', sa.DateTime()),
+        sa.Column('status', sa.Enum(*MESSAGE_STATUSES, name='messagestatus')),
+        sa.Column('is_read', sa.Boolean()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('messages')
+    op.drop_table('conversations')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_index('ix_users_username', table_name='users')
+    op.drop_table('users')
+    sa.Enum(name='messagestatus').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='agenttone').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,40 @@
+"""Index the user directory and each side of a user's conversations
+
+Revision ID: 6e2b9f4a1d53
+Revises: 3a7d0c5e8b14
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e2b9f4a1d53'
+down_revision: Union[str, None] = '3a7d0c5e8b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# IF NOT EXISTS: databases created by create_all after these were added already have them
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_users_username_lower ON users (lower(username))",
+    "CREATE INDEX IF NOT EXISTS ix_conversations_user1_last_message ON conversations (user1_id, last_message_at)",
+    "CREATE INDEX IF NOT EXISTS ix_conversations_user2_last_message ON conversations (user2_id, last_message_at)",
+]
+
+
+def upgrade() -> None:
+    for statement in INDEXES:
+        op.execute(statement)
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (lower(username) gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_users_username_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_conversations_user2_last_message")
+    op.execute("DROP INDEX IF EXISTS ix_conversations_user1_last_message")
+    op.execute("DROP INDEX IF EXISTS ix_users_username_lower")
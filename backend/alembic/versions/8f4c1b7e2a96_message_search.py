@@ -0,0 +1,78 @@
+"""Add full-text search over message content and index existing messages
+
+SQLite gets the FTS5 table, its rowid table and the triggers keeping them
+in sync; PostgreSQL gets a GIN expression index.
+
+Revision ID: 8f4c1b7e2a96
+Revises: 6e2b9f4a1d53
+Create Date: 2026-10-19 09:15:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f4c1b7e2a96'
+down_revision: Union[str, None] = '6e2b9f4a1d53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQLITE_DDL = [
+    "CREATE TABLE IF NOT EXISTS message_search_docs ("
+    "doc_id INTEGER PRIMARY KEY, message_id VARCHAR(36) NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "original_content, transformed_content, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO message_search_docs (message_id) VALUES (new.id); "
+    "INSERT INTO messages_fts (rowid, original_content, transformed_content) "
+    "VALUES (last_insert_rowid(), new.original_content, new.transformed_content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "DELETE FROM messages_fts WHERE rowid = "
+    "(SELECT doc_id FROM message_search_docs WHERE message_id = old.id); "
+    "DELETE FROM message_search_docs WHERE message_id = old.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_update "
+    "AFTER UPDATE OF original_content, transformed_content ON messages BEGIN "
+    "UPDATE messages_fts SET original_content = new.original_content, "
+    "transformed_content = new.transformed_content "
+    "WHERE rowid = (SELECT doc_id FROM message_search_docs WHERE message_id = new.id); "
+    "END",
+]
+
+SQLITE_BACKFILL = [
+    "INSERT INTO message_search_docs (message_id) SELECT id FROM messages",
+    "INSERT INTO messages_fts (rowid, original_content, transformed_content) "
+    "SELECT message_search_docs.doc_id, messages.original_content, messages.transformed_content "
+    "FROM message_search_docs JOIN messages ON messages.id = message_search_docs.message_id",
+]
+
+POSTGRES_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_messages_search ON messages USING gin "
+    "(to_tsvector('simple', coalesce(original_content, '') || ' ' || coalesce(transformed_content, '')))"
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        op.execute(POSTGRES_INDEX)
+        return
+    # Databases created by create_all after search was added are already indexed
+    if sa.inspect(bind).has_table('message_search_docs'):
+        return
+    for statement in SQLITE_DDL + SQLITE_BACKFILL:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_messages_search")
+        return
+    for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS messages_fts")
+    op.execute("DROP TABLE IF EXISTS message_search_docs")
@@ -0,0 +1,99 @@
+"""Store ids as native uuid (PostgreSQL) or 16-byte blobs (SQLite)
+
+Existing UUID4 values are kept; only new rows get time-ordered UUIDv7 ids.
+
+Revision ID: 9d3e4b6a2f08
+Revises: 1c6d8a3f5e27
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3e4b6a2f08'
+down_revision: Union[str, None] = '1c6d8a3f5e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ID_COLUMNS = [
+    ("users", "id"),
+    ("conversations", "id"),
+    ("conversations", "user1_id"),
+    ("conversations", "user2_id"),
+    ("messages", "id"),
+    ("messages", "conversation_id"),
+    ("messages", "sender_id"),
+    ("outbox_events", "conversation_id"),
+    # SQLite full-text search bookkeeping
+    ("message_search_docs", "message_id"),
+]
+
+# Default PostgreSQL constraint names from create_all
+FOREIGN_KEYS = [
+    ("conversations_user1_id_fkey", "conversations", "users", "user1_id"),
+    ("conversations_user2_id_fkey", "conversations", "users", "user2_id"),
+    ("messages_conversation_id_fkey", "messages", "conversations", "conversation_id"),
+    ("messages_sender_id_fkey", "messages", "users", "sender_id"),
+]
+
+
+def _text_to_blob(value):
+    try:
+        return uuid.UUID(value).bytes
+    except (TypeError, ValueError):
+        return value
+
+
+def _blob_to_text(value):
+    try:
+        return str(uuid.UUID(bytes=bytes(value)))
+    except (TypeError, ValueError):
+        return value
+
+
+def _existing_columns(bind):
+    inspector = sa.inspect(bind)
+    return [(table, column) for table, column in ID_COLUMNS if inspector.has_table(table)]
+
+
+def _convert_postgresql(bind, type_, using):
+    columns = _existing_columns(bind)
+    for name, table, _, _ in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_="foreignkey")
+    for table, column in columns:
+        op.alter_column(table, column, type_=type_, postgresql_using=using.format(column=column))
+    for name, table, referent, column in FOREIGN_KEYS:
+        op.create_foreign_key(name, table, referent, [column], ["id"])
+
+
+def _convert_sqlite(bind, function, source_type):
+    # SQLite does not coerce blobs to a column's declared type, so the
+    # existing columns can hold the new values without rebuilding tables
+    # (which would also drop the full-text search triggers)
+    bind.connection.dbapi_connection.create_function("convert_id", 1, function, deterministic=True)
+    for table, column in _existing_columns(bind):
+        op.execute(
+            f"UPDATE {table} SET {column} = convert_id({column}) WHERE typeof({column}) = '{source_type}'"
+        )
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        _convert_postgresql(bind, postgresql.UUID(), "{column}::uuid")
+    else:
+        _convert_sqlite(bind, _text_to_blob, "text")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        _convert_postgresql(bind, sa.String(36), "{column}::text")
+    else:
+        _convert_sqlite(bind, _blob_to_text, "blob")
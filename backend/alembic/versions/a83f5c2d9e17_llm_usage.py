@@ -0,0 +1,46 @@
+"""Add llm_usage and per-user token budgets
+
+Revision ID: a83f5c2d9e17
+Revises: f2b8d6e03c19
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from app.database.ids import GUID
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a83f5c2d9e17'
+down_revision: Union[str, None] = 'f2b8d6e03c19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('daily_token_budget', sa.Integer(), nullable=True))
+    op.create_table(
+        'llm_usage',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('user_id', GUID(), nullable=False),
+        sa.Column('message_id', GUID(), nullable=True),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('tone', sa.String(20), nullable=False),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+        sa.Column('completion_tokens', sa.Integer(), nullable=False),
+        sa.Column('max_tokens', sa.Integer(), nullable=False),
+        sa.Column('truncated', sa.Boolean(), nullable=False),
+        sa.Column('estimated', sa.Boolean(), nullable=False),
+        sa.Column('latency_ms', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_index('ix_llm_usage_user_created', 'llm_usage', ['user_id', 'created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_llm_usage_user_created', table_name='llm_usage')
+    op.drop_table('llm_usage')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('daily_token_budget')
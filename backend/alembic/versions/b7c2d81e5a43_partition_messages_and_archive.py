@@ -0,0 +1,96 @@
+"""Partition messages by month on PostgreSQL and add the message archive
+
+SQLite keeps a single messages table (its key stays `id`); archival is
+what keeps it small there.
+
+Revision ID: b7c2d81e5a43
+Revises: 9d3e4b6a2f08
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from app.database.ids import GUID
+from app.database.partitions import ensure_partitions
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c2d81e5a43'
+down_revision: Union[str, None] = '9d3e4b6a2f08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_messages_search ON messages USING gin "
+    "(to_tsvector('simple', coalesce(original_content, '') || ' ' || coalesce(transformed_content, '')))"
+)
+
+
+def _rename_old_messages(old: str):
+    op.execute(f"ALTER TABLE messages RENAME TO {old}")
+    op.execute(f"ALTER TABLE {old} RENAME CONSTRAINT messages_pkey TO {old}_pkey")
+    op.execute(f"ALTER TABLE {old} RENAME CONSTRAINT messages_conversation_id_fkey TO {old}_conversation_id_fkey")
+    op.execute(f"ALTER TABLE {old} RENAME CONSTRAINT messages_sender_id_fkey TO {old}_sender_id_fkey")
+    op.execute("DROP INDEX IF EXISTS ix_messages_search")
+
+
+def _finish_new_messages(old: str):
+    op.execute(
+        "ALTER TABLE messages ADD CONSTRAINT messages_conversation_id_fkey "
+        "FOREIGN KEY (conversation_id) REFERENCES conversations (id)"
+    )
+    op.execute(
+        "ALTER TABLE messages ADD CONSTRAINT messages_sender_id_fkey "
+        "FOREIGN KEY (sender_id) REFERENCES users (id)"
+    )
+    op.execute(f"INSERT INTO messages SELECT * FROM {old}")
+    op.execute(f"DROP TABLE {old}")
+    op.execute(SEARCH_INDEX)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'message_archive',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('conversation_id', GUID(), sa.ForeignKey('conversations.id'), nullable=False),
+        sa.Column('first_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('codec', sa.String(10), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_index('ix_message_archive_conversation_last', 'message_archive', ['conversation_id', 'last_timestamp'])
+    
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        op.execute("UPDATE messages SET timestamp = now() AT TIME ZONE 'utc' WHERE timestamp IS NULL")
+        _rename_old_messages("messages_unpartitioned")
+        op.execute(
+            "CREATE TABLE messages (LIKE messages_unpartitioned INCLUDING DEFAULTS, "
+            "PRIMARY KEY (id, timestamp)) PARTITION BY RANGE (timestamp)"
+        )
+        oldest = bind.execute(sa.text("SELECT min(timestamp) FROM messages_unpartitioned")).scalar()
+        ensure_partitions(bind, oldest or datetime.utcnow(), 2)
+        _finish_new_messages("messages_unpartitioned")
+    
+    op.create_index('ix_messages_conversation_timestamp', 'messages', ['conversation_id', 'timestamp'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_conversation_timestamp', table_name='messages')
+    
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        _rename_old_messages("messages_partitioned")
+        op.execute(
+            "CREATE TABLE messages (LIKE messages_partitioned INCLUDING DEFAULTS, PRIMARY KEY (id))"
+        )
+        # Dropping the parent drops every partition
+        _finish_new_messages("messages_partitioned")
+    
+    op.drop_index('ix_message_archive_conversation_last', table_name='message_archive')
+    op.drop_table('message_archive')
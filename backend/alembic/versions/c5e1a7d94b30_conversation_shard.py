@@ -0,0 +1,28 @@
+"""Record each conversation's message shard
+
+Revision ID: c5e1a7d94b30
+Revises: a83f5c2d9e17
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e1a7d94b30'
+down_revision: Union[str, None] = 'a83f5c2d9e17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing messages stay in the main database, listed first in DATABASE_SHARD_URLS
+    op.add_column('conversations', sa.Column('shard', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('shard')
@@ -0,0 +1,31 @@
+"""Add counters, starting with the users generation for the directory ETag
+
+Revision ID: d8b3e6f1a2c4
+Revises: c5e1a7d94b30
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8b3e6f1a2c4'
+down_revision: Union[str, None] = 'c5e1a7d94b30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    counters = op.create_table(
+        'counters',
+        sa.Column('name', sa.String(50), primary_key=True),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+    )
+    op.bulk_insert(counters, [{'name': 'users_generation', 'value': 0}])
+
+
+def downgrade() -> None:
+    op.drop_table('counters')
@@ -0,0 +1,35 @@
+"""Add retention_jobs for resumable batched deletions
+
+Revision ID: e4a9c3f17b62
+Revises: b7c2d81e5a43
+Create Date: 2026-10-19 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a9c3f17b62'
+down_revision: Union[str, None] = 'b7c2d81e5a43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'retention_jobs',
+        sa.Column('name', sa.String(100), primary_key=True),
+        sa.Column('kind', sa.String(50), nullable=False),
+        sa.Column('params', sa.Text(), nullable=False),
+        sa.Column('progress', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('started_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('retention_jobs')
@@ -0,0 +1,38 @@
+"""Add sync_log for reconnect catch-up
+
+Revision ID: f2b8d6e03c19
+Revises: e4a9c3f17b62
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from app.database.ids import GUID
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b8d6e03c19'
+down_revision: Union[str, None] = 'e4a9c3f17b62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sync_log',
+        sa.Column('seq', sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column('user_id', GUID(), nullable=False),
+        sa.Column('event_id', sa.Integer(), nullable=False),
+        sa.Column('event_type', sa.String(50), nullable=False),
+        sa.Column('conversation_id', GUID(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_index('ix_sync_log_user_seq', 'sync_log', ['user_id', 'seq'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sync_log_user_seq', table_name='sync_log')
+    op.drop_table('sync_log')
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..database.connection import get_db
+from ..database.models import User
+from ..services.diagnostics import StackSampler, loop_monitor
+from ..services.usage_service import usage_tracker, start_of_day
+from .auth import get_current_user
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+# One whole-worker profile at a time; overlapping samplers skew each other
+profile_lock = asyncio.Lock()
+
+class TokenBudgetRequest(BaseModel):
+    # None falls back to LLM_DAILY_TOKEN_BUDGET; 0 means unlimited
+    daily_tokens: Optional[int] = Field(None, ge=0)
+
+def is_admin(user: User) -> bool:
+    # Ids come from the signed token; anyone can claim an unused username
+    admins = {user_id.strip().lower() for user_id in settings.ADMIN_USER_IDS.split(",") if user_id.strip()}
+    return str(user.id).lower() in admins
+
+async def get_admin_user(current_user = Depends(get_current_user)):
+    if not is_admin(current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return current_user
+
+@router.get("/loop")
+async def loop_stats(admin = Depends(get_admin_user)):
+    """Event loop lag percentiles and the stack of the most recent stall"""
+    return loop_monitor.stats()
+
+@router.post("/profile")
+async def profile_worker(
+    seconds: float = Query(10.0, gt=0, le=120),
+    interval_ms: Optional[float] = Query(None, ge=1, le=100),
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$"),
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Sample this worker's event loop for `seconds` and return the stacks.
+    
+    `collapsed` feeds flamegraph.pl; `speedscope` opens in speedscope.app.
+    To profile a single request instead, send it with an `X-Profile` header.
+    """
+    if profile_lock.locked():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profile is already running")
+    # Do not hold a pooled connection while sampling
+    await db.close()
+    async with profile_lock:
+        sampler = StackSampler(threading.get_ident(), (interval_ms or settings.PROFILER_INTERVAL_MS) / 1000.0)
+        await asyncio.get_running_loop().run_in_executor(None, sampler.run, seconds)
+    body, media_type = sampler.render(format, f"worker, {seconds:g}s")
+    return Response(body, media_type=media_type)
+
+@router.get("/usage")
+async def usage_report(
+    days: int = Query(1, ge=1, le=90),
+    user_id: Optional[str] = None,
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Llama calls and tokens per user and tone, over the last `days` UTC days"""
+    since = start_of_day(datetime.utcnow()) - timedelta(days=days - 1)
+    return {"since": since.isoformat(), "usage": await usage_tracker.summary(db, since, user_id=user_id)}
+
+@router.put("/users/{user_id}/token-budget")
+async def set_token_budget(
+    user_id: str,
+    request: TokenBudgetRequest,
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Set one user's daily token budget; only ADMIN_USER_IDS may, since 0 lifts the limit"""
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.daily_token_budget = request.daily_tokens
+    await db.commit()
+    usage_tracker.forget(user_id)
+    return {"user_id": user_id, **await usage_tracker.budget_status(user_id)}
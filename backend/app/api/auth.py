@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -9,30 +9,19 @@ from passlib.context import CryptContext
 from ..database.connection import get_db
 from ..database.models import User
 from ..services.auth_service import AuthService
+from ..services.retention_service import retention
+from ..services.http_client import get_http_client
 from ..config import settings
 from typing import Optional
-import httpx
-from authlib.integrations.starlette_client import OAuth
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/auth/token", auto_error=False)
 auth_service = AuthService()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Initialize OAuth
-oauth = OAuth()
-oauth.register(
-    name='google',
-    client_id=settings.GOOGLE_CLIENT_ID,
-    client_secret=settings.GOOGLE_CLIENT_SECRET,
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={
-        'scope': 'openid email profile'
-    }
-)
-
 class UserCreate(BaseModel):
     username: str
     password: Optional[str] = None
@@ -82,6 +71,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+# EventSource cannot set headers, so streaming endpoints also accept ?token=
+async def get_current_user_from_query(
+    token: Optional[str] = Query(None),
+    header_token: Optional[str] = Depends(oauth2_scheme_optional),
+    db: AsyncSession = Depends(get_db)
+):
+    return await get_current_user(header_token or token or "", db)
+
 @router.post("/register", response_model=Token)
 async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
@@ -127,6 +124,15 @@ async def get_me(current_user = Depends(get_current_user)):
         email=current_user.email
     )
 
+@router.delete("/me", status_code=status.HTTP_202_ACCEPTED)
+async def delete_me(background_tasks: BackgroundTasks, current_user = Depends(get_current_user)):
+    """Delete the current account with its conversations and messages.
+    
+    Runs as a throttled background job; the account disappears when it finishes.
+    """
+    background_tasks.add_task(retention.delete_user_job, current_user.id)
+    return {"job": f"delete-user-{current_user.id}"}
+
 @router.get("/google/login")
 async def google_login():
     """Redirect to Google OAuth login"""
@@ -140,7 +146,7 @@ async def google_callback(code: str, db: AsyncSession = Depends(get_db)):
     """Handle Google OAuth callback"""
     try:
         # Exchange code for token
-        token_response = httpx.post(
+        token_response = await get_http_client().post(
             "https://oauth2.googleapis.com/token",
             data={
                 "code": code,
@@ -158,7 +164,7 @@ async def google_callback(code: str, db: AsyncSession = Depends(get_db)):
         access_token = token_data.get("access_token")
         
         # Get user info from Google
-        user_info_response = httpx.get(
+        user_info_response = await get_http_client().get(
             "https://www.googleapis.com/oauth2/v2/userinfo",
             headers={"Authorization": f"Bearer {access_token}"}
         )
@@ -1,19 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
+from datetime import datetime, timedelta
+import asyncio
+import json
 from ..database.connection import get_db
+from ..database.replicas import get_read_db
 from ..database.models import User, Conversation, Message, AgentTone
 from ..services.chat_service import ChatService
-from .auth import get_current_user
+from ..services.directory_service import DirectoryService, InvalidCursorError, users_generation
+from ..services.search_service import SearchService
+from ..services.conversation_cache import conversation_cache
+from ..services.sync_service import SyncService, sync_log
+from ..services.export_service import EXPORT_FORMATS, export_service
+from ..services.usage_service import usage_tracker, start_of_day, TokenBudgetExceeded
+from ..config import settings
+from ..websocket.manager import manager
+from .auth import get_current_user, get_current_user_from_query
+from .limits import admit, rate_limited, retry_after
+from .etag import make_etag, etag_matches, not_modified, set_etag
+from .compact import FORMATS, compact_messages
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 chat_service = ChatService()
+directory_service = DirectoryService()
+search_service = SearchService()
 
 class SendMessageRequest(BaseModel):
     content: str
 
+class BroadcastMessageRequest(BaseModel):
+    conversation_ids: List[str]
+    content: str
+
 class UpdateToneRequest(BaseModel):
     tone: str
     custom_prompt: Optional[str] = None
@@ -28,6 +50,10 @@ class MessageResponse(BaseModel):
     is_mine: bool
     is_read: bool
 
+class UserPageResponse(BaseModel):
+    users: List[Dict[str, str]]
+    next_cursor: Optional[str]
+
 class ConversationResponse(BaseModel):
     id: str
     other_user: Dict[str, str]
@@ -36,30 +62,73 @@ class ConversationResponse(BaseModel):
     my_agent_tone: str
     my_custom_prompt: Optional[str]
 
-@router.get("/users", response_model=List[Dict[str, str]])
+@router.get("/users", response_model=UserPageResponse)
 async def get_all_users(
+    request: Request,
+    response: Response,
+    q: Optional[str] = Query(None, max_length=50),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=DirectoryService.MAX_LIMIT),
+    order: str = Query("name", pattern="^(name|recent)$"),
+    fuzzy: bool = False,
     current_user = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all users except current user"""
-    result = await db.execute(
-        select(User).where(User.id != current_user.id)
-    )
-    users = result.scalars().all()
+    """Get a page of the user directory, optionally filtered by username.
     
-    return [
-        {"id": user.id, "username": user.username}
-        for user in users
-    ]
+    `order=recent` lists the caller's contacts by last message first. Served
+    from a read replica when one is available; the ETag is computed there too,
+    so it always describes the page that was sent.
+    """
+    # Signups change the count and newest signup; deletions bump the users generation
+    stats = await db.execute(select(func.count(User.id), func.max(User.created_at), users_generation()))
+    etag_parts = ["users", current_user.id, *stats.one(), q, cursor, limit, order, fuzzy]
+    if order == "recent":
+        etag_parts.append(await chat_service.get_conversations_etag_source(current_user.id, db))
+    etag = make_etag(*etag_parts)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    
+    try:
+        return await directory_service.list_users(
+            current_user.id, db, query=q, cursor=cursor, limit=limit, order=order, fuzzy=fuzzy
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/conversations", response_model=List[ConversationResponse])
-async def get_conversations(
+@router.get("/search")
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=SearchService.MAX_LIMIT),
+    offset: int = Query(0, ge=0, le=1000),
     current_user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
+):
+    """Full-text search over messages in the current user's conversations"""
+    return await search_service.search_messages(current_user.id, q, db, limit=limit, offset=offset)
+
+@router.get("/conversations", response_model=List[ConversationResponse], dependencies=[Depends(admit())])
+async def get_conversations(
+    request: Request,
+    current_user = Depends(rate_limited("conversations")),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
 ):
     """Get all conversations for current user"""
-    conversations = await chat_service.get_user_conversations(current_user.id, db)
-    return conversations
+    versions = await chat_service.get_conversations_etag_source(current_user.id, db)
+    etag = make_etag("conversations", current_user.id, versions)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    # A replica may build the list once it has every version the primary has
+    source = db
+    if read_db is not db and await chat_service.get_conversations_etag_source(current_user.id, read_db) == versions:
+        source = read_db
+    
+    # Already response-shaped; skip response_model validation and encode with orjson
+    conversations = await chat_service.get_user_conversations(current_user.id, source)
+    return json_response(conversations, etag)
 
 @router.post("/conversation/{other_user_id}")
 async def get_or_create_conversation(
@@ -95,13 +164,23 @@ async def get_or_create_conversation(
         "my_custom_prompt": user_custom_prompt
     }
 
-@router.get("/conversation/{conversation_id}/messages", response_model=List[MessageResponse])
+@router.get("/conversation/{conversation_id}/messages", response_model=List[MessageResponse],
+            dependencies=[Depends(admit())])
 async def get_messages(
     conversation_id: str,
-    current_user = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    format: str = Query("full", pattern=FORMATS),
+    before: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    current_user = Depends(rate_limited("messages")),
+    db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all messages in a conversation"""
+    """Get messages in a conversation, oldest first (`format=compact` for the compact wire format).
+    
+    Without `limit` this is the whole history. With it, the newest `limit`
+    messages older than `before`; archived history pages in transparently.
+    """
     # Verify user is part of this conversation
     conversation = await db.get(Conversation, conversation_id)
     if not conversation:
@@ -110,53 +189,199 @@ async def get_messages(
     if conversation.user1_id != current_user.id and conversation.user2_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
+    # An unchanged version means nothing arrived since this user's last full
+    # fetch, which already marked everything read
+    etag = make_etag("messages", conversation.id, conversation.version, current_user.id, format, before, limit)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
     # Mark messages as read
-    await chat_service.mark_messages_as_read(conversation_id, current_user.id, db)
+    if await chat_service.mark_messages_as_read(conversation_id, current_user.id, db):
+        await db.refresh(conversation)
+        etag = make_etag("messages", conversation.id, conversation.version, current_user.id, format, before, limit)
+    
+    # Read history from a replica only if it has caught up with this version,
+    # including the read receipts written just above
+    source = db
+    if read_db is not db and await chat_service.get_conversation_version(conversation_id, read_db) == conversation.version:
+        source = read_db
     
     # Get messages
-    messages = await chat_service.get_conversation_messages(conversation_id, db)
+    messages = await chat_service.get_conversation_message_rows(
+        conversation_id, current_user.id, source, before=before, limit=limit
+    )
+    return messages_response(messages, current_user, format, etag)
+
+@router.get("/conversation/{conversation_id}/messages/poll", response_model=List[MessageResponse],
+            dependencies=[Depends(admit())])
+async def poll_messages(
+    conversation_id: str,
+    since: datetime,
+    timeout: float = Query(25.0, ge=0, le=60),
+    format: str = Query("full", pattern=FORMATS),
+    current_user = Depends(rate_limited("poll")),
+    db: AsyncSession = Depends(get_db)
+):
+    """Long-poll for messages newer than `since`.
+    
+    Holds the request until a new message arrives in the conversation or the
+    timeout passes, in which case an empty list is returned.
+    """
+    conversation = await db.get(Conversation, conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    if conversation.user1_id != current_user.id and conversation.user2_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # Subscribe before querying so a message sent in between is not missed
+    queue = manager.subscribe(current_user.id)
+    try:
+        messages = await chat_service.get_conversation_message_rows(conversation_id, current_user.id, db, since=since)
+        if not messages:
+            # Release the pooled connection while the request is parked
+            await db.commit()
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while not messages:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if event.get("conversation_id") == conversation_id:
+                    messages = await chat_service.get_conversation_message_rows(
+                        conversation_id, current_user.id, db, since=since
+                    )
+    finally:
+        manager.unsubscribe(queue, current_user.id)
+    
+    if messages:
+        await chat_service.mark_messages_as_read(conversation_id, current_user.id, db)
+    return messages_response(messages, current_user, format)
+
+def json_response(content: Any, etag: Optional[str] = None) -> ORJSONResponse:
+    """Encode rows that already match the response model, bypassing FastAPI's validation"""
+    response = ORJSONResponse(content)
+    if etag:
+        set_etag(response, etag)
+    return response
+
+def messages_response(messages: List[Dict[str, Any]], current_user: User, format: str,
+                      etag: Optional[str] = None) -> ORJSONResponse:
+    if format == "compact":
+        return json_response(compact_messages(messages, current_user.id, current_user.username), etag)
+    return json_response(messages, etag)
+
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    current_user = Depends(get_current_user_from_query),
+    db: AsyncSession = Depends(get_db)
+):
+    """Server-Sent Events stream of the current user's chat events"""
+    user_id = current_user.id
+    # The stream never touches the database again
+    await db.close()
+    queue = manager.subscribe(user_id)
     
-    # Get sender usernames
-    user_ids = list(set([msg.sender_id for msg in messages]))
-    users_result = await db.execute(
-        select(User).where(User.id.in_(user_ids))
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                event_id = f"id: {event['event_id']}\n" if "event_id" in event else ""
+                yield f"{event_id}event: {event.get('type', 'message')}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            manager.unsubscribe(queue, user_id)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/sync", dependencies=[Depends(admit(replica=True))])
+async def sync_changes(
+    after: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=SyncService.MAX_LIMIT),
+    current_user = Depends(rate_limited("sync")),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Changes for the current user since seq `after`, oldest first.
+    
+    Each change has the same shape as its real-time event plus `seq`. Keep
+    calling with `after=next` while `has_more`. `reset` means the cursor is
+    older than the retained log: refetch conversations and continue from `next`.
+    """
+    return json_response(await sync_log.changes(current_user.id, after, db, limit=limit))
+
+@router.get("/usage")
+async def get_usage(
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Today's (UTC) Llama token usage for the current user, per tone, and their budget"""
+    by_tone = await usage_tracker.summary(db, start_of_day(datetime.utcnow()), user_id=current_user.id)
+    for row in by_tone:
+        del row["user_id"]
+    return {**await usage_tracker.budget_status(current_user.id), "by_tone": by_tone}
+
+@router.get("/export")
+async def export_messages(
+    conversation_id: Optional[str] = None,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Stream one conversation, or all of the current user's, as NDJSON or CSV"""
+    if conversation_id:
+        conversation = await conversation_cache.get(conversation_id, db)
+        if not conversation:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        if not conversation.has_participant(current_user.id):
+            raise HTTPException(status_code=403, detail="Not authorized")
+        conversation_ids = [conversation_id]
+    else:
+        conversation_ids = await export_service.user_conversation_ids(current_user.id, db)
+    
+    filename = f"messages-{conversation_id or current_user.id}.{format}"
+    return StreamingResponse(
+        export_service.export(conversation_ids, db, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
-    users = {u.id: u.username for u in users_result.scalars().all()}
-    
-    return [
-        MessageResponse(
-            id=msg.id,
-            sender_id=msg.sender_id,
-            sender_username=users.get(msg.sender_id, "Unknown"),
-            original_content=msg.original_content,
-            transformed_content=msg.transformed_content,
-            timestamp=msg.timestamp.isoformat(),
-            is_mine=msg.sender_id == current_user.id,
-            is_read=msg.is_read
-        )
-        for msg in messages
-    ]
 
-@router.post("/conversation/{conversation_id}/send")
+@router.post("/conversation/{conversation_id}/send", dependencies=[Depends(admit(transforms=True))])
 async def send_message(
     conversation_id: str,
     request: SendMessageRequest,
-    current_user = Depends(get_current_user),
+    current_user = Depends(rate_limited("send")),
     db: AsyncSession = Depends(get_db)
 ):
     """Send a message in a conversation"""
     # Verify user is part of this conversation
-    conversation = await db.get(Conversation, conversation_id)
+    conversation = await conversation_cache.get(conversation_id, db)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    if conversation.user1_id != current_user.id and conversation.user2_id != current_user.id:
+    if not conversation.has_participant(current_user.id):
         raise HTTPException(status_code=403, detail="Not authorized")
     
     # Send message
-    message = await chat_service.send_message(
-        conversation_id, current_user.id, request.content, db
-    )
+    try:
+        message = await chat_service.send_message(
+            conversation_id, current_user.id, request.content, db
+        )
+    except TokenBudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after(e.retry_after))
     
     if not message:
         raise HTTPException(status_code=500, detail="Failed to send message")
@@ -168,6 +393,52 @@ async def send_message(
         "timestamp": message.timestamp.isoformat()
     }
 
+@router.post("/broadcast", dependencies=[Depends(admit(transforms=True))])
+async def broadcast_message(
+    request: BroadcastMessageRequest,
+    current_user = Depends(rate_limited("broadcast")),
+    db: AsyncSession = Depends(get_db)
+):
+    """Send the same message to several conversations at once"""
+    if not request.conversation_ids:
+        raise HTTPException(status_code=400, detail="No conversations given")
+    
+    if len(request.conversation_ids) > settings.MAX_BROADCAST_CONVERSATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot send to more than {settings.MAX_BROADCAST_CONVERSATIONS} conversations at once"
+        )
+    
+    result = await chat_service.send_bulk_message(
+        request.conversation_ids, current_user.id, request.content, db
+    )
+    
+    if not result["messages"]:
+        if all(reason == chat_service.NOT_FOUND_REASON for reason in result["failed"].values()):
+            raise HTTPException(status_code=404, detail="Conversation not found or not authorized")
+        if all(reason == chat_service.BUDGET_REASON for reason in result["failed"].values()):
+            now = datetime.utcnow()
+            raise HTTPException(
+                status_code=429,
+                detail=chat_service.BUDGET_REASON,
+                headers=retry_after((start_of_day(now) + timedelta(days=1) - now).total_seconds())
+            )
+        raise HTTPException(status_code=500, detail="Failed to send message")
+    
+    return {
+        "messages": [
+            {
+                "id": message.id,
+                "conversation_id": message.conversation_id,
+                "original_content": message.original_content,
+                "transformed_content": message.transformed_content,
+                "timestamp": message.timestamp.isoformat()
+            }
+            for message in result["messages"]
+        ],
+        "failed": result["failed"]
+    }
+
 @router.put("/conversation/{conversation_id}/tone")
 async def update_tone(
     conversation_id: str,
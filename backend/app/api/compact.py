@@ -0,0 +1,38 @@
+"""Compact wire format for message lists, opted into with `?format=compact`.
+
+Senders are listed once in `participants` and referenced by index,
+timestamps are epoch milliseconds, and each message carries only the
+content its viewer displays: the transformed text, plus the original for
+the viewer's own messages when the agent changed it.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+FORMATS = "^(full|compact)$"
+
+def epoch_ms(timestamp: datetime) -> int:
+    """Milliseconds since the epoch for a naive UTC datetime"""
+    return int(timestamp.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def compact_messages(messages: List[Dict[str, Any]], user_id: str, username: str) -> Dict[str, Any]:
+    """Convert rows from ChatService.get_conversation_message_rows"""
+    participants = [{"id": user_id, "username": username}]
+    index = {user_id: 0}
+    compacted = []
+    for message in messages:
+        sender = index.get(message["sender_id"])
+        if sender is None:
+            sender = index[message["sender_id"]] = len(participants)
+            participants.append({"id": message["sender_id"], "username": message["sender_username"]})
+        item = {
+            "id": message["id"],
+            "sender": sender,
+            "content": message["transformed_content"],
+            "ts": epoch_ms(message["timestamp"]),
+            "read": message["is_read"]
+        }
+        if message["is_mine"] and message["original_content"] != message["transformed_content"]:
+            item["original"] = message["original_content"]
+        compacted.append(item)
+    # The viewer is always participants[0]
+    return {"participants": participants, "messages": compacted}
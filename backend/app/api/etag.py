@@ -0,0 +1,36 @@
+"""Helpers for ETag / conditional GET support on polled endpoints"""
+import hashlib
+from typing import Any
+from fastapi import Request, Response
+
+# Clients must revalidate on every request, so the browser cache turns
+# unchanged polls into cheap 304 responses.
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts: Any) -> str:
+    """Build a weak ETag from the values that determine a response"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: ignore the W/ prefix on both sides
+    candidates = [_opaque_tag(tag.strip()) for tag in header.split(",")]
+    return _opaque_tag(etag) in candidates
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+def not_modified(etag: str) -> Response:
+    """Build an empty 304 response carrying the current ETag"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def set_etag(response: Response, etag: str):
+    """Attach the ETag and revalidation headers to a full response"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
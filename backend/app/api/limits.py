@@ -0,0 +1,58 @@
+"""Rate limiting and load shedding dependencies for the send and polled endpoints"""
+import math
+import time
+from typing import Callable, Dict
+from fastapi import Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database.connection import get_db
+from ..services.rate_limiter import rate_limiter, admission, RateLimitExceeded, Overloaded
+from .auth import get_current_user
+
+def retry_after(seconds: float) -> Dict[str, str]:
+    """Retry-After header, in whole seconds and never zero"""
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+def admit(transforms: bool = False, replica: bool = False) -> Callable:
+    """Route dependency that answers 503 while the worker is overloaded.
+    
+    Use it in the decorator's `dependencies` so it runs before authentication.
+    Routes that work on the primary have it check out the request's database
+    connection itself, which is how the pool wait is measured. Routes served
+    by `get_read_db` pass `replica=True`: they are still shed, but do not take
+    a primary connection just to measure a pool they do not use.
+    """
+    def shed():
+        try:
+            admission.check(transforms=transforms)
+        except Overloaded as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers=retry_after(e.retry_after)
+            )
+    
+    if replica:
+        async def dependency():
+            shed()
+        return dependency
+    
+    async def dependency(db: AsyncSession = Depends(get_db)):
+        shed()
+        started = time.monotonic()
+        await db.connection()
+        admission.record_pool_wait(time.monotonic() - started)
+    return dependency
+
+def rate_limited(route: str) -> Callable:
+    """Dependency returning the current user, or 429 once they exceed the route's limit"""
+    async def dependency(current_user = Depends(get_current_user)):
+        try:
+            await rate_limiter.check(route, current_user.id)
+        except RateLimitExceeded as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers=retry_after(e.retry_after)
+            )
+        return current_user
+    return dependency
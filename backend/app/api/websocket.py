@@ -0,0 +1,55 @@
+import json
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+from ..database.connection import AsyncSessionLocal
+from ..services.auth_service import AuthService
+from ..services.chat_service import ChatService
+from ..services.drain import drain_coordinator
+from ..websocket.manager import manager
+from ..websocket.presence import presence
+
+router = APIRouter(tags=["websocket"])
+auth_service = AuthService()
+chat_service = ChatService()
+
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
+    """Real-time chat events for the authenticated user"""
+    if drain_coordinator.draining:
+        # 1013: try again later, on another worker
+        await websocket.close(code=1013)
+        return
+    async with AsyncSessionLocal() as db:
+        try:
+            user = await auth_service.get_current_user(token, db)
+        except Exception:
+            await websocket.close(code=1008)
+            return
+        user_id = user.id
+        # Who should hear about this user's presence and typing
+        for conversation in await chat_service.get_conversation_participants(user_id, db):
+            presence.register_conversation(*conversation)
+    
+    connection = await manager.connect(websocket, user_id)
+    try:
+        await presence.connected(user_id)
+        await manager.send_json_to_user(
+            {"type": "presence_snapshot", "online": sorted(await presence.online_partners(user_id))},
+            user_id
+        )
+        while True:
+            # Any frame counts as a heartbeat; clients answer {"type": "ping"}
+            # with {"type": "pong"}
+            data = await websocket.receive_text()
+            connection.touch()
+            await presence.heartbeat(user_id)
+            try:
+                event = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(event, dict) and event.get("type") == "typing":
+                await presence.typing(user_id, str(event.get("conversation_id")), bool(event.get("active", True)))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(websocket, user_id)
+        await presence.disconnected(user_id)
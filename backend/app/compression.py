@@ -0,0 +1,97 @@
+"""Negotiated gzip/brotli compression for buffered responses"""
+import gzip
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Event streams must reach the client chunk by chunk, so they are never compressed
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0"""
+    offered = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[coding.strip().lower()] = quality
+    wildcard = offered.get("*", 0.0)
+    if brotli is not None and offered.get("br", wildcard) > 0:
+        return "br"
+    if offered.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+class CompressionMiddleware:
+    """Compress single-body responses of at least `minimum_size` bytes.
+    
+    Streaming responses (more than one body message) pass through untouched.
+    """
+    
+    def __init__(self, app: ASGIApp, minimum_size: Optional[int] = None, gzip_level: Optional[int] = None,
+                 brotli_quality: Optional[int] = None):
+        # Starlette builds middleware on the first request, so settings are read then
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MINIMUM_SIZE if minimum_size is None else minimum_size
+        self.gzip_level = settings.COMPRESSION_GZIP_LEVEL if gzip_level is None else gzip_level
+        self.brotli_quality = settings.COMPRESSION_BROTLI_QUALITY if brotli_quality is None else brotli_quality
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message: Optional[Message] = None
+        passthrough = False
+        
+        async def send_compressed(message: Message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or content_type.startswith(UNCOMPRESSED_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Hold the headers until we know the body size
+                    start_message = message
+                return
+            
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) >= self.minimum_size:
+                if encoding == "br":
+                    body = brotli.compress(body, quality=self.brotli_quality)
+                else:
+                    body = gzip.compress(body, compresslevel=self.gzip_level)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+        
+        await self.app(scope, receive, send_compressed)
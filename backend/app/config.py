@@ -1,5 +1,6 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Any, Callable, Optional
 import os
 
 class Settings(BaseSettings):
@@ -7,6 +8,17 @@ class Settings(BaseSettings):
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./agent_chat.db")
     USE_SQLITE: bool = "sqlite" in os.getenv("DATABASE_URL", "sqlite:///./agent_chat.db")
     
+    # Read replicas (comma-separated PostgreSQL URLs; ignored with SQLite)
+    DATABASE_REPLICA_URLS: str = ""
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_HEALTH_CHECK_SECONDS: float = 5.0
+    
+    # Message shards (comma-separated URLs, only ever appended to; empty keeps
+    # messages in DATABASE_URL, which may also be listed as one of them)
+    DATABASE_SHARD_URLS: str = ""
+    SHARD_REBALANCE_BATCH_SIZE: int = 500  # messages copied per transaction
+    SHARD_REBALANCE_SETTLE_SECONDS: float = 5.0  # wait after moving before the final catch-up copy
+    
     # Redis (optional for development)
     REDIS_URL: str = "redis://localhost:6379"
     
@@ -17,12 +29,113 @@ class Settings(BaseSettings):
     
     # Llama API - Get your API key from https://llama.com/
     LLAMA_API_KEY: str = os.getenv("LLAMA_API_KEY", "your-llama-api-key-here")
+    LLAMA_API_BASE_URL: str = "https://api.llama.com/v1"  # llama_simulator.py serves http://localhost:8090/v1
     
     # Google OAuth - Get credentials from Google Cloud Console
     GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", "your-google-client-id-here")
     GOOGLE_CLIENT_SECRET: Optional[str] = os.getenv("GOOGLE_CLIENT_SECRET", None)
     GOOGLE_REDIRECT_URI: str = "http://localhost:8000/api/auth/google/callback"
     
+    # Chat limits
+    MAX_BROADCAST_CONVERSATIONS: int = 100
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+    
+    # WebSocket delivery
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SEND_TIMEOUT_SECONDS: float = 10.0
+    WS_OVERFLOW_POLICY: str = "drop_oldest"  # or "disconnect"
+    WS_PING_INTERVAL_SECONDS: float = 20.0
+    WS_PONG_TIMEOUT_SECONDS: float = 60.0
+    
+    # Presence and typing indicators (in memory; Redis relays between workers)
+    PRESENCE_TTL_SECONDS: float = 60.0
+    PRESENCE_OFFLINE_GRACE_SECONDS: float = 5.0
+    PRESENCE_USE_REDIS: bool = False
+    TYPING_INTERVAL_SECONDS: float = 3.0
+    
+    # Response compression (brotli is used when installed and accepted)
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    
+    # Per-user token bucket rate limits (Redis shares the buckets between workers)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_USE_REDIS: bool = False
+    RATE_LIMIT_SEND_PER_MINUTE: float = 30.0
+    RATE_LIMIT_SEND_BURST: int = 10
+    RATE_LIMIT_BROADCAST_PER_MINUTE: float = 6.0
+    RATE_LIMIT_BROADCAST_BURST: int = 2
+    RATE_LIMIT_READ_PER_MINUTE: float = 120.0  # each polled route has its own bucket
+    RATE_LIMIT_READ_BURST: int = 30
+    
+    # Llama token accounting, adaptive max_tokens and daily budgets
+    LLM_DAILY_TOKEN_BUDGET: int = 0  # per user and UTC day; 0 = unlimited, users.daily_token_budget overrides
+    LLM_MAX_TOKENS_MIN: int = 48
+    LLM_MAX_TOKENS_MAX: int = 2048
+    LLM_MAX_TOKENS_HEADROOM: int = 24
+    USAGE_FLUSH_BATCH_SIZE: int = 200
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 5.0
+    USAGE_BUDGET_REFRESH_SECONDS: float = 30.0
+    
+    # Load shedding: 503 with Retry-After instead of queueing (0 disables a check)
+    ADMISSION_MAX_TRANSFORM_BACKLOG: int = 100  # Llama calls in flight per worker
+    ADMISSION_MAX_POOL_WAIT_MS: float = 500.0
+    
+    # Group commit: concurrent sends share one INSERT and transaction
+    GROUP_COMMIT_ENABLED: bool = False
+    GROUP_COMMIT_MAX_BATCH: int = 200
+    GROUP_COMMIT_MAX_DELAY_MS: float = 5.0
+    
+    # Conversation metadata cache (Redis pub/sub invalidates other workers)
+    CONVERSATION_CACHE_SIZE: int = 10000
+    CONVERSATION_CACHE_USE_REDIS: bool = False
+    
+    # Transactional outbox for real-time events
+    OUTBOX_BATCH_SIZE: int = 200
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 1.0
+    OUTBOX_RETENTION_MINUTES: int = 60
+    EVENTS_USE_REDIS: bool = False  # required to reach sockets on other workers
+    
+    # Per-user change log served by /api/chat/sync
+    SYNC_LOG_RETENTION_DAYS: int = 30
+    
+    # Streaming export: rows fetched and encoded per chunk
+    EXPORT_CHUNK_SIZE: int = 1000
+    
+    # Archival of old messages into compressed cold storage
+    ARCHIVE_ENABLED: bool = False
+    ARCHIVE_AFTER_DAYS: int = 90
+    ARCHIVE_CHUNK_SIZE: int = 500
+    ARCHIVE_INTERVAL_SECONDS: float = 3600.0
+    
+    # Batched deletions (retention, account deletion, clear_database.py)
+    RETENTION_BATCH_SIZE: int = 500
+    RETENTION_MAX_ROWS_PER_SECOND: float = 2000.0
+    MESSAGE_RETENTION_DAYS: int = 0  # 0 keeps messages forever
+    RETENTION_INTERVAL_SECONDS: float = 3600.0
+    
+    # Shared outbound HTTP client (Llama API, Google OAuth)
+    HTTP_TIMEOUT_SECONDS: float = 30.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    
+    # Production launcher (serve.py)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 1  # 0 = one per CPU
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE_SECONDS: int = 75  # longer than typical load balancer idle timeouts
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = 30
+    SERVER_REUSE_PORT: bool = False  # each worker binds its own SO_REUSEPORT socket
+    SERVER_LIMIT_CONCURRENCY: int = 0  # 0 = unlimited
+    SERVER_ACCESS_LOG: bool = False
+    
+    # Diagnostics: event loop lag monitor and the admin-only profiler
+    ADMIN_USER_IDS: str = ""  # comma-separated user ids, as returned by /api/auth/me
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_MS: float = 100.0
+    LOOP_MONITOR_THRESHOLD_MS: float = 100.0  # stalls longer than this log the blocking stack
+    PROFILER_INTERVAL_MS: float = 5.0
+    
     # App settings
     APP_NAME: str = "Agent Chat"
     DEBUG: bool = True
@@ -30,4 +143,36 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
 
-settings = Settings() 
\ No newline at end of file
+@lru_cache()
+def get_settings() -> Settings:
+    """Read the environment and .env once, on first use"""
+    return Settings()
+
+class LazySettings:
+    """Module-level stand-in that defers reading Settings until an attribute is used"""
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_settings(), name)
+    
+    def __setattr__(self, name: str, value: Any):
+        setattr(get_settings(), name, value)
+
+settings = LazySettings()
+
+class LazyInstance:
+    """Module-level stand-in for a service built from settings on first attribute use"""
+    
+    def __init__(self, build: Callable[[], Any]):
+        object.__setattr__(self, "_build", build)
+        object.__setattr__(self, "_instance", None)
+    
+    def _get(self) -> Any:
+        if self._instance is None:
+            object.__setattr__(self, "_instance", self._build())
+        return self._instance
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get(), name)
+    
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._get(), name, value)
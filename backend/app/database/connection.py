@@ -1,33 +1,73 @@
+from typing import Callable, Optional
 from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker, Session
 from ..config import settings
 
-# Sync engine for migrations
-if settings.USE_SQLITE:
-    engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(settings.DATABASE_URL)
-
-# Async engine for the application
-if settings.USE_SQLITE:
-    # SQLite with aiosqlite for async
-    async_database_url = settings.DATABASE_URL.replace("sqlite:///", "sqlite+aiosqlite:///")
-    async_engine = create_async_engine(async_database_url, echo=settings.DEBUG)
-else:
-    async_engine = create_async_engine(
-        settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
-        echo=settings.DEBUG
-    )
+# Engines are created on first use, so importing the app never touches the database
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+
+def get_engine() -> Engine:
+    """Sync engine for migrations and scripts"""
+    global _engine
+    if _engine is None:
+        if settings.USE_SQLITE:
+            _engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
+        else:
+            _engine = create_engine(settings.DATABASE_URL)
+    return _engine
+
+def async_engine_for(url: str) -> AsyncEngine:
+    """Async engine for a sync-style URL (sqlite:// or postgresql://)"""
+    if url.startswith("sqlite"):
+        # SQLite with aiosqlite for async
+        return create_async_engine(url.replace("sqlite:///", "sqlite+aiosqlite:///"), echo=settings.DEBUG)
+    return create_async_engine(url.replace("postgresql://", "postgresql+asyncpg://"), echo=settings.DEBUG)
+
+def get_async_engine() -> AsyncEngine:
+    """Async engine for the application"""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = async_engine_for(settings.DATABASE_URL)
+    return _async_engine
+
+async def dispose_engines():
+    """Close pooled connections at shutdown"""
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
+
+class LazySessionFactory:
+    """Session factory that binds to its engine on the first call"""
+    
+    def __init__(self, make_factory: Callable[[], sessionmaker]):
+        self.make_factory = make_factory
+        self.factory: Optional[sessionmaker] = None
+    
+    def __call__(self, **kwargs):
+        if self.factory is None:
+            self.factory = self.make_factory()
+        return self.factory(**kwargs)
 
 # Session factories
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-AsyncSessionLocal = sessionmaker(
-    async_engine,
-    class_=AsyncSession,
-    expire_on_commit=False
+SessionLocal = LazySessionFactory(
+    lambda: sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+)
+AsyncSessionLocal = LazySessionFactory(
+    lambda: sessionmaker(get_async_engine(), class_=AsyncSession, expire_on_commit=False)
 )
 
+def __getattr__(name: str):
+    # `engine` and `async_engine` stay importable for scripts
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # Dependency to get DB session
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -41,4 +81,4 @@ def get_sync_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
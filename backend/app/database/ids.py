@@ -0,0 +1,74 @@
+"""Time-ordered primary keys.
+
+Ids are UUIDv7 (RFC 9562): a 48-bit millisecond timestamp followed by a
+counter and random bits, so new rows land at the right-hand edge of every
+primary key and foreign key index instead of at random pages. They are
+stored as native `uuid` on PostgreSQL and as 16-byte blobs on SQLite, and
+always surface in Python as the usual 36-character strings.
+"""
+import os
+import threading
+import time
+import uuid
+from sqlalchemy import LargeBinary
+from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
+from sqlalchemy.types import TypeDecorator
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+def uuid7() -> uuid.UUID:
+    """UUIDv7, monotonic within this process"""
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            # Random start in the lower half leaves room to count up within the millisecond
+            _last_ms = ms
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+    rand_b = int.from_bytes(os.urandom(8), "big") & 0x3FFFFFFFFFFFFFFF
+    value = (ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | rand_b
+    return uuid.UUID(int=value)
+
+def new_id() -> str:
+    return str(uuid7())
+
+class GUID(TypeDecorator):
+    """UUID column presented as a string: native uuid on PostgreSQL, 16 bytes elsewhere.
+    
+    Malformed ids bind as NULL, so looking one up finds nothing instead of
+    raising, the same as with the old text keys.
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(PostgresUUID(as_uuid=False))
+        return dialect.type_descriptor(LargeBinary(16))
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            try:
+                value = uuid.UUID(str(value))
+            except ValueError:
+                return None
+        if dialect.name == "postgresql":
+            return str(value)
+        return value.bytes
+    
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        return str(uuid.UUID(bytes=bytes(value)))
@@ -1,23 +1,14 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Enum, Integer, Boolean
-from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Enum, Integer, BigInteger, Boolean, LargeBinary, Index, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
-import uuid
+from .ids import GUID, new_id
+from .partitions import ensure_partitions
 import enum
 
 Base = declarative_base()
 
-# Use String type for SQLite, UUID for PostgreSQL
-def get_uuid_type():
-    import os
-    if 'sqlite' in os.environ.get('DATABASE_URL', ''):
-        return String(36)
-    return PostgresUUID(as_uuid=True)
-
-UUID = get_uuid_type()
-
 class AgentTone(enum.Enum):
     SMARTER = "smarter"
     PROFESSIONAL = "professional"
@@ -36,47 +27,246 @@ class MessageStatus(enum.Enum):
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(GUID, primary_key=True, default=new_id)
     username = Column(String(50), unique=True, nullable=False, index=True)
     email = Column(String(100), unique=True, nullable=True, index=True)
     password_hash = Column(String(255), nullable=True)
+    # Llama tokens per UTC day; null falls back to LLM_DAILY_TOKEN_BUDGET
+    daily_token_budget = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     conversations_initiated = relationship("Conversation", foreign_keys="Conversation.user1_id", back_populates="user1")
     conversations_received = relationship("Conversation", foreign_keys="Conversation.user2_id", back_populates="user2")
     sent_messages = relationship("Message", foreign_keys="Message.sender_id", back_populates="sender")
+    
+    __table_args__ = (
+        # Case-insensitive prefix search in the user directory
+        Index("ix_users_username_lower", func.lower(username)),
+    )
 
 class Conversation(Base):
     __tablename__ = "conversations"
     
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user1_id = Column(String(36), ForeignKey("users.id"))
-    user2_id = Column(String(36), ForeignKey("users.id"))
+    id = Column(GUID, primary_key=True, default=new_id)
+    user1_id = Column(GUID, ForeignKey("users.id"))
+    user2_id = Column(GUID, ForeignKey("users.id"))
     user1_agent_tone = Column(Enum(AgentTone), default=AgentTone.NICER)
     user2_agent_tone = Column(Enum(AgentTone), default=AgentTone.NICER)
     user1_custom_prompt = Column(Text, nullable=True)
     user2_custom_prompt = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_message_at = Column(DateTime, default=datetime.utcnow)
+    # Bumped on every change visible to either participant (new messages,
+    # read receipts, tone changes); used to build ETags for polled endpoints
+    version = Column(Integer, default=0, server_default="0", nullable=False)
+    # Index into DATABASE_SHARD_URLS of the database holding the messages
+    shard = Column(Integer, default=0, server_default="0", nullable=False)
     
     # Relationships
     user1 = relationship("User", foreign_keys=[user1_id], back_populates="conversations_initiated")
     user2 = relationship("User", foreign_keys=[user2_id], back_populates="conversations_received")
     messages = relationship("Message", back_populates="conversation", order_by="Message.timestamp")
+    
+    __table_args__ = (
+        # A user's conversations by recency, from either side
+        Index("ix_conversations_user1_last_message", user1_id, last_message_at),
+        Index("ix_conversations_user2_last_message", user2_id, last_message_at),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
     
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    conversation_id = Column(String(36), ForeignKey("conversations.id"))
-    sender_id = Column(String(36), ForeignKey("users.id"))
+    id = Column(GUID, primary_key=True, default=new_id)
+    conversation_id = Column(GUID, ForeignKey("conversations.id"))
+    sender_id = Column(GUID, ForeignKey("users.id"))
     original_content = Column(Text, nullable=False)
     transformed_content = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    # Part of the key because PostgreSQL partitions the table by month on it
+    timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow)
     status = Column(Enum(MessageStatus), default=MessageStatus.SENT)
     is_read = Column(Boolean, default=False)
     
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
-    sender = relationship("User", back_populates="sent_messages") 
\ No newline at end of file
+    sender = relationship("User", back_populates="sent_messages")
+    
+    __table_args__ = (
+        # History pages for one conversation, newest first
+        Index("ix_messages_conversation_timestamp", conversation_id, timestamp),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+class MessageArchive(Base):
+    """Cold storage: a compressed NDJSON chunk of one conversation's old messages"""
+    __tablename__ = "message_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_id = Column(GUID, ForeignKey("conversations.id"), nullable=False)
+    first_timestamp = Column(DateTime, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    codec = Column(String(10), nullable=False)  # "zstd" or "zlib"
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Paging back through a conversation's archive
+        Index("ix_message_archive_conversation_last", conversation_id, last_timestamp),
+    )
+
+class OutboxEvent(Base):
+    """Real-time event written in the same transaction as the change it announces"""
+    __tablename__ = "outbox_events"
+    
+    # Also the event id clients use to drop duplicate deliveries
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_type = Column(String(50), nullable=False)
+    conversation_id = Column(GUID, nullable=True)
+    recipients = Column(Text, nullable=False)  # JSON list of user ids
+    payload = Column(Text, nullable=False)  # JSON object
+    created_at = Column(DateTime, default=datetime.utcnow)
+    dispatched_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # The dispatcher scans undispatched events in id order
+        Index("ix_outbox_events_pending", dispatched_at, id),
+    )
+
+class SyncLogEntry(Base):
+    """One change a user has to catch up on, in global `seq` order.
+    
+    Rows are written by the outbox dispatcher, one per recipient, so seqs
+    only ever become visible in increasing order.
+    """
+    __tablename__ = "sync_log"
+    
+    seq = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(GUID, nullable=False)
+    event_id = Column(Integer, nullable=False)
+    event_type = Column(String(50), nullable=False)
+    conversation_id = Column(GUID, nullable=True)
+    payload = Column(Text, nullable=False)  # JSON object, as delivered in real time
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_sync_log_user_seq", user_id, seq),
+    )
+
+class LlmUsage(Base):
+    """Tokens used by one Llama API call, written in batches by the usage tracker"""
+    __tablename__ = "llm_usage"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(GUID, nullable=False)
+    # Null when one transformation fed a broadcast to several conversations
+    message_id = Column(GUID, nullable=True)
+    message_count = Column(Integer, nullable=False, default=1)
+    tone = Column(String(20), nullable=False)
+    prompt_tokens = Column(Integer, nullable=False)
+    completion_tokens = Column(Integer, nullable=False)
+    max_tokens = Column(Integer, nullable=False)
+    truncated = Column(Boolean, nullable=False, default=False)  # stopped at max_tokens
+    estimated = Column(Boolean, nullable=False, default=False)  # the API reported no counts
+    latency_ms = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # A user's usage today, for budgets and reports
+        Index("ix_llm_usage_user_created", user_id, created_at),
+    )
+
+class RetentionJob(Base):
+    """Progress of a batched deletion job, so an interrupted run can resume"""
+    __tablename__ = "retention_jobs"
+    
+    name = Column(String(100), primary_key=True)
+    kind = Column(String(50), nullable=False)
+    params = Column(Text, nullable=False)  # JSON object
+    progress = Column(Text, nullable=False)  # JSON: per phase cursor, count and done flag
+    status = Column(String(20), nullable=False, default="running")
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class Counter(Base):
+    """A named counter bumped in the transaction of the change it marks"""
+    __tablename__ = "counters"
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+# Bumped whenever users are deleted; part of the /users ETag
+USERS_GENERATION = "users_generation"
+event.listen(
+    Counter.__table__,
+    "after_create",
+    DDL(f"INSERT INTO counters (name, value) VALUES ('{USERS_GENERATION}', 0)")
+)
+
+# Trigram index for prefix and fuzzy username search on PostgreSQL
+event.listen(
+    User.__table__,
+    "after_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+event.listen(
+    User.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_users_username_trgm "
+        "ON users USING gin (lower(username) gin_trgm_ops)"
+    ).execute_if(dialect="postgresql")
+)
+
+# Full-text search over message content. SQLite keeps an FTS5 table whose rowids
+# come from message_search_docs (an INTEGER PRIMARY KEY, so they survive VACUUM),
+# maintained by triggers; PostgreSQL uses an expression GIN index.
+MESSAGE_SEARCH_SQLITE_DDL = [
+    "CREATE TABLE IF NOT EXISTS message_search_docs ("
+    "doc_id INTEGER PRIMARY KEY, message_id BLOB NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "original_content, transformed_content, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO message_search_docs (message_id) VALUES (new.id); "
+    "INSERT INTO messages_fts (rowid, original_content, transformed_content) "
+    "VALUES (last_insert_rowid(), new.original_content, new.transformed_content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "DELETE FROM messages_fts WHERE rowid = "
+    "(SELECT doc_id FROM message_search_docs WHERE message_id = old.id); "
+    "DELETE FROM message_search_docs WHERE message_id = old.id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_update "
+    "AFTER UPDATE OF original_content, transformed_content ON messages BEGIN "
+    "UPDATE messages_fts SET original_content = new.original_content, "
+    "transformed_content = new.transformed_content "
+    "WHERE rowid = (SELECT doc_id FROM message_search_docs WHERE message_id = new.id); "
+    "END",
+]
+
+MESSAGE_SEARCH_VECTOR = (
+    "to_tsvector('simple', coalesce(original_content, '') || ' ' || coalesce(transformed_content, ''))"
+)
+
+MESSAGE_SEARCH_POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_messages_search ON messages USING gin ({MESSAGE_SEARCH_VECTOR})",
+]
+
+for statement in MESSAGE_SEARCH_SQLITE_DDL:
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for table in ("messages_fts", "message_search_docs"):
+    event.listen(
+        Message.__table__,
+        "after_drop",
+        DDL(f"DROP TABLE IF EXISTS {table}").execute_if(dialect="sqlite")
+    )
+for statement in MESSAGE_SEARCH_POSTGRES_DDL:
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+# Monthly partitions for the current month and the next few
+MESSAGE_PARTITIONS_AHEAD = 2
+
+@event.listens_for(Message.__table__, "after_create")
+def create_message_partitions(target, connection, **kw):
+    if connection.dialect.name == "postgresql":
+        ensure_partitions(connection, datetime.utcnow(), MESSAGE_PARTITIONS_AHEAD)
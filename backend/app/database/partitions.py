@@ -0,0 +1,72 @@
+"""Monthly range partitions of `messages` on PostgreSQL.
+
+The parent table is declared `PARTITION BY RANGE (timestamp)`. Rows go to
+one child table per month (messages_y2024m05); a default partition catches
+anything outside the months created so far. Helpers here take a sync
+Connection so they can run from DDL events, migrations and, through
+run_sync, the async archive job.
+"""
+import re
+from datetime import datetime
+from typing import List, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+PARENT = "messages"
+DEFAULT_PARTITION = "messages_default"
+PARTITION_NAME = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+def add_months(moment: datetime, months: int) -> datetime:
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: datetime) -> str:
+    return f"messages_y{month.year:04d}m{month.month:02d}"
+
+def create_partition(connection: Connection, month: datetime):
+    month = month_start(month)
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    ))
+
+def ensure_partitions(connection: Connection, start: datetime, months_ahead: int):
+    """Create the default partition and monthly ones from `start` through `months_ahead` from now.
+    
+    Months are created ahead of time: a month cannot be split out of the
+    default partition once rows for it landed there.
+    """
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+    month = month_start(start)
+    last = add_months(month_start(datetime.utcnow()), months_ahead)
+    while month <= last:
+        create_partition(connection, month)
+        month = add_months(month, 1)
+
+def list_partitions(connection: Connection) -> List[Tuple[str, datetime]]:
+    rows = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :parent"
+    ), {"parent": PARENT}).scalars().all()
+    partitions = []
+    for name in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def drop_empty_partitions_before(connection: Connection, cutoff: datetime) -> List[str]:
+    """Drop monthly partitions that ended before `cutoff` and were fully archived"""
+    dropped = []
+    for name, month in list_partitions(connection):
+        if add_months(month, 1) > cutoff:
+            break
+        if connection.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {name})")).scalar():
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from typing import List, Optional
+from fastapi import Depends
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
+from sqlalchemy.orm import sessionmaker
+from ..config import settings, LazyInstance
+from .connection import get_db
+
+# Seconds the replica is behind the primary; 0 when it has replayed all it received
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        # Created by open() at startup, not on import
+        self.engine: Optional[AsyncEngine] = None
+        self.session_factory: Optional[sessionmaker] = None
+        self.healthy = False
+        self.lag = 0.0
+        self.checked_at = 0.0
+    
+    def open(self):
+        if self.engine is None:
+            self.engine = create_async_engine(
+                self.url.replace("postgresql://", "postgresql+asyncpg://"),
+                echo=settings.DEBUG
+            )
+            self.session_factory = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+    
+    async def check(self):
+        self.open()
+        lag_sql = POSTGRES_LAG_SQL if self.engine.dialect.name == "postgresql" else "SELECT 0"
+        try:
+            async with self.engine.connect() as connection:
+                self.lag = float((await connection.execute(text(lag_sql))).scalar() or 0)
+            self.healthy = True
+        except Exception as e:
+            if self.healthy:
+                print(f"Replica {self.engine.url.host} is down: {e}")
+            self.healthy = False
+        self.checked_at = time.monotonic()
+    
+    def mark_down(self, error: Exception):
+        print(f"Replica {self.engine.url.host} failed, reading from primary: {error}")
+        self.healthy = False
+
+class ReplicaRouter:
+    """Picks a read replica for read-only requests.
+    
+    Replicas are health-checked in the background. One is used only if its
+    last check succeeded recently and its replication lag is within
+    `max_lag`; otherwise reads fall back to the primary.
+    """
+    
+    def __init__(self, urls: List[str], max_lag: float, check_interval: float):
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.next_index = 0
+        self.check_task: Optional[asyncio.Task] = None
+    
+    def choose(self) -> Optional[Replica]:
+        # Health older than a few intervals means the checker is stuck
+        fresh_after = time.monotonic() - self.check_interval * 3
+        usable = [
+            replica for replica in self.replicas
+            if replica.healthy and replica.lag <= self.max_lag and replica.checked_at >= fresh_after
+        ]
+        if not usable:
+            return None
+        self.next_index = (self.next_index + 1) % len(usable)
+        return usable[self.next_index]
+    
+    async def check_all(self):
+        await asyncio.gather(*(replica.check() for replica in self.replicas))
+    
+    async def run_checks(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check_all()
+    
+    async def start(self):
+        if self.replicas and self.check_task is None:
+            await self.check_all()
+            self.check_task = asyncio.create_task(self.run_checks())
+    
+    async def stop(self):
+        if self.check_task:
+            self.check_task.cancel()
+            self.check_task = None
+        for replica in self.replicas:
+            if replica.engine is not None:
+                await replica.engine.dispose()
+
+def replica_urls() -> List[str]:
+    # SQLite has nothing to replicate from; keep a single database
+    if settings.USE_SQLITE:
+        return []
+    return [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+
+# Global replica router instance
+replicas = LazyInstance(lambda: ReplicaRouter(
+    replica_urls(),
+    max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.REPLICA_HEALTH_CHECK_SECONDS
+))
+
+# Dependency to get a session for read-only work: a replica when one is
+# usable, otherwise the request's primary session itself
+async def get_read_db(db: AsyncSession = Depends(get_db)):
+    replica = replicas.choose()
+    if replica is None:
+        yield db
+        return
+    
+    session = replica.session_factory()
+    try:
+        await session.connection()
+    except Exception as e:
+        await session.close()
+        replica.mark_down(e)
+        yield db
+        return
+    try:
+        yield session
+    finally:
+        await session.close()
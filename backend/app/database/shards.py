@@ -0,0 +1,97 @@
+"""Hash sharding of messages by conversation.
+
+Users, conversations and everything else live in the main database
+(DATABASE_URL). Each conversation's messages and archive chunks live on
+one of the DATABASE_SHARD_URLS, recorded in `conversations.shard`, which
+is the directory every lookup goes through. New conversations are placed
+by rendezvous hashing of their id, so appending a shard only pulls over
+the conversations it now wins. Existing ones keep their recorded shard
+until rebalance_shards.py moves them.
+
+Writes touching both a shard and the main database are two transactions:
+the shard commits first, so an event or conversation bump never announces
+a message that is not stored yet.
+"""
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine
+from sqlalchemy.orm import sessionmaker
+from ..config import settings, LazyInstance
+from .connection import AsyncSessionLocal, async_engine_for
+
+T = TypeVar("T")
+
+class Shard:
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self.url = url
+        # The main database serves as a shard through the app's own engine
+        self.local = url == settings.DATABASE_URL
+        self.engine: Optional[AsyncEngine] = None
+        self.session_factory: Optional[sessionmaker] = None
+    
+    def session(self) -> AsyncSession:
+        if self.local:
+            return AsyncSessionLocal()
+        if self.engine is None:
+            self.engine = async_engine_for(self.url)
+            self.session_factory = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        return self.session_factory()
+
+class ShardRouter:
+    """Finds the database holding a conversation's messages"""
+    
+    def __init__(self, urls: List[str]):
+        self.shards = [Shard(index, url) for index, url in enumerate(urls or [settings.DATABASE_URL])]
+    
+    @property
+    def sharded(self) -> bool:
+        """Whether any messages live outside the main database"""
+        return any(not shard.local for shard in self.shards)
+    
+    def place(self, conversation_id: str) -> int:
+        """Shard for a new conversation: the highest hash of (shard, id) wins"""
+        def weight(shard: Shard) -> bytes:
+            return hashlib.blake2b(f"{shard.index}:{conversation_id}".encode(), digest_size=8).digest()
+        return max(self.shards, key=weight).index
+    
+    def get(self, index: int) -> Shard:
+        if not 0 <= index < len(self.shards):
+            raise LookupError(f"Shard {index} is not configured in DATABASE_SHARD_URLS")
+        return self.shards[index]
+    
+    @asynccontextmanager
+    async def session(self, index: int, db: AsyncSession):
+        """Session on a shard; `db` itself when the shard is the main database.
+        
+        Callers commit a separate shard session themselves (`shard_db is not db`).
+        """
+        shard = self.get(index)
+        if shard.local:
+            yield db
+            return
+        async with shard.session() as shard_db:
+            yield shard_db
+    
+    async def gather(self, db: AsyncSession, groups: Dict[int, T],
+                     work: Callable[[AsyncSession, T], Awaitable[Any]]) -> Dict[int, Any]:
+        """Run `work(shard_db, group)` for every shard in `groups` concurrently"""
+        async def run(index: int, group: T):
+            async with self.session(index, db) as shard_db:
+                return await work(shard_db, group)
+        results = await asyncio.gather(*(run(index, group) for index, group in groups.items()))
+        return dict(zip(groups, results))
+    
+    async def dispose(self):
+        for shard in self.shards:
+            if shard.engine is not None:
+                await shard.engine.dispose()
+                shard.engine = None
+
+def shard_urls() -> List[str]:
+    return [url.strip() for url in settings.DATABASE_SHARD_URLS.split(",") if url.strip()]
+
+# Global shard router instance
+shards = LazyInstance(lambda: ShardRouter(shard_urls()))
@@ -1,17 +1,80 @@
+from contextlib import asynccontextmanager
+from datetime import timedelta
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .api import auth, chat
-from .database.models import Base
-from .database.connection import engine
+from .api import admin, auth, chat, websocket
+from .database.connection import dispose_engines
+from .database.replicas import replicas
+from .database.shards import shards
 from .config import settings
+from .compression import CompressionMiddleware
+from .profiling import RequestProfilerMiddleware
+from .websocket.manager import manager
+from .websocket.presence import presence
+from .services.outbox import dispatcher
+from .services.conversation_cache import conversation_cache
+from .services.archive_service import archiver
+from .services.retention_service import retention
+from .services.message_writer import message_writer
+from .services.http_client import close_http_client
+from .services.drain import drain_coordinator
+from .services.rate_limiter import rate_limiter
+from .services.diagnostics import loop_monitor
+from .services.usage_service import usage_tracker
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background services on boot and stop them in reverse on shutdown.
+    
+    Nothing here creates tables: the schema is managed by Alembic
+    (`alembic upgrade head`). Engines and HTTP clients are created on first use.
+    """
+    print("Agent Chat Backend Started")
+    if settings.LLAMA_API_KEY:
+        print("Llama API configured")
+    else:
+        print("Warning: LLAMA_API_KEY not set")
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    await replicas.start()
+    manager.start()
+    await presence.start()
+    await dispatcher.start()
+    await rate_limiter.start()
+    usage_tracker.start()
+    if settings.GROUP_COMMIT_ENABLED:
+        message_writer.start()
+    await conversation_cache.start()
+    if settings.ARCHIVE_ENABLED:
+        archiver.start()
+    if settings.MESSAGE_RETENTION_DAYS > 0:
+        retention.start(timedelta(days=settings.MESSAGE_RETENTION_DAYS), settings.RETENTION_INTERVAL_SECONDS)
+    
+    yield
+    
+    print("Agent Chat Backend Shutting Down")
+    await retention.stop()
+    await archiver.stop()
+    await conversation_cache.stop()
+    # Commit queued messages before the final outbox drain
+    await message_writer.stop()
+    await usage_tracker.stop()
+    await rate_limiter.stop()
+    await dispatcher.stop()
+    await presence.stop()
+    await manager.stop()
+    await replicas.stop()
+    await shards.dispose()
+    await close_http_client()
+    await dispose_engines()
+    await loop_monitor.stop()
 
 app = FastAPI(
     title="Agent Chat API",
     description="Backend API for Agent-to-Agent Communication Chat App",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -23,9 +86,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger JSON responses for clients that accept it (sizes and levels from settings)
+app.add_middleware(CompressionMiddleware)
+
+# Admins can profile any request with an X-Profile header
+app.add_middleware(RequestProfilerMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(chat.router)
+app.include_router(websocket.router)
+app.include_router(admin.router)
 
 @app.get("/")
 async def root():
@@ -33,16 +104,7 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    if drain_coordinator.draining:
+        # Tell the load balancer to stop routing here while we finish up
+        return JSONResponse({"status": "draining"}, status_code=503)
     return {"status": "healthy"}
-
-@app.on_event("startup")
-async def startup_event():
-    print("Agent Chat Backend Started")
-    if settings.LLAMA_API_KEY:
-        print("Llama API configured")
-    else:
-        print("Warning: LLAMA_API_KEY not set")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    print("Agent Chat Backend Shutting Down") 
\ No newline at end of file
@@ -0,0 +1,72 @@
+"""Profile a single request on demand, for admins"""
+import asyncio
+import sys
+import threading
+from typing import Dict, Optional
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from .api.admin import is_admin
+from .config import settings
+from .database.connection import AsyncSessionLocal
+from .services.auth_service import AuthService
+from .services.diagnostics import PROFILE_FORMATS, StackSampler
+
+auth_service = AuthService()
+
+class RequestProfilerMiddleware:
+    """Profile a request sent with `X-Profile: collapsed` or `X-Profile: speedscope`.
+    
+    Only admins can use it. The request runs as usual, but its response is
+    replaced by the profile, and the original status is sent in
+    X-Profiled-Status. Samples cover just this request. Time it spends
+    suspended (waiting on the database or the Llama API) is attributed to
+    the await it is parked on.
+    """
+    
+    def __init__(self, app: ASGIApp, interval: Optional[float] = None):
+        self.app = app
+        self.interval = settings.PROFILER_INTERVAL_MS / 1000.0 if interval is None else interval
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        format = headers.get("x-profile")
+        if format not in PROFILE_FORMATS or not await self._is_admin(headers):
+            await self.app(scope, receive, send)
+            return
+        
+        profiled: Dict[str, int] = {}
+        
+        async def discard(message: Message):
+            if message["type"] == "http.response.start":
+                profiled["status"] = message["status"]
+        
+        sampler = StackSampler(
+            threading.get_ident(), self.interval, task=asyncio.current_task(), marker=sys._getframe()
+        )
+        sampler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            sampler.stop()
+        
+        body, media_type = sampler.render(format, f"{scope['method']} {scope['path']}")
+        response = Response(
+            body,
+            media_type=media_type,
+            headers={"X-Profiled-Status": str(profiled.get("status", 500))}
+        )
+        await response(scope, receive, send)
+    
+    async def _is_admin(self, headers: Headers) -> bool:
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+        async with AsyncSessionLocal() as db:
+            try:
+                return is_admin(await auth_service.get_current_user(token, db))
+            except Exception:
+                return False
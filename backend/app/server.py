@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, List, Optional
+import uvicorn
+from .config import settings
+
+def event_loop() -> str:
+    try:
+        import uvloop  # noqa: F401
+        return "uvloop"
+    except ImportError:
+        return "asyncio"
+
+def http_protocol() -> str:
+    try:
+        import httptools  # noqa: F401
+        return "httptools"
+    except ImportError:
+        return "h11"
+
+def server_options(**overrides) -> Dict[str, Any]:
+    """uvicorn.Config keyword arguments for production, from settings"""
+    options = {
+        "app": "app.main:app",
+        "host": settings.SERVER_HOST,
+        "port": settings.SERVER_PORT,
+        "loop": event_loop(),
+        "http": http_protocol(),
+        "ws": "websockets",
+        "lifespan": "on",
+        "backlog": settings.SERVER_BACKLOG,
+        "timeout_keep_alive": settings.SERVER_KEEPALIVE_SECONDS,
+        "timeout_graceful_shutdown": settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        "limit_concurrency": settings.SERVER_LIMIT_CONCURRENCY or None,
+        "access_log": settings.SERVER_ACCESS_LOG,
+        "proxy_headers": True,
+        "server_header": False
+    }
+    options.update(overrides)
+    return options
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that drains the app before uvicorn's own shutdown.
+    
+    uvicorn closes WebSockets as soon as shutdown starts. Stopping the
+    listeners first and then running the drain coordinator lets in-flight
+    sends finish and reach connected clients before their sockets close.
+    """
+    
+    async def shutdown(self, sockets: Optional[List[socket.socket]] = None):
+        from .services.drain import drain_coordinator
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        await drain_coordinator.drain(self.config.timeout_graceful_shutdown or 0)
+        await super().shutdown(sockets=sockets)
+
+def reuse_port_socket(host: str, port: int, backlog: int) -> socket.socket:
+    """A listening socket the kernel load-balances across workers bound to the same port"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(options: Dict[str, Any], sockets: List[socket.socket], reuse_port: bool):
+    config = uvicorn.Config(**options)
+    if reuse_port:
+        sockets = [reuse_port_socket(config.host, config.port, config.backlog)]
+    DrainingServer(config).run(sockets=sockets or None)
+
+class Supervisor:
+    """Runs and restarts worker processes, and stops them gracefully.
+    
+    Workers either share one listening socket bound here, or with
+    `reuse_port` each bind their own SO_REUSEPORT socket so the kernel
+    spreads new connections evenly. SIGTERM/SIGINT are forwarded as SIGTERM;
+    workers get the graceful timeout (twice: drain, then uvicorn's wait)
+    before they are killed.
+    """
+    
+    def __init__(self, options: Dict[str, Any], workers: int, reuse_port: bool):
+        self.options = options
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: List[multiprocessing.Process] = []
+        self.sockets: List[socket.socket] = []
+        self.should_exit = False
+    
+    def spawn(self) -> multiprocessing.Process:
+        process = self.context.Process(
+            target=run_worker, args=(self.options, self.sockets, self.reuse_port), daemon=False
+        )
+        process.start()
+        return process
+    
+    def handle_exit(self, sig, frame):
+        self.should_exit = True
+    
+    def run(self):
+        if not self.reuse_port:
+            self.sockets = [uvicorn.Config(**self.options).bind_socket()]
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self.handle_exit)
+        
+        print(f"Starting {self.workers} workers on {self.options['host']}:{self.options['port']}"
+              f" ({self.options['loop']}, {self.options['http']}, reuse_port={self.reuse_port})")
+        self.processes = [self.spawn() for _ in range(self.workers)]
+        while not self.should_exit:
+            time.sleep(0.5)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive() and not self.should_exit:
+                    print(f"Worker {process.pid} exited with {process.exitcode}; restarting")
+                    self.processes[index] = self.spawn()
+        
+        print("Stopping workers")
+        for process in self.processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + (self.options["timeout_graceful_shutdown"] or 0) * 2 + 5
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                print(f"Worker {process.pid} did not stop in time; killing it")
+                process.kill()
+                process.join()
+        for sock in self.sockets:
+            sock.close()
+
+def serve(workers: Optional[int] = None, reuse_port: Optional[bool] = None, **overrides):
+    options = server_options(**overrides)
+    workers = workers if workers is not None else settings.SERVER_WORKERS
+    workers = workers or os.cpu_count() or 1
+    reuse_port = settings.SERVER_REUSE_PORT if reuse_port is None else reuse_port
+    if workers > 1 and not settings.EVENTS_USE_REDIS:
+        print("Warning: with several workers, real-time events only reach sockets on other "
+              "workers when EVENTS_USE_REDIS is set")
+    if workers > 1 and not settings.CONVERSATION_CACHE_USE_REDIS:
+        print("Warning: with several workers, tone and prompt changes only reach other "
+              "workers' conversation caches when CONVERSATION_CACHE_USE_REDIS is set")
+    if workers == 1 and not reuse_port:
+        DrainingServer(uvicorn.Config(**options)).run()
+    else:
+        Supervisor(options, workers, reuse_port).run()
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, delete, insert, func, text, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings, LazyInstance
+from ..database.shards import shards
+from ..database.models import Message, MessageArchive, MESSAGE_PARTITIONS_AHEAD
+from ..database.partitions import ensure_partitions, drop_empty_partitions_before
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Arbitrary key for the PostgreSQL advisory lock that serializes archive runs
+ARCHIVE_LOCK_KEY = 7_300_002
+
+def encode_chunk(messages: List[Dict[str, Any]]) -> Tuple[str, bytes]:
+    """Compress messages as NDJSON, with zstd when available"""
+    data = "\n".join(json.dumps(message) for message in messages).encode()
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+def decode_chunk(codec: str, payload: bytes) -> List[Dict[str, Any]]:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this archive chunk")
+        data = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        data = zlib.decompress(payload)
+    messages = [json.loads(line) for line in data.decode().split("\n")]
+    for message in messages:
+        message["timestamp"] = datetime.fromisoformat(message["timestamp"])
+    return messages
+
+class ArchiveService:
+    """Moves old messages out of the hot table into compressed per-conversation chunks.
+    
+    Each chunk holds up to `chunk_size` consecutive messages of one
+    conversation. Moving a chunk (insert into message_archive, delete from
+    messages) is one transaction, so a message is always in exactly one
+    place. On PostgreSQL the job also keeps monthly partitions created ahead
+    of time and drops the ones that archiving emptied.
+    """
+    
+    def __init__(self, archive_after: timedelta, chunk_size: int, interval: float):
+        self.archive_after = archive_after
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+    
+    async def archive_chunk(self, conversation_id: str, cutoff: datetime, db: AsyncSession) -> int:
+        """Archive the oldest messages of a conversation older than `cutoff`; returns how many"""
+        if not await self._lock(db):
+            return 0
+        result = await db.execute(
+            select(
+                Message.id, Message.sender_id, Message.original_content, Message.transformed_content,
+                Message.timestamp, Message.status, Message.is_read
+            )
+            .where(and_(Message.conversation_id == conversation_id, Message.timestamp < cutoff))
+            .order_by(Message.timestamp, Message.id)
+            .limit(self.chunk_size)
+        )
+        rows = result.all()
+        if not rows:
+            return 0
+        
+        messages = [
+            {
+                "id": row.id,
+                "sender_id": row.sender_id,
+                "original_content": row.original_content,
+                "transformed_content": row.transformed_content,
+                "timestamp": row.timestamp.isoformat(),
+                "status": row.status.value if row.status else None,
+                "is_read": row.is_read
+            }
+            for row in rows
+        ]
+        codec, payload = encode_chunk(messages)
+        await db.execute(insert(MessageArchive).values(
+            conversation_id=conversation_id,
+            first_timestamp=rows[0].timestamp,
+            last_timestamp=rows[-1].timestamp,
+            message_count=len(rows),
+            codec=codec,
+            payload=payload,
+            created_at=datetime.utcnow()
+        ))
+        deleted = await db.execute(
+            delete(Message).where(and_(
+                Message.id.in_([row.id for row in rows]),
+                Message.timestamp < cutoff
+            ))
+        )
+        if deleted.rowcount != len(rows):
+            # Someone else moved or deleted some of them; retry on the next run
+            await db.rollback()
+            return 0
+        await db.commit()
+        return len(rows)
+    
+    async def _lock(self, db: AsyncSession) -> bool:
+        """Serialize archive transactions across workers (PostgreSQL only)"""
+        if db.bind.dialect.name != "postgresql":
+            return True
+        locked = await db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ARCHIVE_LOCK_KEY})
+        if locked.scalar():
+            return True
+        await db.rollback()
+        return False
+    
+    async def maintain_partitions(self, cutoff: datetime, db: AsyncSession):
+        if db.bind.dialect.name != "postgresql" or not await self._lock(db):
+            return
+        connection = await db.connection()
+        await connection.run_sync(lambda sync: ensure_partitions(sync, datetime.utcnow(), MESSAGE_PARTITIONS_AHEAD))
+        dropped = await connection.run_sync(lambda sync: drop_empty_partitions_before(sync, cutoff))
+        await db.commit()
+        if dropped:
+            print(f"Dropped archived message partitions: {', '.join(dropped)}")
+    
+    async def archive_once(self, db: AsyncSession) -> int:
+        """Archive everything past the cutoff; returns the number of messages moved"""
+        cutoff = datetime.utcnow() - self.archive_after
+        moved = 0
+        while True:
+            result = await db.execute(
+                select(Message.conversation_id)
+                .where(Message.timestamp < cutoff)
+                .group_by(Message.conversation_id)
+                .limit(100)
+            )
+            conversation_ids = result.scalars().all()
+            await db.rollback()
+            progress = 0
+            for conversation_id in conversation_ids:
+                while True:
+                    count = await self.archive_chunk(conversation_id, cutoff, db)
+                    progress += count
+                    if count < self.chunk_size:
+                        break
+            moved += progress
+            if not progress:
+                break
+        
+        await self.maintain_partitions(cutoff, db)
+        return moved
+    
+    async def read_archived(self, conversation_id: str, db: AsyncSession,
+                            since: Optional[datetime] = None, before: Optional[datetime] = None,
+                            limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Archived messages in a time window, oldest first; with `limit`, the newest that many"""
+        query = select(MessageArchive.codec, MessageArchive.payload).where(
+            MessageArchive.conversation_id == conversation_id
+        )
+        if since is not None:
+            query = query.where(MessageArchive.last_timestamp > since)
+        if before is not None:
+            query = query.where(MessageArchive.first_timestamp < before)
+        result = await db.execute(query.order_by(MessageArchive.last_timestamp.desc()))
+        
+        messages: List[Dict[str, Any]] = []
+        for codec, payload in result:
+            chunk = [
+                message for message in decode_chunk(codec, payload)
+                if (since is None or message["timestamp"] > since)
+                and (before is None or message["timestamp"] < before)
+            ]
+            messages = chunk + messages
+            if limit is not None and len(messages) >= limit:
+                return messages[-limit:]
+        return messages
+    
+    async def last_archived(self, conversation_ids: List[str], db: AsyncSession) -> Dict[str, Dict[str, Any]]:
+        """Newest archived message per conversation"""
+        if not conversation_ids:
+            return {}
+        latest = (
+            select(MessageArchive.conversation_id, func.max(MessageArchive.last_timestamp).label("last_timestamp"))
+            .where(MessageArchive.conversation_id.in_(conversation_ids))
+            .group_by(MessageArchive.conversation_id)
+            .subquery()
+        )
+        result = await db.execute(
+            select(MessageArchive.conversation_id, MessageArchive.codec, MessageArchive.payload)
+            .join(latest, and_(
+                MessageArchive.conversation_id == latest.c.conversation_id,
+                MessageArchive.last_timestamp == latest.c.last_timestamp
+            ))
+        )
+        return {conversation_id: decode_chunk(codec, payload)[-1] for conversation_id, codec, payload in result}
+    
+    async def run(self):
+        while True:
+            try:
+                moved = 0
+                # Each shard archives its own conversations into its own message_archive
+                for shard in shards.shards:
+                    async with shard.session() as db:
+                        moved += await self.archive_once(db)
+                if moved:
+                    print(f"Archived {moved} messages")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Message archive error: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+# Global archive service instance
+archiver = LazyInstance(lambda: ArchiveService(
+    archive_after=timedelta(days=settings.ARCHIVE_AFTER_DAYS),
+    chunk_size=settings.ARCHIVE_CHUNK_SIZE,
+    interval=settings.ARCHIVE_INTERVAL_SECONDS
+))
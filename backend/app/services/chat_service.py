@@ -1,13 +1,30 @@
-import httpx
-from typing import Dict, Any, Optional, List
+import asyncio
+import math
+import time
+from typing import Dict, Any, Optional, List, Tuple, Union
 from ..config import settings
 from ..database.models import User, Conversation, Message, AgentTone, MessageStatus
+from ..database.ids import new_id
+from ..database.shards import shards
+from ..websocket.presence import presence
+from .outbox import add_event, add_events, outbox_row, dispatcher
+from .conversation_cache import conversation_cache, ConversationMeta
+from .archive_service import archiver
+from .message_writer import message_writer
+from .http_client import get_http_client
+from .drain import drain_coordinator
+from .rate_limiter import admission
+from .usage_service import usage_tracker, usage_from_response, estimate_tokens, TokenUsage, TokenBudgetExceeded
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, and_, update
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, or_, and_, update, insert, func, case, null
 from datetime import datetime
 
+TRANSFORM_SYSTEM_PROMPT = "You are a message transformer. Transform the given message according to the instruction. Output ONLY the transformed message without any introduction, explanation, or quotation marks. Do not say 'Here is' or similar phrases. Just output the transformed message directly."
+
 class ChatService:
+    NOT_FOUND_REASON = "Conversation not found or not authorized"
+    BUDGET_REASON = "Daily token budget exceeded"
+    
     def __init__(self):
         self.tone_prompts = {
             AgentTone.SMARTER: "Transform to sophisticated vocabulary and intelligent phrasing (output only the message): ",
@@ -18,6 +35,18 @@ class ChatService:
             AgentTone.LOVING: "Transform to express warmth and affection (output only the message): ",
             AgentTone.ANGRY: "Transform to express frustration and anger civilly (output only the message): ",
         }
+        # Expected output length relative to the input, for sizing max_tokens;
+        # custom prompts can ask for anything, so they get the most room
+        self.output_ratios = {
+            AgentTone.SMARTER: 1.6,
+            AgentTone.PROFESSIONAL: 1.5,
+            AgentTone.NICER: 1.5,
+            AgentTone.MEANER: 1.3,
+            AgentTone.SARCASM: 1.6,
+            AgentTone.LOVING: 1.6,
+            AgentTone.ANGRY: 1.4,
+            AgentTone.CUSTOM: 2.5,
+        }
     
     async def get_or_create_conversation(self, user1_id: str, user2_id: str, db: AsyncSession) -> Conversation:
         """Get existing conversation or create new one between two users"""
@@ -34,14 +63,22 @@ class ChatService:
         
         if not conversation:
             # Create new conversation
+            conversation_id = new_id()
             conversation = Conversation(
+                id=conversation_id,
                 user1_id=user1_id,
-                user2_id=user2_id
+                user2_id=user2_id,
+                shard=shards.place(conversation_id)
             )
             db.add(conversation)
+            add_event(db, "new_conversation", conversation.id, [user1_id, user2_id], {
+                "conversation": {"id": conversation.id, "user1_id": user1_id, "user2_id": user2_id}
+            })
             await db.commit()
             await db.refresh(conversation)
+            dispatcher.notify()
         
+        presence.register_conversation(conversation.id, conversation.user1_id, conversation.user2_id)
         return conversation
     
     async def update_agent_tone(self, conversation_id: str, user_id: str, 
@@ -63,12 +100,30 @@ class ChatService:
         else:
             return False
         
+        conversation.version = Conversation.version + 1
+        add_event(db, "tone_changed", conversation_id, [user_id], {
+            "tone": tone.value,
+            "custom_prompt": custom_prompt if tone == AgentTone.CUSTOM else None
+        })
         await db.commit()
+        await db.refresh(conversation)
+        await conversation_cache.write_through(conversation)
+        dispatcher.notify()
         return True
     
+    def max_tokens_for(self, content: str, tone: AgentTone) -> int:
+        """Output ceiling scaled to the input, so short messages finish fast and long ones are not cut off"""
+        limit = math.ceil(estimate_tokens(content) * self.output_ratios.get(tone, 2.0)) + settings.LLM_MAX_TOKENS_HEADROOM
+        return max(settings.LLM_MAX_TOKENS_MIN, min(limit, settings.LLM_MAX_TOKENS_MAX))
+    
     async def transform_message(self, content: str, tone: AgentTone, 
-                              custom_prompt: Optional[str] = None) -> str:
-        """Transform message content based on agent tone using Llama API"""
+                              custom_prompt: Optional[str] = None, sender_id: Optional[str] = None,
+                              message_id: Optional[str] = None, message_count: int = 1) -> str:
+        """Transform message content based on agent tone using Llama API.
+        
+        With a `sender_id`, the call is checked against the sender's token
+        budget first (raising TokenBudgetExceeded) and its usage is recorded.
+        """
         if tone == AgentTone.CUSTOM and custom_prompt:
             prompt = f"{custom_prompt}: {content}"
         elif tone in self.tone_prompts:
@@ -77,11 +132,30 @@ class ChatService:
             # Default - return original if no tone set
             return content
         
+        max_tokens = self.max_tokens_for(content, tone)
         print(f"\n=== TRANSFORMING MESSAGE ===")
         print(f"Original: '{content}'")
         print(f"Tone: {tone}")
         print(f"Prompt: '{prompt}'")
+        print(f"Max tokens: {max_tokens}")
+        
+        if sender_id is None:
+            transformed, _ = await self.request_transformation(prompt, max_tokens)
+            return transformed
         
+        # Worst case: the whole prompt plus a completion that hits the ceiling
+        worst_case = estimate_tokens(TRANSFORM_SYSTEM_PROMPT + prompt) + max_tokens
+        async with usage_tracker.reserve(sender_id, worst_case):
+            started = time.monotonic()
+            transformed, usage = await self.request_transformation(prompt, max_tokens)
+            usage_tracker.record(
+                sender_id, tone.value, usage, max_tokens, time.monotonic() - started,
+                message_id=message_id, message_count=message_count
+            )
+        return transformed
+    
+    async def request_transformation(self, prompt: str, max_tokens: int) -> Tuple[str, TokenUsage]:
+        """Call the Llama API; returns the transformed text and the tokens used"""
         try:
             headers = {
                 "Authorization": f"Bearer {settings.LLAMA_API_KEY}",
@@ -93,7 +167,7 @@ class ChatService:
                 "messages": [
                     {
                         "role": "system",
-                        "content": "You are a message transformer. Transform the given message according to the instruction. Output ONLY the transformed message without any introduction, explanation, or quotation marks. Do not say 'Here is' or similar phrases. Just output the transformed message directly."
+                        "content": TRANSFORM_SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
@@ -101,14 +175,14 @@ class ChatService:
                     }
                 ],
                 "temperature": 0.7,
-                "max_tokens": 200
+                "max_tokens": max_tokens
             }
             
             print(f"Calling Llama API...")
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.llama.com/v1/chat/completions",
+            async with admission.transforming():
+                response = await get_http_client().post(
+                    f"{settings.LLAMA_API_BASE_URL}/chat/completions",
                     headers=headers,
                     json=data,
                     timeout=30.0
@@ -122,13 +196,17 @@ class ChatService:
                     content_obj = resp_json['completion_message']['content']
                     if isinstance(content_obj, dict) and 'text' in content_obj:
                         transformed = content_obj['text'].strip()
+                        usage = usage_from_response(resp_json, TRANSFORM_SYSTEM_PROMPT + prompt, transformed)
                         print(f"Transformed: '{transformed}'")
+                        print(f"Tokens: {usage.prompt_tokens} prompt, {usage.completion_tokens} completion")
+                        if usage.truncated:
+                            print(f"Warning: output stopped at max_tokens={max_tokens}")
                         print("=== TRANSFORMATION COMPLETE ===\n")
-                        return transformed
+                        return transformed, usage
             
             print(f"API Error: {response.text}")
             raise Exception(f"API returned status {response.status_code}")
-                
+        
         except Exception as e:
             print(f"ERROR transforming message: {type(e).__name__}: {e}")
             import traceback
@@ -136,82 +214,365 @@ class ChatService:
             # Reraise the exception - no fallback
             raise
     
+    def get_sender_tone(self, conversation: Union[Conversation, ConversationMeta],
+                        sender_id: str) -> Optional[Tuple[AgentTone, Optional[str]]]:
+        """Get the (tone, custom_prompt) the sender uses in a conversation"""
+        if conversation.user1_id == sender_id:
+            return conversation.user1_agent_tone, conversation.user1_custom_prompt
+        if conversation.user2_id == sender_id:
+            return conversation.user2_agent_tone, conversation.user2_custom_prompt
+        return None
+    
+    async def message_shard(self, conversation_id: str, db: AsyncSession) -> int:
+        """Shard holding a conversation's messages; no lookup without sharding"""
+        if not shards.sharded:
+            return 0
+        conversation = await conversation_cache.get(conversation_id, db)
+        return conversation.shard if conversation else 0
+    
+    def new_message_event(self, message: Message) -> Dict[str, Any]:
+        """Event payload announcing a new message to both participants"""
+        return {
+            "message": {
+                "id": message.id,
+                "sender_id": message.sender_id,
+                "transformed_content": message.transformed_content,
+                "timestamp": message.timestamp.isoformat()
+            }
+        }
+    
+    @drain_coordinator.tracked
     async def send_message(self, conversation_id: str, sender_id: str, 
                           content: str, db: AsyncSession) -> Optional[Message]:
         """Send a message in a conversation"""
-        conversation = await db.execute(
-            select(Conversation).where(Conversation.id == conversation_id)
-        )
-        conversation = conversation.scalar_one_or_none()
+        # Participants and tones come from the cache, not the conversation row
+        conversation = await conversation_cache.get(conversation_id, db)
         
         if not conversation:
             return None
         
         # Determine which tone to use based on sender
-        if conversation.user1_id == sender_id:
-            tone = conversation.user1_agent_tone
-            custom_prompt = conversation.user1_custom_prompt
-            print(f"User1 sending: tone={tone}, custom_prompt={custom_prompt}")
-        elif conversation.user2_id == sender_id:
-            tone = conversation.user2_agent_tone
-            custom_prompt = conversation.user2_custom_prompt
-            print(f"User2 sending: tone={tone}, custom_prompt={custom_prompt}")
-        else:
+        sender_tone = self.get_sender_tone(conversation, sender_id)
+        if sender_tone is None:
             return None
+        tone, custom_prompt = sender_tone
+        print(f"User {sender_id} sending: tone={tone}, custom_prompt={custom_prompt}")
         
-        # Transform the message
-        transformed_content = await self.transform_message(content, tone, custom_prompt)
+        # Transform the message; the id is chosen first so its token usage can refer to it
+        message_id = new_id()
+        transformed_content = await self.transform_message(
+            content, tone, custom_prompt, sender_id=sender_id, message_id=message_id
+        )
+        recipient_id = conversation.other_participant(sender_id)
+        
+        if settings.GROUP_COMMIT_ENABLED:
+            # Shares an INSERT and COMMIT with concurrent sends
+            return await message_writer.submit({
+                "id": message_id,
+                "conversation_id": conversation_id,
+                "sender_id": sender_id,
+                "original_content": content,
+                "transformed_content": transformed_content
+            }, [recipient_id, sender_id], shard=conversation.shard)
         
         # Create message record
         message = Message(
+            id=message_id,
             conversation_id=conversation_id,
             sender_id=sender_id,
             original_content=content,
             transformed_content=transformed_content
         )
-        db.add(message)
-        
-        # Update conversation last message time
-        conversation.last_message_at = datetime.utcnow()
-        
-        await db.commit()
-        await db.refresh(message)
+        async with shards.session(conversation.shard, db) as message_db:
+            message_db.add(message)
+            # Flush to assign the timestamp the event carries; a separate shard commits first
+            await message_db.flush()
+            if message_db is not db:
+                await message_db.commit()
+            
+            # Update conversation last message time
+            await db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id)
+                .values(last_message_at=datetime.utcnow(), version=Conversation.version + 1)
+            )
+            add_event(db, "new_message", conversation_id, [recipient_id, sender_id], self.new_message_event(message))
+            
+            await db.commit()
+            await message_db.refresh(message)
+        dispatcher.notify()
         
         return message
     
-    async def get_conversation_messages(self, conversation_id: str, db: AsyncSession) -> List[Message]:
-        """Get all messages in a conversation"""
+    @drain_coordinator.tracked
+    async def send_bulk_message(self, conversation_ids: List[str], sender_id: str,
+                                content: str, db: AsyncSession) -> Dict[str, Any]:
+        """Send the same message to many conversations.
+        
+        Conversations are grouped by the sender's (tone, custom_prompt) so the
+        Llama API is called once per group instead of once per conversation.
+        All messages are written in a single batched INSERT and transaction.
+        """
         result = await db.execute(
-            select(Message)
-            .where(Message.conversation_id == conversation_id)
-            .order_by(Message.timestamp.asc())
+            select(Conversation).where(Conversation.id.in_(set(conversation_ids)))
+        )
+        conversations = {conv.id: conv for conv in result.scalars().all()}
+        
+        # Group target conversations by the sender's effective tone
+        groups: Dict[Tuple[AgentTone, Optional[str]], List[Conversation]] = {}
+        failed: Dict[str, str] = {}
+        for conversation_id in dict.fromkeys(conversation_ids):
+            conversation = conversations.get(conversation_id)
+            sender_tone = self.get_sender_tone(conversation, sender_id) if conversation else None
+            if sender_tone is None:
+                failed[conversation_id] = self.NOT_FOUND_REASON
+                continue
+            tone, custom_prompt = sender_tone
+            # The custom prompt only takes effect with the CUSTOM tone
+            key = (tone, custom_prompt if tone == AgentTone.CUSTOM else None)
+            groups.setdefault(key, []).append(conversation)
+        
+        # One transformation per distinct tone, run concurrently
+        keys = list(groups.keys())
+        print(f"Bulk send from {sender_id}: {len(conversations)} conversations, {len(keys)} transformations")
+        transformations = await asyncio.gather(
+            *(
+                self.transform_message(
+                    content, tone, custom_prompt, sender_id=sender_id, message_count=len(groups[(tone, custom_prompt)])
+                )
+                for tone, custom_prompt in keys
+            ),
+            return_exceptions=True
         )
-        return result.scalars().all()
+        
+        now = datetime.utcnow()
+        rows = []
+        rows_by_shard: Dict[int, List[Dict[str, Any]]] = {}
+        recipients: Dict[str, str] = {}
+        for key, transformed_content in zip(keys, transformations):
+            for conversation in groups[key]:
+                if isinstance(transformed_content, TokenBudgetExceeded):
+                    failed[conversation.id] = self.BUDGET_REASON
+                    continue
+                if isinstance(transformed_content, Exception):
+                    failed[conversation.id] = "Failed to transform message"
+                    continue
+                rows.append({
+                    "id": new_id(),
+                    "conversation_id": conversation.id,
+                    "sender_id": sender_id,
+                    "original_content": content,
+                    "transformed_content": transformed_content,
+                    "timestamp": now
+                })
+                rows_by_shard.setdefault(conversation.shard, []).append(rows[-1])
+                recipients[conversation.id] = (
+                    conversation.user2_id if conversation.user1_id == sender_id else conversation.user1_id
+                )
+        
+        messages = [Message(**row) for row in rows]
+        if rows:
+            async def insert_rows(message_db: AsyncSession, shard_rows: List[Dict[str, Any]]):
+                await message_db.execute(insert(Message), shard_rows)
+                if message_db is not db:
+                    await message_db.commit()
+            await shards.gather(db, rows_by_shard, insert_rows)
+            await db.execute(
+                update(Conversation)
+                .where(Conversation.id.in_([row["conversation_id"] for row in rows]))
+                .values(last_message_at=now, version=Conversation.version + 1)
+            )
+            await add_events(db, [
+                outbox_row(
+                    "new_message",
+                    message.conversation_id,
+                    [recipients[message.conversation_id], sender_id],
+                    self.new_message_event(message)
+                )
+                for message in messages
+            ])
+            await db.commit()
+            dispatcher.notify()
+        
+        return {"messages": messages, "failed": failed}
+    
+    async def get_conversation_messages(self, conversation_id: str, db: AsyncSession,
+                                        since: Optional[datetime] = None) -> List[Message]:
+        """Get all messages in a conversation, optionally only those after `since`"""
+        query = select(Message).where(Message.conversation_id == conversation_id)
+        if since is not None:
+            query = query.where(Message.timestamp > since)
+        async with shards.session(await self.message_shard(conversation_id, db), db) as message_db:
+            result = await message_db.execute(query.order_by(Message.timestamp.asc()))
+            return result.scalars().all()
+    
+    async def get_conversation_message_rows(self, conversation_id: str, user_id: str, db: AsyncSession,
+                                            since: Optional[datetime] = None,
+                                            before: Optional[datetime] = None,
+                                            limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get messages as response-ready dicts for `user_id`, sender names included.
+        
+        Oldest first. `since`/`before` bound the window and `limit` keeps the
+        newest that many. Hot rows are read as Core tuples in one joined
+        query; older ones continue from the archive when the hot table runs out.
+        On a separate shard the usernames come from the main database instead.
+        """
+        async with shards.session(await self.message_shard(conversation_id, db), db) as message_db:
+            joined = message_db is db
+            query = (
+                select(
+                    Message.id,
+                    Message.sender_id,
+                    User.username if joined else null().label("username"),
+                    Message.original_content,
+                    Message.transformed_content,
+                    Message.timestamp,
+                    Message.is_read
+                )
+                .where(Message.conversation_id == conversation_id)
+            )
+            if joined:
+                query = query.outerjoin(User, User.id == Message.sender_id)
+            if since is not None:
+                query = query.where(Message.timestamp > since)
+            if before is not None:
+                query = query.where(Message.timestamp < before)
+            if limit is not None:
+                query = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit)
+            else:
+                query = query.order_by(Message.timestamp.asc())
+            result = await message_db.execute(query)
+            rows = result.all()
+            if limit is not None:
+                rows.reverse()
+            
+            archived = []
+            if limit is None or len(rows) < limit:
+                archived = await archiver.read_archived(
+                    conversation_id, message_db, since=since,
+                    before=rows[0].timestamp if rows else before,
+                    limit=limit - len(rows) if limit is not None else None
+                )
+        
+        usernames = {}
+        if archived or not joined:
+            senders = {m["sender_id"] for m in archived} | {row.sender_id for row in rows}
+            result = await db.execute(select(User.id, User.username).where(User.id.in_(senders)))
+            usernames = dict(result.all())
+        return [
+            self._message_row(m["id"], m["sender_id"], usernames.get(m["sender_id"]), m["original_content"],
+                              m["transformed_content"], m["timestamp"], m["is_read"], user_id)
+            for m in archived
+        ] + [
+            self._message_row(message_id, sender_id, username or usernames.get(sender_id), original_content,
+                              transformed_content, timestamp, is_read, user_id)
+            for message_id, sender_id, username, original_content, transformed_content, timestamp, is_read
+            in rows
+        ]
+    
+    def _message_row(self, message_id, sender_id, username, original_content, transformed_content,
+                     timestamp, is_read, user_id) -> Dict[str, Any]:
+        return {
+            "id": message_id,
+            "sender_id": sender_id,
+            "sender_username": username or "Unknown",
+            "original_content": original_content,
+            "transformed_content": transformed_content,
+            # The JSON encoder writes datetimes in isoformat
+            "timestamp": timestamp,
+            "is_mine": sender_id == user_id,
+            "is_read": is_read
+        }
     
-    async def mark_messages_as_read(self, conversation_id: str, user_id: str, db: AsyncSession):
-        """Mark all messages in a conversation as read for a user"""
+    async def mark_messages_as_read(self, conversation_id: str, user_id: str, db: AsyncSession) -> bool:
+        """Mark all messages in a conversation as read for a user.
+        
+        Returns True if any message changed state.
+        """
+        async with shards.session(await self.message_shard(conversation_id, db), db) as message_db:
+            result = await message_db.execute(
+                update(Message)
+                .where(
+                    and_(
+                        Message.conversation_id == conversation_id,
+                        Message.sender_id != user_id,
+                        Message.is_read == False
+                    )
+                )
+                .values(is_read=True, status=MessageStatus.READ)
+            )
+            if message_db is not db:
+                await message_db.commit()
+        if not result.rowcount:
+            await db.commit()
+            return False
+        
         await db.execute(
-            update(Message)
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(version=Conversation.version + 1)
+        )
+        # Usually already in the session from the authorization check
+        conversation = await db.get(Conversation, conversation_id)
+        add_event(db, "messages_read", conversation_id,
+                  [conversation.user1_id, conversation.user2_id], {"reader_id": user_id})
+        await db.commit()
+        dispatcher.notify()
+        return True
+    
+    async def get_conversation_participants(self, user_id: str, db: AsyncSession) -> List[Tuple[str, str, str]]:
+        """Get (id, user1_id, user2_id) for every conversation of a user"""
+        result = await db.execute(
+            select(Conversation.id, Conversation.user1_id, Conversation.user2_id)
             .where(
-                and_(
-                    Message.conversation_id == conversation_id,
-                    Message.sender_id != user_id,
-                    Message.is_read == False
+                or_(
+                    Conversation.user1_id == user_id,
+                    Conversation.user2_id == user_id
                 )
             )
-            .values(is_read=True, status=MessageStatus.READ)
         )
-        await db.commit()
+        return [tuple(row) for row in result.all()]
+    
+    async def get_conversations_etag_source(self, user_id: str, db: AsyncSession) -> List[Tuple[str, int]]:
+        """Get (id, version) pairs for a user's conversations without loading messages"""
+        result = await db.execute(
+            select(Conversation.id, Conversation.version)
+            .where(
+                or_(
+                    Conversation.user1_id == user_id,
+                    Conversation.user2_id == user_id
+                )
+            )
+            .order_by(Conversation.id)
+        )
+        return [tuple(row) for row in result.all()]
+    
+    async def get_conversation_version(self, conversation_id: str, db: AsyncSession) -> Optional[int]:
+        result = await db.execute(select(Conversation.version).where(Conversation.id == conversation_id))
+        return result.scalar_one_or_none()
     
     async def get_user_conversations(self, user_id: str, db: AsyncSession) -> List[Dict[str, Any]]:
-        """Get all conversations for a user with last message and unread count"""
+        """Get all conversations for a user with last message and unread count.
+        
+        Built from Core rows without loading any message history, so the
+        result can go straight to the JSON encoder. Conversations come from
+        the main database; their last messages and unread counts are read
+        from each shard concurrently.
+        """
+        other_id = case((Conversation.user1_id == user_id, Conversation.user2_id), else_=Conversation.user1_id)
         result = await db.execute(
-            select(Conversation)
-            .options(
-                selectinload(Conversation.user1),
-                selectinload(Conversation.user2),
-                selectinload(Conversation.messages)
+            select(
+                Conversation.id,
+                Conversation.user1_id,
+                Conversation.user1_agent_tone,
+                Conversation.user2_agent_tone,
+                Conversation.user1_custom_prompt,
+                Conversation.user2_custom_prompt,
+                User.id,
+                User.username,
+                Conversation.shard
             )
+            .join(User, User.id == other_id)
             .where(
                 or_(
                     Conversation.user1_id == user_id,
@@ -220,44 +581,91 @@ class ChatService:
             )
             .order_by(Conversation.last_message_at.desc())
         )
-        conversations = result.scalars().all()
+        conversations = result.all()
+        if not conversations:
+            return []
+        by_shard: Dict[int, List[str]] = {}
+        for row in conversations:
+            by_shard.setdefault(row.shard if shards.sharded else 0, []).append(row[0])
+        
+        activity = await shards.gather(
+            db, by_shard, lambda message_db, ids: self._conversation_activity(user_id, ids, message_db)
+        )
+        last_messages: Dict[str, Tuple] = {}
+        unread_counts: Dict[str, int] = {}
+        for shard_last, shard_unread in activity.values():
+            last_messages.update(shard_last)
+            unread_counts.update(shard_unread)
         
         conv_list = []
-        for conv in conversations:
-            # Get the other user
-            other_user = conv.user2 if conv.user1_id == user_id else conv.user1
-            
-            # Get last message
-            last_message = None
-            if conv.messages:
-                last_message = conv.messages[-1]
-            
-            # Count unread messages
-            unread_count = sum(1 for msg in conv.messages 
-                             if msg.sender_id != user_id and not msg.is_read)
+        for conv_id, user1_id, tone1, tone2, prompt1, prompt2, other_user_id, other_username, _ in conversations:
+            last_message = last_messages.get(conv_id)
             
             # Get user's tone for this conversation
-            if conv.user1_id == user_id:
-                user_tone = conv.user1_agent_tone
-                user_custom_prompt = conv.user1_custom_prompt
+            if user1_id == user_id:
+                user_tone, user_custom_prompt = tone1, prompt1
             else:
-                user_tone = conv.user2_agent_tone
-                user_custom_prompt = conv.user2_custom_prompt
+                user_tone, user_custom_prompt = tone2, prompt2
             
             conv_list.append({
-                "id": conv.id,
+                "id": conv_id,
                 "other_user": {
-                    "id": other_user.id,
-                    "username": other_user.username
+                    "id": other_user_id,
+                    "username": other_username
                 },
                 "last_message": {
-                    "content": last_message.transformed_content if last_message else None,
-                    "timestamp": last_message.timestamp.isoformat() if last_message else None,
-                    "is_mine": last_message.sender_id == user_id if last_message else None
+                    "content": last_message[1] if last_message else None,
+                    "timestamp": last_message[2].isoformat() if last_message else None,
+                    "is_mine": last_message[3] == user_id if last_message else None
                 },
-                "unread_count": unread_count,
+                "unread_count": unread_counts.get(conv_id, 0),
                 "my_agent_tone": user_tone.value,
                 "my_custom_prompt": user_custom_prompt
             })
         
-        return conv_list 
\ No newline at end of file
+        return conv_list
+    
+    async def _conversation_activity(self, user_id: str, conversation_ids: List[str],
+                                     db: AsyncSession) -> Tuple[Dict[str, Tuple], Dict[str, int]]:
+        """Last message and unread count per conversation, from one database"""
+        # Last message per conversation
+        ranked = (
+            select(
+                Message.conversation_id,
+                Message.transformed_content,
+                Message.timestamp,
+                Message.sender_id,
+                func.row_number().over(
+                    partition_by=Message.conversation_id,
+                    order_by=(Message.timestamp.desc(), Message.id.desc())
+                ).label("rank")
+            )
+            .where(Message.conversation_id.in_(conversation_ids))
+            .subquery()
+        )
+        result = await db.execute(
+            select(ranked.c.conversation_id, ranked.c.transformed_content, ranked.c.timestamp, ranked.c.sender_id)
+            .where(ranked.c.rank == 1)
+        )
+        last_messages = {row[0]: row for row in result.all()}
+        
+        # Conversations whose messages were all archived
+        cold = [conv_id for conv_id in conversation_ids if conv_id not in last_messages]
+        for conv_id, message in (await archiver.last_archived(cold, db)).items():
+            last_messages[conv_id] = (
+                conv_id, message["transformed_content"], message["timestamp"], message["sender_id"]
+            )
+        
+        # Count unread messages
+        result = await db.execute(
+            select(Message.conversation_id, func.count())
+            .where(
+                and_(
+                    Message.conversation_id.in_(conversation_ids),
+                    Message.sender_id != user_id,
+                    Message.is_read == False
+                )
+            )
+            .group_by(Message.conversation_id)
+        )
+        return last_messages, dict(result.all())
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings, LazyInstance
+from ..database.models import Conversation, AgentTone
+
+INVALIDATION_CHANNEL = "agent_chat:conversation_invalidations"
+
+def prompt_hash(prompt: Optional[str]) -> Optional[str]:
+    return hashlib.sha1(prompt.encode()).hexdigest() if prompt else None
+
+class ConversationMeta(NamedTuple):
+    """The rarely changing parts of a conversation the send path needs.
+    
+    Field names match Conversation so either can be passed to
+    ChatService.get_sender_tone.
+    """
+    id: str
+    user1_id: str
+    user2_id: str
+    user1_agent_tone: AgentTone
+    user2_agent_tone: AgentTone
+    user1_custom_prompt: Optional[str]
+    user2_custom_prompt: Optional[str]
+    user1_prompt_hash: Optional[str]
+    user2_prompt_hash: Optional[str]
+    shard: int = 0
+    
+    def has_participant(self, user_id: str) -> bool:
+        return user_id in (self.user1_id, self.user2_id)
+    
+    def other_participant(self, user_id: str) -> str:
+        return self.user2_id if self.user1_id == user_id else self.user1_id
+
+def meta_from_row(row) -> ConversationMeta:
+    return ConversationMeta(
+        id=row.id,
+        user1_id=row.user1_id,
+        user2_id=row.user2_id,
+        user1_agent_tone=row.user1_agent_tone,
+        user2_agent_tone=row.user2_agent_tone,
+        user1_custom_prompt=row.user1_custom_prompt,
+        user2_custom_prompt=row.user2_custom_prompt,
+        user1_prompt_hash=prompt_hash(row.user1_custom_prompt),
+        user2_prompt_hash=prompt_hash(row.user2_custom_prompt),
+        shard=row.shard
+    )
+
+class ConversationCache:
+    """LRU cache of conversation participants, tones and custom prompts.
+    
+    Entries only change through update_agent_tone, which writes the new
+    value through after commit and publishes an invalidation so other
+    workers drop their copy.
+    """
+    
+    def __init__(self, max_size: int, redis_url: Optional[str] = None):
+        self.max_size = max_size
+        self.redis_url = redis_url
+        self.redis = None
+        self.entries: "OrderedDict[str, ConversationMeta]" = OrderedDict()
+        # Bumped on invalidation so a load racing with it cannot store stale data
+        self.generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.relay_task: Optional[asyncio.Task] = None
+    
+    def _store(self, meta: ConversationMeta):
+        self.entries[meta.id] = meta
+        self.entries.move_to_end(meta.id)
+        while len(self.entries) > self.max_size:
+            evicted, _ = self.entries.popitem(last=False)
+            self.generations.pop(evicted, None)
+    
+    async def get(self, conversation_id: str, db: AsyncSession) -> Optional[ConversationMeta]:
+        meta = self.entries.get(conversation_id)
+        if meta is not None:
+            self.entries.move_to_end(conversation_id)
+            self.hits += 1
+            return meta
+        
+        self.misses += 1
+        generation = self.generations.get(conversation_id, 0)
+        result = await db.execute(
+            select(
+                Conversation.id,
+                Conversation.user1_id,
+                Conversation.user2_id,
+                Conversation.user1_agent_tone,
+                Conversation.user2_agent_tone,
+                Conversation.user1_custom_prompt,
+                Conversation.user2_custom_prompt,
+                Conversation.shard
+            ).where(Conversation.id == conversation_id)
+        )
+        row = result.one_or_none()
+        if row is None:
+            return None
+        meta = meta_from_row(row)
+        if self.generations.get(conversation_id, 0) == generation:
+            self._store(meta)
+        return meta
+    
+    def _drop(self, conversation_id: str):
+        self.entries.pop(conversation_id, None)
+        self.generations[conversation_id] = self.generations.get(conversation_id, 0) + 1
+    
+    async def write_through(self, conversation: Conversation):
+        """Replace the cached entry after a committed change"""
+        self._drop(conversation.id)
+        self._store(meta_from_row(conversation))
+        await self._publish(conversation.id)
+    
+    async def invalidate(self, conversation_id: str):
+        self._drop(conversation_id)
+        await self._publish(conversation_id)
+    
+    async def _publish(self, conversation_id: str):
+        if self.redis is not None:
+            try:
+                await self.redis.publish(INVALIDATION_CHANNEL, conversation_id)
+            except Exception as e:
+                # Other workers keep a stale entry until evicted; better than failing the write
+                print(f"Conversation cache invalidation publish failed: {e}")
+    
+    async def relay(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self._drop(message["data"])
+        finally:
+            await pubsub.close()
+    
+    async def start(self):
+        if self.redis_url and self.redis is None:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(self.redis_url, decode_responses=True)
+            self.relay_task = asyncio.create_task(self.relay())
+    
+    async def stop(self):
+        if self.relay_task:
+            self.relay_task.cancel()
+            self.relay_task = None
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+# Global conversation cache instance
+conversation_cache = LazyInstance(lambda: ConversationCache(
+    settings.CONVERSATION_CACHE_SIZE,
+    redis_url=settings.REDIS_URL if settings.CONVERSATION_CACHE_USE_REDIS else None
+))
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from types import FrameType
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from ..config import settings, LazyInstance
+
+Stack = Tuple[str, ...]
+
+# Marks samples taken while the profiled request was suspended in an await
+AWAIT_FRAME = "[await]"
+
+# Profile formats: collapsed stacks (text) or a speedscope.app JSON document
+PROFILE_FORMATS = {"collapsed": "text/plain", "speedscope": "application/json"}
+
+def short_path(filename: str) -> str:
+    """Path relative to the app, or to site-packages for libraries"""
+    _, found, rest = filename.rpartition("site-packages" + os.sep)
+    if found:
+        return rest
+    return os.path.relpath(filename) if filename.startswith(os.getcwd()) else filename
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    # co_qualname is new in Python 3.11
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+
+def frame_stack(frame: Optional[FrameType]) -> Stack:
+    """Function names from the outermost call to `frame`"""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return tuple(reversed(names))
+
+def awaiting_stack(task: asyncio.Task) -> Stack:
+    """Where a suspended task is waiting, following its chain of awaits"""
+    names = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        names.append(frame_name(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return tuple(names) + (AWAIT_FRAME,)
+
+class LoopMonitor:
+    """Measures event-loop lag and reports what blocked it.
+    
+    A coroutine ticks every `interval` and records how late each wake-up
+    was. A watchdog thread checks that the ticks keep coming; when the loop
+    has been stuck for more than `threshold`, it prints the loop thread's
+    current stack, which is the code doing the blocking.
+    """
+    
+    def __init__(self, interval: float, threshold: float, history: int = 600):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: Deque[float] = deque(maxlen=history)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_stall: Optional[Dict[str, Any]] = None
+        self.beat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+    
+    async def tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.beat = time.monotonic()
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+    
+    def watch(self):
+        reported = False
+        while not self.stopping.wait(self.threshold / 2):
+            stalled = time.monotonic() - self.beat - self.interval
+            if stalled <= self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            # Report each stall once, while it is still happening
+            reported = True
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            self.stalls += 1
+            self.last_stall = {"at": time.time(), "blocked_ms": round(stalled * 1000), "stack": stack}
+            print(f"Event loop blocked for {stalled * 1000:.0f} ms, in:\n{stack}")
+    
+    def stats(self) -> Dict[str, Any]:
+        lags = sorted(self.lags)
+        
+        def percentile(p: float) -> float:
+            return round(lags[min(int(len(lags) * p), len(lags) - 1)] * 1000, 2) if lags else 0.0
+        
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": {"p50": percentile(0.5), "p99": percentile(0.99), "max": round(self.max_lag * 1000, 2)},
+            "stalls": self.stalls,
+            "last_stall": self.last_stall
+        }
+    
+    def start(self):
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.beat = time.monotonic()
+        self.stopping.clear()
+        self.task = asyncio.create_task(self.tick())
+        self.watchdog = threading.Thread(target=self.watch, name="loop-monitor", daemon=True)
+        self.watchdog.start()
+    
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        self.task = None
+        self.stopping.set()
+        await asyncio.get_running_loop().run_in_executor(None, self.watchdog.join)
+
+class StackSampler:
+    """Sampling profiler for the event loop thread.
+    
+    A background thread records the loop thread's stack every `interval`.
+    Given a `task` and the `marker` frame it runs under, only that task is
+    profiled: samples where the marker is on the stack count as running, and
+    while the task is suspended its await chain is recorded instead, so time
+    spent waiting (on the Llama API, say) shows up under `[await]`.
+    """
+    
+    def __init__(self, thread_id: int, interval: float, task: Optional[asyncio.Task] = None,
+                 marker: Optional[FrameType] = None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.task = task
+        self.marker = marker
+        self.samples: Counter = Counter()
+        self.started = 0.0
+        self.duration = 0.0
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+    
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if self.task is None:
+            if frame is not None:
+                self.samples[frame_stack(frame)] += 1
+            return
+        if self.task.done():
+            return
+        running = frame
+        while running is not None and running is not self.marker:
+            running = running.f_back
+        if running is not None:
+            self.samples[frame_stack(frame)] += 1
+        else:
+            self.samples[awaiting_stack(self.task)] += 1
+    
+    def run(self, seconds: Optional[float] = None):
+        """Sample until `stop` is called or `seconds` pass"""
+        self.started = time.monotonic()
+        deadline = self.started + seconds if seconds else None
+        while not self.stopping.wait(self.interval):
+            self._sample()
+            if deadline and time.monotonic() >= deadline:
+                break
+        self.duration = time.monotonic() - self.started
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+    
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed format, for flamegraph.pl or speedscope"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+    
+    def speedscope(self, name: str) -> Dict[str, Any]:
+        """A speedscope.app "sampled" profile, viewable as a flame graph"""
+        frames: Dict[str, int] = {}
+        samples: List[List[int]] = []
+        weights: List[float] = []
+        for stack, count in self.samples.items():
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": frame} for frame in frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+    
+    def render(self, format: str, name: str) -> Tuple[bytes, str]:
+        """Encode the profile as `format`; returns the body and its media type"""
+        if format == "speedscope":
+            body = json.dumps(self.speedscope(name)).encode()
+        else:
+            body = self.collapsed().encode()
+        return body, PROFILE_FORMATS[format]
+
+# Global event loop monitor instance
+loop_monitor = LazyInstance(lambda: LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_MS / 1000.0,
+    threshold=settings.LOOP_MONITOR_THRESHOLD_MS / 1000.0
+))
@@ -0,0 +1,138 @@
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, or_, and_, func, case
+from ..database.models import User, Conversation, Counter, USERS_GENERATION
+
+class InvalidCursorError(ValueError):
+    pass
+
+def users_generation():
+    """How many times users have been deleted, as a scalar subquery"""
+    return select(Counter.value).where(Counter.name == USERS_GENERATION).scalar_subquery()
+
+async def bump_users_generation(db: AsyncSession):
+    """Mark a deletion in the caller's transaction so cached directory pages go stale"""
+    await db.execute(
+        update(Counter).where(Counter.name == USERS_GENERATION).values(value=Counter.value + 1)
+    )
+
+class DirectoryService:
+    """Keyset-paginated, searchable user directory.
+    
+    Ordering "name" pages through users by username. Ordering "recent" first
+    pages through the caller's contacts by last message time, then continues
+    with everyone else by username.
+    """
+    
+    MAX_LIMIT = 100
+    
+    def encode_cursor(self, position: List[Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+    
+    def decode_cursor(self, cursor: str) -> List[Any]:
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise InvalidCursorError("Invalid cursor")
+        if not isinstance(position, list) or not position or position[0] not in ("recent", "name"):
+            raise InvalidCursorError("Invalid cursor")
+        if position[0] == "recent" and len(position) == 3:
+            try:
+                position[1] = datetime.fromisoformat(position[1])
+            except (TypeError, ValueError):
+                raise InvalidCursorError("Invalid cursor")
+        return position
+    
+    def _search_filter(self, query: str, fuzzy: bool, dialect: str):
+        """Case-insensitive username match that can use the dialect's index"""
+        needle = query.lower()
+        lowered = func.lower(User.username)
+        if fuzzy:
+            if dialect == "postgresql":
+                # pg_trgm similarity, served by ix_users_username_trgm
+                return lowered.op("%")(needle)
+            return lowered.contains(needle, autoescape=True)
+        if dialect == "postgresql":
+            return lowered.startswith(needle, autoescape=True)
+        # SQLite compares with BINARY collation, so a range scan on
+        # ix_users_username_lower is an exact prefix match
+        return and_(lowered >= needle, lowered < needle + "\U0010ffff")
+    
+    def _contact_join(self, user_id: str):
+        return or_(
+            and_(Conversation.user1_id == user_id, Conversation.user2_id == User.id),
+            and_(Conversation.user2_id == user_id, Conversation.user1_id == User.id)
+        )
+    
+    async def list_users(self, user_id: str, db: AsyncSession, query: Optional[str] = None,
+                         cursor: Optional[str] = None, limit: int = 50,
+                         order: str = "name", fuzzy: bool = False) -> Dict[str, Any]:
+        """Get one page of the directory, excluding the caller"""
+        limit = max(1, min(limit, self.MAX_LIMIT))
+        dialect = db.bind.dialect.name
+        search = self._search_filter(query, fuzzy, dialect) if query else None
+        position = self.decode_cursor(cursor) if cursor else [order]
+        
+        users: List[Dict[str, str]] = []
+        next_cursor = None
+        
+        if order == "recent" and position[0] == "recent":
+            stmt = (
+                select(User.id, User.username, Conversation.last_message_at, Conversation.id)
+                .join(Conversation, self._contact_join(user_id))
+                .where(User.id != user_id)
+            )
+            if search is not None:
+                stmt = stmt.where(search)
+            if len(position) == 3:
+                last_at = position[1]
+                stmt = stmt.where(
+                    or_(
+                        Conversation.last_message_at < last_at,
+                        and_(Conversation.last_message_at == last_at, Conversation.id < position[2])
+                    )
+                )
+            stmt = stmt.order_by(Conversation.last_message_at.desc(), Conversation.id.desc()).limit(limit + 1)
+            rows = (await db.execute(stmt)).all()
+            
+            for row in rows[:limit]:
+                users.append({"id": row[0], "username": row[1]})
+            if len(rows) > limit:
+                last = rows[limit - 1]
+                return {
+                    "users": users,
+                    "next_cursor": self.encode_cursor(["recent", last[2].isoformat(), last[3]])
+                }
+            # Contacts exhausted; fill the page from the rest of the directory
+            position = ["name"]
+        
+        remaining = limit - len(users)
+        if remaining <= 0:
+            return {"users": users, "next_cursor": self.encode_cursor(["name"])}
+        
+        stmt = select(User.id, User.username).where(User.id != user_id)
+        if order == "recent":
+            partner_id = case(
+                (Conversation.user1_id == user_id, Conversation.user2_id),
+                else_=Conversation.user1_id
+            )
+            contacts = select(partner_id).where(
+                or_(Conversation.user1_id == user_id, Conversation.user2_id == user_id)
+            )
+            stmt = stmt.where(User.id.not_in(contacts))
+        if search is not None:
+            stmt = stmt.where(search)
+        if len(position) == 2:
+            stmt = stmt.where(User.username > position[1])
+        stmt = stmt.order_by(User.username).limit(remaining + 1)
+        rows = (await db.execute(stmt)).all()
+        
+        for row in rows[:remaining]:
+            users.append({"id": row[0], "username": row[1]})
+        if len(rows) > remaining:
+            next_cursor = self.encode_cursor(["name", rows[remaining - 1][1]])
+        
+        return {"users": users, "next_cursor": next_cursor}
@@ -0,0 +1,60 @@
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+from typing import Optional
+from ..websocket.manager import manager, ConnectionManager
+from .outbox import dispatcher, OutboxDispatcher
+
+class DrainCoordinator:
+    """Lets a worker finish in-flight work before it exits.
+    
+    Message sends (which wait on the Llama API) register with `track`. When
+    the server is told to stop, `drain` marks the worker as draining so
+    health checks fail and new sockets are refused, waits for tracked sends
+    to commit, pushes their events to connected clients, and then closes
+    every socket with 1001 so clients reconnect to another worker.
+    """
+    
+    def __init__(self, connections: ConnectionManager, events: OutboxDispatcher):
+        self.connections = connections
+        self.events = events
+        self.draining = False
+        self.in_flight = 0
+        self.idle: Optional[asyncio.Event] = None
+    
+    @asynccontextmanager
+    async def track(self):
+        if self.idle is None:
+            self.idle = asyncio.Event()
+        self.in_flight += 1
+        self.idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self.idle.set()
+    
+    def tracked(self, func):
+        """Decorator form of `track` for coroutine functions"""
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with self.track():
+                return await func(*args, **kwargs)
+        return wrapper
+    
+    async def drain(self, timeout: float):
+        self.draining = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        if self.in_flight:
+            print(f"Draining: waiting for {self.in_flight} in-flight send(s)")
+            try:
+                await asyncio.wait_for(self.idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Draining: gave up on {self.in_flight} send(s)")
+        await self.events.flush()
+        await self.connections.drain(max(deadline - loop.time(), 0.0))
+
+# Global drain coordinator instance
+drain_coordinator = DrainCoordinator(manager, dispatcher)
@@ -0,0 +1,139 @@
+import csv
+import io
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List
+import orjson
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings, LazyInstance
+from ..database.models import User, Conversation, Message, MessageArchive
+from ..database.shards import shards
+from .archive_service import decode_chunk
+
+# Export format -> media type
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+EXPORT_COLUMNS = [
+    "conversation_id", "id", "sender_id", "sender_username", "original_content",
+    "transformed_content", "timestamp", "is_read"
+]
+
+class ExportService:
+    """Streams conversation history as NDJSON or CSV in constant memory.
+    
+    Each conversation is written oldest first: archived chunks one at a
+    time, then hot rows read through a server-side cursor `chunk_size` rows
+    at a time. Output is encoded and yielded per chunk, so memory does not
+    grow with the length of the history.
+    """
+    
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+    
+    async def user_conversation_ids(self, user_id: str, db: AsyncSession) -> List[str]:
+        result = await db.execute(
+            select(Conversation.id)
+            .where(or_(Conversation.user1_id == user_id, Conversation.user2_id == user_id))
+            .order_by(Conversation.created_at, Conversation.id)
+        )
+        return result.scalars().all()
+    
+    async def _usernames(self, conversation_id: str, db: AsyncSession) -> Dict[str, str]:
+        conversation = select(Conversation.user1_id, Conversation.user2_id).where(Conversation.id == conversation_id)
+        participants = (await db.execute(conversation)).one_or_none()
+        if participants is None:
+            return {}
+        result = await db.execute(select(User.id, User.username).where(User.id.in_(list(participants))))
+        return dict(result.all())
+    
+    async def _snapshot(self, db: AsyncSession):
+        if db.bind.dialect.name == "postgresql":
+            # One snapshot, so the archiver cannot move rows between the two reads
+            await db.commit()
+            await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    
+    async def iter_chunks(self, conversation_ids: List[str], db: AsyncSession) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield the conversations' messages as lists of at most about `chunk_size` rows"""
+        await self._snapshot(db)
+        for conversation_id in conversation_ids:
+            usernames = await self._usernames(conversation_id, db)
+            shard = 0
+            if shards.sharded:
+                shard = (await db.execute(
+                    select(Conversation.shard).where(Conversation.id == conversation_id)
+                )).scalar() or 0
+            async with shards.session(shard, db) as message_db:
+                if message_db is not db:
+                    await self._snapshot(message_db)
+                async for rows in self._conversation_chunks(conversation_id, usernames, message_db):
+                    yield rows
+    
+    async def _conversation_chunks(self, conversation_id: str, usernames: Dict[str, str],
+                                   db: AsyncSession) -> AsyncIterator[List[Dict[str, Any]]]:
+        """One conversation's archived chunks, then its hot rows"""
+        archived = await db.stream(
+            select(MessageArchive.codec, MessageArchive.payload)
+            .where(MessageArchive.conversation_id == conversation_id)
+            .order_by(MessageArchive.first_timestamp)
+            .execution_options(yield_per=1)
+        )
+        async for codec, payload in archived:
+            yield [
+                self._row(conversation_id, message["id"], message["sender_id"], usernames,
+                          message["original_content"], message["transformed_content"],
+                          message["timestamp"], message["is_read"])
+                for message in decode_chunk(codec, payload)
+            ]
+        
+        hot = await db.stream(
+            select(
+                Message.id, Message.sender_id, Message.original_content,
+                Message.transformed_content, Message.timestamp, Message.is_read
+            )
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.timestamp, Message.id)
+            .execution_options(yield_per=self.chunk_size)
+        )
+        async for partition in hot.partitions():
+            yield [
+                self._row(conversation_id, message_id, sender_id, usernames,
+                          original_content, transformed_content, timestamp, is_read)
+                for message_id, sender_id, original_content, transformed_content, timestamp, is_read
+                in partition
+            ]
+    
+    def _row(self, conversation_id: str, message_id: str, sender_id: str, usernames: Dict[str, str],
+             original_content: str, transformed_content: str, timestamp: datetime,
+             is_read: bool) -> Dict[str, Any]:
+        return {
+            "conversation_id": conversation_id,
+            "id": message_id,
+            "sender_id": sender_id,
+            "sender_username": usernames.get(sender_id, "Unknown"),
+            "original_content": original_content,
+            "transformed_content": transformed_content,
+            "timestamp": timestamp.isoformat(),
+            "is_read": bool(is_read)
+        }
+    
+    async def export(self, conversation_ids: List[str], db: AsyncSession, format: str = "ndjson") -> AsyncIterator[bytes]:
+        """Encoded export body, one piece per chunk"""
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            yield buffer.getvalue().encode()
+            async for rows in self.iter_chunks(conversation_ids, db):
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows([row[column] for column in EXPORT_COLUMNS] for row in rows)
+                yield buffer.getvalue().encode()
+        else:
+            async for rows in self.iter_chunks(conversation_ids, db):
+                yield b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
+# Global export service instance
+export_service = LazyInstance(lambda: ExportService(chunk_size=settings.EXPORT_CHUNK_SIZE))
@@ -0,0 +1,25 @@
+from typing import Optional
+import httpx
+from ..config import settings
+
+# Shared outbound HTTP client, created on first use so pooled connections
+# (and their TLS sessions) are reused across requests
+_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=settings.HTTP_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
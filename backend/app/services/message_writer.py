@@ -0,0 +1,177 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import insert, select, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings, LazyInstance
+from ..database.connection import AsyncSessionLocal
+from ..database.ids import new_id
+from ..database.models import Conversation, Message, MessageStatus
+from ..database.shards import shards
+from .outbox import add_events, outbox_row, dispatcher
+
+# Per-conversation bump; bind names must not clash with column names
+BUMP_CONVERSATION = (
+    Conversation.__table__.update()
+    .where(Conversation.__table__.c.id == bindparam("b_id"))
+    .values(
+        last_message_at=bindparam("b_last_message_at"),
+        version=Conversation.__table__.c.version + bindparam("b_count")
+    )
+)
+
+class GroupCommitWriter:
+    """Batches concurrent message inserts into shared transactions.
+    
+    Senders enqueue finished message rows and await a future. One writer
+    task takes up to `max_batch` rows, waiting at most `max_delay` seconds
+    after the first one for more to arrive, then writes them with one
+    multi-row INSERT, one UPDATE per touched conversation and one COMMIT.
+    If a batch fails, its rows are retried one by one so a single bad row
+    only fails its own sender. Rows for other shards are inserted and
+    committed there first, one INSERT per shard; those inserts skip ids
+    already on the shard, so retrying rows whose main transaction failed
+    does not trip over its own earlier commit.
+    """
+    
+    def __init__(self, max_batch: int, max_delay: float):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.in_flight: Optional[asyncio.Future] = None
+    
+    async def submit(self, row: Dict[str, Any], recipients: List[str], shard: int = 0) -> Message:
+        """Queue a message row and its new_message recipients; returns once committed"""
+        if self.task is None:
+            self.start()
+        row = {
+            "id": new_id(),
+            "timestamp": datetime.utcnow(),
+            "status": MessageStatus.SENT,
+            "is_read": False,
+            **row
+        }
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((row, recipients, future, shard))
+        return await future
+    
+    async def _collect(self) -> List[Tuple[Dict[str, Any], Any, asyncio.Future, int]]:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _write(self, db: AsyncSession, batch):
+        rows = [row for row, _, _, _ in batch]
+        rows_by_shard: Dict[int, List[Dict[str, Any]]] = {}
+        for row, _, _, shard in batch:
+            rows_by_shard.setdefault(shard, []).append(row)
+        
+        async def insert_rows(message_db: AsyncSession, shard_rows: List[Dict[str, Any]]):
+            if message_db is not db:
+                result = await message_db.execute(
+                    select(Message.id).where(Message.id.in_([row["id"] for row in shard_rows]))
+                )
+                existing = set(result.scalars())
+                shard_rows = [row for row in shard_rows if row["id"] not in existing]
+            if shard_rows:
+                await message_db.execute(insert(Message), shard_rows)
+            if message_db is not db:
+                await message_db.commit()
+        await shards.gather(db, rows_by_shard, insert_rows)
+        
+        bumps: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            bump = bumps.setdefault(row["conversation_id"], {
+                "b_id": row["conversation_id"], "b_last_message_at": row["timestamp"], "b_count": 0
+            })
+            bump["b_last_message_at"] = max(bump["b_last_message_at"], row["timestamp"])
+            bump["b_count"] += 1
+        await db.execute(BUMP_CONVERSATION, list(bumps.values()))
+        
+        await add_events(db, [
+            outbox_row("new_message", row["conversation_id"], recipients, {
+                "message": {
+                    "id": row["id"],
+                    "sender_id": row["sender_id"],
+                    "transformed_content": row["transformed_content"],
+                    "timestamp": row["timestamp"].isoformat()
+                }
+            })
+            for row, recipients, _, _ in batch
+        ])
+        await db.commit()
+    
+    async def flush(self, batch):
+        try:
+            async with AsyncSessionLocal() as db:
+                await self._write(db, batch)
+        except Exception as e:
+            if len(batch) == 1:
+                # The sender may have stopped waiting (cancelled)
+                if not batch[0][2].done():
+                    batch[0][2].set_exception(e)
+                return
+            # Isolate the failing row(s)
+            for item in batch:
+                await self.flush([item])
+            return
+        for row, _, future, _ in batch:
+            if not future.done():
+                future.set_result(Message(**row))
+        dispatcher.notify()
+    
+    async def run(self):
+        while True:
+            batch = await self._collect()
+            # Shielded so stop() cannot abandon a batch halfway through
+            self.in_flight = asyncio.ensure_future(self.flush(batch))
+            try:
+                await asyncio.shield(self.in_flight)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the writer alive; submit() never restarts a dead one
+                print(f"Message writer error: {type(e).__name__}: {e}")
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+    
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.in_flight is not None:
+            try:
+                await self.in_flight
+            except Exception as e:
+                print(f"Message writer error: {type(e).__name__}: {e}")
+            self.in_flight = None
+        # Write whatever was queued before shutdown
+        pending = []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for start in range(0, len(pending), self.max_batch):
+            await self.flush(pending[start:start + self.max_batch])
+
+# Global group-commit writer instance
+message_writer = LazyInstance(lambda: GroupCommitWriter(
+    max_batch=settings.GROUP_COMMIT_MAX_BATCH,
+    max_delay=settings.GROUP_COMMIT_MAX_DELAY_MS / 1000
+))
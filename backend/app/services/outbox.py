@@ -0,0 +1,215 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import select, update, delete, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings, LazyInstance
+from ..database.connection import AsyncSessionLocal
+from ..database.models import OutboxEvent
+from ..websocket.manager import manager, ConnectionManager
+from .sync_service import sync_log
+
+EVENTS_CHANNEL = "agent_chat:events"
+# Arbitrary key for the PostgreSQL advisory lock that serializes drains
+DISPATCH_LOCK_KEY = 7_300_001
+
+def outbox_row(event_type: str, conversation_id: Optional[str],
+               recipients: Iterable[str], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build an outbox row for a bulk INSERT"""
+    return {
+        "event_type": event_type,
+        "conversation_id": conversation_id,
+        "recipients": json.dumps(list(recipients)),
+        "payload": json.dumps(data),
+        "created_at": datetime.utcnow()
+    }
+
+def add_event(db: AsyncSession, event_type: str, conversation_id: Optional[str],
+              recipients: Iterable[str], data: Dict[str, Any]):
+    """Stage an event in the caller's transaction; it is published only if that commits"""
+    db.add(OutboxEvent(**outbox_row(event_type, conversation_id, recipients, data)))
+
+async def add_events(db: AsyncSession, rows: List[Dict[str, Any]]):
+    """Stage many events with one batched INSERT"""
+    if rows:
+        await db.execute(insert(OutboxEvent), rows)
+
+class OutboxDispatcher:
+    """Drains the outbox to connected clients in batches.
+    
+    Delivery is at-least-once: events are marked dispatched only after they
+    were handed to the connection layer, so a crash in between re-sends them
+    and clients drop duplicates by `event_id`. Drains are serialized across
+    workers (an advisory lock on PostgreSQL; on SQLite, claiming the batch
+    first takes the database write lock) and read in id order, which keeps
+    each conversation's events in order.
+    
+    With Redis, the draining worker publishes each batch and every worker
+    delivers it to its own sockets; without it, delivery is local only.
+    """
+    
+    def __init__(self, connections: ConnectionManager, batch_size: int, poll_interval: float,
+                 retention: timedelta, redis_url: Optional[str] = None):
+        self.connections = connections
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.redis_url = redis_url
+        self.redis = None
+        self.wakeup = asyncio.Event()
+        self.tasks: List[asyncio.Task] = []
+        self.lock = asyncio.Lock()
+        self.last_cleanup = datetime.min
+    
+    def notify(self):
+        """Wake the dispatcher after a commit; never blocks the request"""
+        self.wakeup.set()
+    
+    async def _deliver(self, events: List[Dict[str, Any]]):
+        for event in events:
+            await self.connections.send_json_to_users(event["data"], event["recipients"])
+    
+    async def _publish(self, events: List[Dict[str, Any]]):
+        if self.redis is not None:
+            await self.redis.publish(EVENTS_CHANNEL, json.dumps(events))
+        else:
+            await self._deliver(events)
+    
+    async def drain_once(self, db: AsyncSession) -> int:
+        """Dispatch one batch; returns how many events were sent"""
+        # The advisory lock serializes workers; this serializes the loop and flush()
+        async with self.lock:
+            return await self._drain_once(db)
+    
+    async def _drain_once(self, db: AsyncSession) -> int:
+        dialect = db.bind.dialect.name
+        if dialect == "postgresql":
+            locked = await db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": DISPATCH_LOCK_KEY})
+            if not locked.scalar():
+                await db.rollback()
+                return 0
+        
+        batch = (
+            select(OutboxEvent.id)
+            .where(OutboxEvent.dispatched_at.is_(None))
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+        )
+        if dialect == "sqlite":
+            # Writing first holds SQLite's write lock until commit: a drain in
+            # another worker waits here, then finds these rows already claimed
+            claimed = await db.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(batch))
+                .values(dispatched_at=datetime.utcnow())
+                .returning(OutboxEvent.id)
+            )
+            batch = claimed.scalars().all()
+        
+        result = await db.execute(
+            select(OutboxEvent).where(OutboxEvent.id.in_(batch)).order_by(OutboxEvent.id)
+        )
+        rows = result.scalars().all()
+        if not rows:
+            await db.rollback()
+            return 0
+        
+        events = []
+        for row in rows:
+            data = json.loads(row.payload)
+            data.update({"event_id": row.id, "type": row.event_type, "conversation_id": row.conversation_id})
+            events.append({"recipients": json.loads(row.recipients), "data": data})
+        await sync_log.append(db, events)
+        await self._publish(events)
+        
+        await db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_([row.id for row in rows]))
+            .values(dispatched_at=datetime.utcnow())
+        )
+        await db.commit()
+        return len(rows)
+    
+    async def cleanup(self, db: AsyncSession):
+        """Delete dispatched events past retention, one batch at a time"""
+        cutoff = datetime.utcnow() - self.retention
+        ids = select(OutboxEvent.id).where(
+            OutboxEvent.dispatched_at.is_not(None),
+            OutboxEvent.dispatched_at < cutoff
+        ).limit(self.batch_size * 10)
+        await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(ids)))
+        await db.commit()
+        await sync_log.prune(db)
+    
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                async with AsyncSessionLocal() as db:
+                    # Keep draining while full batches come back
+                    while await self.drain_once(db) == self.batch_size:
+                        pass
+                    if datetime.utcnow() - self.last_cleanup > timedelta(minutes=1):
+                        self.last_cleanup = datetime.utcnow()
+                        await self.cleanup(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Outbox dispatch error: {type(e).__name__}: {e}")
+                await asyncio.sleep(self.poll_interval)
+    
+    async def relay(self):
+        """Deliver batches published by whichever worker drained them"""
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(EVENTS_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    events = json.loads(message["data"])
+                    await self._deliver([
+                        event for event in events
+                        if any(uid in self.connections.active_connections or uid in self.connections.subscribers
+                               for uid in event["recipients"])
+                    ])
+        finally:
+            await pubsub.close()
+    
+    async def start(self):
+        if self.redis_url and self.redis is None:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(self.redis_url, decode_responses=True)
+            self.tasks.append(asyncio.create_task(self.relay()))
+        self.tasks.append(asyncio.create_task(self.run()))
+    
+    async def flush(self):
+        """Dispatch everything committed so far, without waiting for the next wakeup"""
+        try:
+            async with AsyncSessionLocal() as db:
+                while await self.drain_once(db) == self.batch_size:
+                    pass
+        except Exception as e:
+            print(f"Outbox final drain failed: {e}")
+    
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        # Best-effort final drain so committed events go out before exit
+        await self.flush()
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+# Global outbox dispatcher instance
+dispatcher = LazyInstance(lambda: OutboxDispatcher(
+    manager,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL_SECONDS,
+    retention=timedelta(minutes=settings.OUTBOX_RETENTION_MINUTES),
+    redis_url=settings.REDIS_URL if settings.EVENTS_USE_REDIS else None
+))
@@ -0,0 +1,205 @@
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, NamedTuple, Optional, Tuple
+from ..config import settings, LazyInstance
+
+# Refill, spend and store a bucket in one step, using the Redis server clock
+# so workers with skewed clocks agree. Returns the seconds to wait as a
+# string (Lua numbers are truncated to integers on the way out).
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(retry_after)
+"""
+
+class RateLimit(NamedTuple):
+    rate: float  # tokens added per second
+    burst: float  # bucket capacity
+
+def per_minute(count: float, burst: float) -> RateLimit:
+    return RateLimit(count / 60.0, burst)
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class Overloaded(Exception):
+    """The worker is shedding load; the client should back off and retry"""
+    
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+class LocalTokenBuckets:
+    """Token buckets in this process's memory; exact for a single worker"""
+    
+    PRUNE_INTERVAL_SECONDS = 60.0
+    
+    def __init__(self):
+        # key -> (tokens, last update, time the bucket is full again)
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}
+        self.last_prune = time.monotonic()
+    
+    def take(self, key: str, limit: RateLimit, cost: float = 1.0) -> float:
+        """Spend `cost` tokens; returns 0 if allowed, else seconds until it would be"""
+        now = time.monotonic()
+        tokens, updated, _ = self.buckets.get(key, (limit.burst, now, now))
+        tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / limit.rate
+        self.buckets[key] = (tokens, now, now + (limit.burst - tokens) / limit.rate)
+        if now - self.last_prune > self.PRUNE_INTERVAL_SECONDS:
+            self._prune(now)
+        return retry_after
+    
+    def _prune(self, now: float):
+        """Forget buckets that have refilled; a missing bucket starts full anyway"""
+        self.last_prune = now
+        for key in [key for key, (_, _, full_at) in self.buckets.items() if full_at <= now]:
+            del self.buckets[key]
+
+class RedisTokenBuckets:
+    """Token buckets shared by every worker, updated atomically by a Lua script"""
+    
+    def __init__(self, redis):
+        self.script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+    
+    async def take(self, key: str, limit: RateLimit, cost: float = 1.0) -> float:
+        retry_after = await self.script(keys=[f"ratelimit:{key}"], args=[limit.rate, limit.burst, cost])
+        return float(retry_after)
+
+class RateLimiter:
+    """Per-user, per-route token buckets.
+    
+    Each route has its own limit, and each user has their own bucket for it,
+    so a client polling in a loop cannot starve its own sends. With a Redis
+    URL the buckets are shared across workers; if Redis is unreachable the
+    worker falls back to its local buckets instead of failing requests.
+    """
+    
+    def __init__(self, limits: Dict[str, RateLimit], redis_url: Optional[str] = None):
+        self.limits = limits
+        self.redis_url = redis_url
+        self.redis = None
+        self.shared: Optional[RedisTokenBuckets] = None
+        self.local = LocalTokenBuckets()
+    
+    async def check(self, route: str, user_id: str, cost: float = 1.0):
+        """Raise RateLimitExceeded if the user is over the route's limit"""
+        limit = self.limits.get(route)
+        if limit is None or limit.rate <= 0:
+            return
+        key = f"{route}:{user_id}"
+        retry_after = None
+        if self.shared is not None:
+            try:
+                retry_after = await self.shared.take(key, limit, cost)
+            except Exception as e:
+                print(f"Rate limiter Redis error, using local buckets: {e}")
+        if retry_after is None:
+            retry_after = self.local.take(key, limit, cost)
+        if retry_after > 0:
+            raise RateLimitExceeded(retry_after)
+    
+    async def start(self):
+        if self.redis_url and self.redis is None:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(self.redis_url, decode_responses=True)
+            self.shared = RedisTokenBuckets(self.redis)
+    
+    async def stop(self):
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+            self.shared = None
+
+class AdmissionController:
+    """Sheds requests while the worker is saturated, before they queue up.
+    
+    Two signals are watched: the number of Llama transformations in flight
+    (sends are refused past `max_transform_backlog`) and how long requests
+    recently waited to check out a database connection (everything that
+    would use the database is refused past `max_pool_wait`). Refusals carry
+    an estimate of when capacity frees up, used for Retry-After.
+    """
+    
+    # Smoothing for the moving averages; higher reacts faster
+    ALPHA = 0.2
+    # A slow checkout only counts as overload for this long without new samples
+    POOL_WAIT_WINDOW_SECONDS = 1.0
+    
+    def __init__(self, max_transform_backlog: int, max_pool_wait: float):
+        self.max_transform_backlog = max_transform_backlog
+        self.max_pool_wait = max_pool_wait
+        self.transform_backlog = 0
+        self.transform_seconds = 1.0
+        self.pool_wait = 0.0
+        self.pool_wait_at = 0.0
+    
+    @asynccontextmanager
+    async def transforming(self):
+        """Count a Llama call towards the backlog while it runs"""
+        self.transform_backlog += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.transform_backlog -= 1
+            elapsed = time.monotonic() - started
+            self.transform_seconds += self.ALPHA * (elapsed - self.transform_seconds)
+    
+    def record_pool_wait(self, seconds: float):
+        self.pool_wait += self.ALPHA * (seconds - self.pool_wait)
+        self.pool_wait_at = time.monotonic()
+    
+    def pool_saturated(self) -> bool:
+        if self.max_pool_wait <= 0 or self.pool_wait <= self.max_pool_wait:
+            return False
+        # A stale reading lets requests through again, and they take fresh ones
+        return time.monotonic() - self.pool_wait_at <= self.POOL_WAIT_WINDOW_SECONDS
+    
+    def check(self, transforms: bool = False):
+        """Raise Overloaded if this request should be shed"""
+        if self.pool_saturated():
+            raise Overloaded("Database is overloaded", max(self.pool_wait, self.POOL_WAIT_WINDOW_SECONDS))
+        if transforms and 0 < self.max_transform_backlog <= self.transform_backlog:
+            # Roughly one batch of transformations has to finish before there is room
+            raise Overloaded("Too many messages being transformed", self.transform_seconds)
+
+# Global rate limiter instance
+rate_limiter = LazyInstance(lambda: RateLimiter(
+    {
+        "send": per_minute(settings.RATE_LIMIT_SEND_PER_MINUTE, settings.RATE_LIMIT_SEND_BURST),
+        "broadcast": per_minute(settings.RATE_LIMIT_BROADCAST_PER_MINUTE, settings.RATE_LIMIT_BROADCAST_BURST),
+        **{
+            route: per_minute(settings.RATE_LIMIT_READ_PER_MINUTE, settings.RATE_LIMIT_READ_BURST)
+            for route in ("conversations", "messages", "poll", "sync")
+        }
+    } if settings.RATE_LIMIT_ENABLED else {},
+    redis_url=settings.REDIS_URL if settings.RATE_LIMIT_USE_REDIS else None
+))
+
+# Global admission controller instance
+admission = LazyInstance(lambda: AdmissionController(
+    max_transform_backlog=settings.ADMISSION_MAX_TRANSFORM_BACKLOG,
+    max_pool_wait=settings.ADMISSION_MAX_POOL_WAIT_MS / 1000.0
+))
@@ -0,0 +1,157 @@
+import asyncio
+from typing import Any, Dict, List, NamedTuple, Optional
+from sqlalchemy import select, insert, update, delete, func, tuple_, literal, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database.models import Conversation, Message, MessageArchive, MessageStatus
+from ..database.shards import shards
+from .conversation_cache import conversation_cache
+
+MESSAGE_COLUMNS = [column for column in Message.__table__.columns]
+ARCHIVE_COLUMNS = [column for column in MessageArchive.__table__.columns if column.name != "id"]
+
+class Move(NamedTuple):
+    conversation_id: str
+    source: int
+    target: int
+
+class ShardRebalancer:
+    """Moves conversations to the shard that hashing places them on now.
+    
+    After shards are appended, existing conversations stay where the
+    directory (conversations.shard) says until moved. A move copies the
+    messages and archive chunks to the target, points the directory at it,
+    waits `settle` seconds for in-flight sends to the old shard to finish
+    (and other workers to drop their cached directory entry), copies what
+    arrived meanwhile along with read receipts, then deletes the source
+    copy. Copies skip rows the target already has, so an interrupted run is
+    simply started again. Run it with the archiver off; with several
+    workers, only with CONVERSATION_CACHE_USE_REDIS so they hear of moves.
+    """
+    
+    def __init__(self, batch_size: int, settle: float):
+        self.batch_size = batch_size
+        self.settle = settle
+    
+    async def misplaced(self, db: AsyncSession, limit: Optional[int] = None) -> List[Move]:
+        """Conversations whose recorded shard differs from their hashed one"""
+        moves = []
+        result = await db.stream(select(Conversation.id, Conversation.shard).order_by(Conversation.id))
+        async for conversation_id, shard in result:
+            target = shards.place(conversation_id)
+            if target != shard:
+                moves.append(Move(conversation_id, shard, target))
+                if limit is not None and len(moves) >= limit:
+                    break
+        await result.close()
+        return moves
+    
+    async def status(self, db: AsyncSession) -> List[Dict[str, Any]]:
+        """Conversations, misplaced conversations and hot messages per shard"""
+        result = await db.execute(
+            select(Conversation.shard, func.count()).group_by(Conversation.shard)
+        )
+        conversations = dict(result.all())
+        leaving: Dict[int, int] = {}
+        for move in await self.misplaced(db):
+            leaving[move.source] = leaving.get(move.source, 0) + 1
+        report = []
+        for shard in shards.shards:
+            async with shard.session() as shard_db:
+                messages = (await shard_db.execute(select(func.count()).select_from(Message))).scalar()
+            report.append({
+                "shard": shard.index,
+                "conversations": conversations.get(shard.index, 0),
+                "to_move": leaving.get(shard.index, 0),
+                "messages": messages
+            })
+        return report
+    
+    async def _copy(self, conversation_id: str, source: AsyncSession, target: AsyncSession) -> int:
+        """Copy the conversation's messages and chunks the target lacks; returns messages copied"""
+        copied = 0
+        cursor = None
+        while True:
+            query = select(*MESSAGE_COLUMNS).where(Message.conversation_id == conversation_id)
+            if cursor is not None:
+                query = query.where(tuple_(Message.timestamp, Message.id) > tuple_(
+                    literal(cursor[0], Message.timestamp.type), literal(cursor[1], Message.id.type)
+                ))
+            rows = (await source.execute(
+                query.order_by(Message.timestamp, Message.id).limit(self.batch_size)
+            )).mappings().all()
+            await source.rollback()
+            if not rows:
+                break
+            cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+            present = set((await target.execute(
+                select(Message.id).where(Message.id.in_([row["id"] for row in rows]))
+            )).scalars().all())
+            missing = [dict(row) for row in rows if row["id"] not in present]
+            if missing:
+                await target.execute(insert(Message), missing)
+            # Read receipts written to the source since the last copy
+            read = [row["id"] for row in rows if row["is_read"] and row["id"] in present]
+            if read:
+                await target.execute(
+                    update(Message)
+                    .where(and_(Message.id.in_(read), Message.is_read == False))
+                    .values(is_read=True, status=MessageStatus.READ)
+                )
+            await target.commit()
+            copied += len(missing)
+        
+        chunks = (await source.execute(
+            select(*ARCHIVE_COLUMNS).where(MessageArchive.conversation_id == conversation_id)
+        )).mappings().all()
+        await source.rollback()
+        present = set((await target.execute(
+            select(MessageArchive.first_timestamp, MessageArchive.last_timestamp)
+            .where(MessageArchive.conversation_id == conversation_id)
+        )).all())
+        missing = [dict(chunk) for chunk in chunks if (chunk["first_timestamp"], chunk["last_timestamp"]) not in present]
+        if missing:
+            await target.execute(insert(MessageArchive), missing)
+            await target.commit()
+            copied += sum(chunk["message_count"] for chunk in missing)
+        return copied
+    
+    async def move(self, db: AsyncSession, moves: List[Move]) -> int:
+        """Move a batch of conversations; returns the number of messages moved"""
+        copied = 0
+        for move in moves:
+            async with shards.get(move.source).session() as source, shards.get(move.target).session() as target:
+                copied += await self._copy(move.conversation_id, source, target)
+        
+        # Point the directory at the new shards; the version bump refreshes ETags
+        for move in moves:
+            await db.execute(
+                update(Conversation)
+                .where(and_(Conversation.id == move.conversation_id, Conversation.shard == move.source))
+                .values(shard=move.target, version=Conversation.version + 1)
+            )
+        await db.commit()
+        for move in moves:
+            await conversation_cache.invalidate(move.conversation_id)
+        await asyncio.sleep(self.settle)
+        
+        for move in moves:
+            async with shards.get(move.source).session() as source, shards.get(move.target).session() as target:
+                copied += await self._copy(move.conversation_id, source, target)
+                await source.execute(delete(Message).where(Message.conversation_id == move.conversation_id))
+                await source.execute(
+                    delete(MessageArchive).where(MessageArchive.conversation_id == move.conversation_id)
+                )
+                await source.commit()
+        return copied
+    
+    async def rebalance(self, db: AsyncSession, limit: Optional[int] = None, batch: int = 50,
+                        dry_run: bool = False) -> Dict[str, Any]:
+        """Move up to `limit` misplaced conversations, `batch` at a time"""
+        moves = await self.misplaced(db, limit)
+        if dry_run:
+            return {"conversations": len(moves), "messages": 0}
+        messages = 0
+        for start in range(0, len(moves), batch):
+            messages += await self.move(db, moves[start:start + batch])
+            print(f"Moved {min(start + batch, len(moves))}/{len(moves)} conversations")
+        return {"conversations": len(moves), "messages": messages}
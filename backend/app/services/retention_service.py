@@ -0,0 +1,384 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import select, delete, update, func, tuple_, literal, or_, and_, true, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings, LazyInstance
+from ..database.connection import AsyncSessionLocal
+from ..database.shards import shards
+from ..database.models import User, Conversation, Message, MessageArchive, OutboxEvent, SyncLogEntry, LlmUsage, RetentionJob
+from .archive_service import encode_chunk, decode_chunk
+from .conversation_cache import conversation_cache
+from .directory_service import bump_users_generation
+
+class JobProgress:
+    """Per-phase cursor and counts, saved in the same transaction as each batch"""
+    
+    def __init__(self, name: Optional[str], kind: str, params: Dict[str, Any],
+                 phases: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.kind = kind
+        self.params = params
+        self.phases: Dict[str, Any] = phases or {}
+    
+    def phase(self, phase: str) -> Dict[str, Any]:
+        return self.phases.setdefault(phase, {"cursor": None, "deleted": 0, "done": False})
+    
+    def counts(self) -> Dict[str, int]:
+        return {phase: state["deleted"] for phase, state in self.phases.items()}
+    
+    async def save(self, db: AsyncSession, status: str = "running"):
+        if self.name is None:
+            return
+        values = {
+            "kind": self.kind,
+            "params": json.dumps(self.params),
+            "progress": json.dumps(self.phases),
+            "status": status,
+            "updated_at": datetime.utcnow()
+        }
+        job = await db.get(RetentionJob, self.name)
+        if job is None:
+            db.add(RetentionJob(name=self.name, started_at=datetime.utcnow(), **values))
+        else:
+            for key, value in values.items():
+                setattr(job, key, value)
+
+async def forget_conversations(db: AsyncSession, conversation_ids: List[str]):
+    """Drop cached metadata; done before the delete commits and again after, so a
+    send that reloads the entry in between cannot keep it"""
+    for conversation_id in conversation_ids:
+        await conversation_cache.invalidate(conversation_id)
+
+async def mark_users_deleted(db: AsyncSession, user_ids: List[str]):
+    await bump_users_generation(db)
+
+class RetentionService:
+    """Deletes data in small keyset-ordered batches at a bounded rate.
+    
+    Every batch is its own short transaction and the job sleeps between
+    batches so it never deletes faster than `max_rows_per_second`. Named
+    jobs record their cursor with each batch in retention_jobs; running the
+    same name again resumes where it stopped, or starts over once it is
+    done. `dry_run` only counts.
+    Messages and archive chunks are deleted on every shard in turn, with
+    one phase per shard; their progress is kept in the main database.
+    """
+    
+    def __init__(self, batch_size: int, max_rows_per_second: float):
+        self.batch_size = batch_size
+        self.max_rows_per_second = max_rows_per_second
+        self.task: Optional[asyncio.Task] = None
+    
+    async def _throttle(self, rows: int, started: float):
+        budget = rows / self.max_rows_per_second if self.max_rows_per_second > 0 else 0
+        await asyncio.sleep(max(0.0, budget - (time.monotonic() - started)))
+    
+    async def _start(self, db: AsyncSession, name: Optional[str], kind: str,
+                     params: Dict[str, Any]) -> JobProgress:
+        if name is not None:
+            job = await db.get(RetentionJob, name)
+            if job is not None and job.status == "done":
+                # A finished job is not resumed; its name starts a new run
+                job.started_at = datetime.utcnow()
+            elif job is not None:
+                if job.kind != kind:
+                    raise ValueError(f"Job {name} is a {job.kind} job")
+                # Resume with the parameters it was started with
+                return JobProgress(name, kind, json.loads(job.params), json.loads(job.progress))
+        return JobProgress(name, kind, params)
+    
+    async def _checkpoint(self, db: AsyncSession, progress: JobProgress, home: Optional[AsyncSession]):
+        """Commit a batch with its progress; a batch on another shard commits first"""
+        if home is None or home is db:
+            await progress.save(db)
+            await db.commit()
+            return
+        await db.commit()
+        await progress.save(home)
+        await home.commit()
+    
+    async def _finish(self, db: AsyncSession, progress: JobProgress, dry_run: bool) -> Dict[str, Any]:
+        if not dry_run:
+            await progress.save(db, status="done")
+            await db.commit()
+        return {"job": progress.name, "dry_run": dry_run, "deleted": progress.counts()}
+    
+    async def _delete_keyset(self, db: AsyncSession, progress: JobProgress, phase: str, model,
+                             keys: List[Any], where, dry_run: bool,
+                             before_delete: Optional[Callable] = None, after_delete: Optional[Callable] = None,
+                             home: Optional[AsyncSession] = None):
+        """Delete rows matching `where` in `keys` order; the last key must be unique.
+        
+        `before_delete(db, ids)` runs in each batch's transaction, `after_delete(db, ids)` once it committed.
+        """
+        state = progress.phase(phase)
+        if state["done"]:
+            return
+        if dry_run:
+            result = await db.execute(select(func.count()).select_from(model).where(where))
+            state["deleted"] = result.scalar()
+            return
+        
+        id_column = keys[-1]
+        while True:
+            started = time.monotonic()
+            stmt = select(*keys).where(where)
+            if state["cursor"] is not None:
+                cursor = [
+                    literal(datetime.fromisoformat(value) if isinstance(key.type, DateTime) else value, key.type)
+                    for key, value in zip(keys, state["cursor"])
+                ]
+                stmt = stmt.where(tuple_(*keys) > tuple_(*cursor))
+            rows = (await db.execute(stmt.order_by(*keys).limit(self.batch_size))).all()
+            if not rows:
+                state["done"] = True
+                await self._checkpoint(db, progress, home)
+                return
+            
+            ids = [row[-1] for row in rows]
+            if before_delete is not None:
+                await before_delete(db, ids)
+            await db.execute(delete(model).where(id_column.in_(ids)))
+            state["cursor"] = [value.isoformat() if isinstance(value, datetime) else value for value in rows[-1]]
+            state["deleted"] += len(rows)
+            await self._checkpoint(db, progress, home)
+            if after_delete is not None:
+                await after_delete(db, ids)
+            await self._throttle(len(rows), started)
+    
+    async def _prune_archive(self, db: AsyncSession, progress: JobProgress, where, dry_run: bool,
+                             keep: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                             phase: str = "archived_messages", home: Optional[AsyncSession] = None):
+        """Drop archived messages from matching chunks; `keep` selects survivors (None drops all)"""
+        state = progress.phase(phase)
+        if state["done"]:
+            return
+        chunks_per_batch = max(1, self.batch_size // settings.ARCHIVE_CHUNK_SIZE)
+        cursor = state["cursor"] or 0
+        while True:
+            started = time.monotonic()
+            result = await db.execute(
+                select(MessageArchive.id, MessageArchive.codec, MessageArchive.payload, MessageArchive.message_count)
+                .where(and_(where, MessageArchive.id > cursor))
+                .order_by(MessageArchive.id)
+                .limit(chunks_per_batch)
+            )
+            chunks = result.all()
+            if not chunks:
+                state["done"] = True
+                if not dry_run:
+                    await self._checkpoint(db, progress, home)
+                return
+            
+            removed = 0
+            for chunk_id, codec, payload, count in chunks:
+                survivors = [] if keep is None else [m for m in decode_chunk(codec, payload) if keep(m)]
+                removed += count - len(survivors)
+                if dry_run or len(survivors) == count:
+                    continue
+                if not survivors:
+                    await db.execute(delete(MessageArchive).where(MessageArchive.id == chunk_id))
+                    continue
+                for message in survivors:
+                    message["timestamp"] = message["timestamp"].isoformat()
+                codec, payload = encode_chunk(survivors)
+                await db.execute(
+                    update(MessageArchive).where(MessageArchive.id == chunk_id).values(
+                        codec=codec,
+                        payload=payload,
+                        message_count=len(survivors),
+                        first_timestamp=datetime.fromisoformat(survivors[0]["timestamp"]),
+                        last_timestamp=datetime.fromisoformat(survivors[-1]["timestamp"])
+                    )
+                )
+            cursor = chunks[-1][0]
+            state["cursor"] = cursor
+            state["deleted"] += removed
+            if not dry_run:
+                await self._checkpoint(db, progress, home)
+                await self._throttle(removed, started)
+    
+    def _user_conversations(self, user_id: str):
+        return select(Conversation.id).where(
+            or_(Conversation.user1_id == user_id, Conversation.user2_id == user_id)
+        )
+    
+    async def _conversation_filter(self, db: AsyncSession, user_id: str):
+        """The user's conversation ids for IN (); a list when shards cannot run the subquery"""
+        conversations = self._user_conversations(user_id)
+        if not shards.sharded:
+            return conversations
+        return (await db.execute(conversations)).scalars().all()
+    
+    async def _on_shards(self, db: AsyncSession, work: Callable):
+        """Run `work(shard_db, suffix)` on each shard in turn; `suffix` keeps their phases apart"""
+        for shard in shards.shards:
+            async with shards.session(shard.index, db) as shard_db:
+                await work(shard_db, f"@shard{shard.index}" if shard.index else "")
+    
+    async def delete_messages(self, db: AsyncSession, older_than: Optional[datetime] = None,
+                              conversation_id: Optional[str] = None, user_id: Optional[str] = None,
+                              dry_run: bool = False, job_name: Optional[str] = None) -> Dict[str, Any]:
+        """Delete hot and archived messages by age, conversation and/or sender"""
+        params = {
+            "older_than": older_than.isoformat() if older_than else None,
+            "conversation_id": conversation_id,
+            "user_id": user_id
+        }
+        progress = await self._start(db, job_name, "messages", params)
+        params = progress.params
+        older_than = datetime.fromisoformat(params["older_than"]) if params["older_than"] else None
+        conversation_id, user_id = params["conversation_id"], params["user_id"]
+        if older_than is None and conversation_id is None and user_id is None:
+            raise ValueError("Give at least one of older_than, conversation_id or user_id")
+        
+        conditions = []
+        if older_than is not None:
+            conditions.append(Message.timestamp < older_than)
+        if conversation_id is not None:
+            conditions.append(Message.conversation_id == conversation_id)
+        if user_id is not None:
+            conditions.append(Message.sender_id == user_id)
+        
+        chunk_conditions = []
+        if older_than is not None:
+            chunk_conditions.append(MessageArchive.first_timestamp < older_than)
+        if conversation_id is not None:
+            chunk_conditions.append(MessageArchive.conversation_id == conversation_id)
+        if user_id is not None:
+            chunk_conditions.append(MessageArchive.conversation_id.in_(await self._conversation_filter(db, user_id)))
+        
+        def keep(message: Dict[str, Any]) -> bool:
+            return not (
+                (older_than is None or message["timestamp"] < older_than)
+                and (user_id is None or message["sender_id"] == user_id)
+            )
+        
+        async def delete_on_shard(shard_db: AsyncSession, suffix: str):
+            await self._delete_keyset(
+                shard_db, progress, "messages" + suffix, Message, [Message.timestamp, Message.id],
+                and_(*conditions), dry_run, home=db
+            )
+            await self._prune_archive(
+                shard_db, progress, and_(*chunk_conditions), dry_run, keep,
+                phase="archived_messages" + suffix, home=db
+            )
+        await self._on_shards(db, delete_on_shard)
+        return await self._finish(db, progress, dry_run)
+    
+    async def delete_user(self, db: AsyncSession, user_id: str, dry_run: bool = False,
+                          job_name: Optional[str] = None) -> Dict[str, Any]:
+        """Delete an account with all its conversations and their messages"""
+        progress = await self._start(db, job_name, "user", {"user_id": user_id})
+        user_id = progress.params["user_id"]
+        conversations = await self._conversation_filter(db, user_id)
+        
+        async def delete_on_shard(shard_db: AsyncSession, suffix: str):
+            await self._delete_keyset(
+                shard_db, progress, "messages" + suffix, Message, [Message.timestamp, Message.id],
+                Message.conversation_id.in_(conversations), dry_run, home=db
+            )
+            await self._prune_archive(
+                shard_db, progress, MessageArchive.conversation_id.in_(conversations), dry_run,
+                phase="archived_messages" + suffix, home=db
+            )
+        await self._on_shards(db, delete_on_shard)
+        
+        async def clear_messages(shard_db: AsyncSession, ids: List[str]):
+            await shard_db.execute(delete(Message).where(Message.conversation_id.in_(ids)))
+            await shard_db.execute(delete(MessageArchive).where(MessageArchive.conversation_id.in_(ids)))
+            if shard_db is not db:
+                await shard_db.commit()
+        
+        async def clear_conversations(db: AsyncSession, ids: List[str]):
+            # Stop sends from using cached metadata before the rows go
+            await forget_conversations(db, ids)
+            # Messages the partner sent since the first phase
+            by_shard: Dict[int, List[str]] = {0: ids}
+            if shards.sharded:
+                by_shard = {}
+                result = await db.execute(select(Conversation.id, Conversation.shard).where(Conversation.id.in_(ids)))
+                for conversation_id, shard in result.all():
+                    by_shard.setdefault(shard, []).append(conversation_id)
+            await shards.gather(db, by_shard, clear_messages)
+        await self._delete_keyset(
+            db, progress, "conversations", Conversation, [Conversation.id],
+            or_(Conversation.user1_id == user_id, Conversation.user2_id == user_id), dry_run,
+            before_delete=clear_conversations, after_delete=forget_conversations
+        )
+        await self._delete_keyset(
+            db, progress, "sync_log", SyncLogEntry, [SyncLogEntry.seq], SyncLogEntry.user_id == user_id, dry_run
+        )
+        await self._delete_keyset(
+            db, progress, "llm_usage", LlmUsage, [LlmUsage.id], LlmUsage.user_id == user_id, dry_run
+        )
+        await self._delete_keyset(
+            db, progress, "users", User, [User.id], User.id == user_id, dry_run, before_delete=mark_users_deleted
+        )
+        return await self._finish(db, progress, dry_run)
+    
+    async def clear_all(self, db: AsyncSession, dry_run: bool = False,
+                        job_name: Optional[str] = None) -> Dict[str, Any]:
+        """Delete every message, conversation and user"""
+        progress = await self._start(db, job_name, "clear_all", {})
+        
+        async def clear_shard(shard_db: AsyncSession, suffix: str):
+            await self._delete_keyset(
+                shard_db, progress, "messages" + suffix, Message, [Message.timestamp, Message.id], true(), dry_run,
+                home=db
+            )
+            await self._prune_archive(shard_db, progress, true(), dry_run, phase="archived_messages" + suffix, home=db)
+        await self._on_shards(db, clear_shard)
+        await self._delete_keyset(db, progress, "outbox_events", OutboxEvent, [OutboxEvent.id], true(), dry_run)
+        await self._delete_keyset(db, progress, "sync_log", SyncLogEntry, [SyncLogEntry.seq], true(), dry_run)
+        await self._delete_keyset(db, progress, "llm_usage", LlmUsage, [LlmUsage.id], true(), dry_run)
+        await self._delete_keyset(
+            db, progress, "conversations", Conversation, [Conversation.id], true(), dry_run,
+            before_delete=forget_conversations, after_delete=forget_conversations
+        )
+        await self._delete_keyset(
+            db, progress, "users", User, [User.id], true(), dry_run, before_delete=mark_users_deleted
+        )
+        return await self._finish(db, progress, dry_run)
+    
+    async def delete_user_job(self, user_id: str):
+        """Background account deletion with its own session; resumable under a fixed name"""
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await self.delete_user(db, user_id, job_name=f"delete-user-{user_id}")
+            print(f"Deleted account {user_id}: {result['deleted']}")
+        except Exception as e:
+            print(f"Account deletion for {user_id} failed: {type(e).__name__}: {e}")
+    
+    async def run_age_retention(self, retention: timedelta, interval: float):
+        """Periodically delete messages older than `retention`"""
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    result = await self.delete_messages(db, older_than=datetime.utcnow() - retention)
+                deleted = sum(result["deleted"].values())
+                if deleted:
+                    print(f"Retention deleted {deleted} messages")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Retention error: {type(e).__name__}: {e}")
+            await asyncio.sleep(interval)
+    
+    def start(self, retention: timedelta, interval: float):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run_age_retention(retention, interval))
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+# Global retention service instance
+retention = LazyInstance(lambda: RetentionService(
+    batch_size=settings.RETENTION_BATCH_SIZE,
+    max_rows_per_second=settings.RETENTION_MAX_ROWS_PER_SECOND
+))
@@ -0,0 +1,163 @@
+import re
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_, text, bindparam
+from ..database.ids import GUID
+from ..database.models import Conversation, MESSAGE_SEARCH_SQLITE_DDL, MESSAGE_SEARCH_POSTGRES_DDL, MESSAGE_SEARCH_VECTOR
+from ..database.shards import shards
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+
+class SearchService:
+    """Ranked full-text search over the messages in a user's conversations"""
+    
+    MAX_LIMIT = 50
+    
+    def build_fts5_query(self, query: str) -> str:
+        """Turn free text into a safe FTS5 query: every word must match, the last as a prefix"""
+        words = re.findall(r"\w+", query)
+        if not words:
+            return ""
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += "*"
+        return " ".join(terms)
+    
+    async def search_messages(self, user_id: str, query: str, db: AsyncSession,
+                              limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """Search original and transformed content, best matches first"""
+        limit = max(1, min(limit, self.MAX_LIMIT))
+        
+        if not shards.sharded:
+            # Fetch one extra row to know whether there is another page
+            rows = await self._search(query, user_id, db, limit + 1, offset)
+        else:
+            result = await db.execute(
+                select(Conversation.id, Conversation.shard)
+                .where(or_(Conversation.user1_id == user_id, Conversation.user2_id == user_id))
+            )
+            by_shard: Dict[int, List[str]] = {}
+            for conversation_id, shard in result.all():
+                by_shard.setdefault(shard, []).append(conversation_id)
+            # The page is among the first offset + limit + 1 matches of every shard
+            found = await shards.gather(
+                db, by_shard,
+                lambda shard_db, ids: self._search(query, user_id, shard_db, offset + limit + 1, 0, ids)
+            )
+            descending = db.bind.dialect.name == "postgresql"
+            rows = sorted(
+                (row for shard_rows in found.values() for row in shard_rows),
+                key=lambda row: -row.rank if descending else row.rank
+            )[offset:offset + limit + 1]
+        
+        results: List[Dict[str, Any]] = []
+        for row in rows[:limit]:
+            timestamp = row.timestamp
+            if isinstance(timestamp, str):
+                # Raw SQL on SQLite returns the stored text
+                timestamp = datetime.fromisoformat(timestamp)
+            results.append({
+                "message_id": row.id,
+                "conversation_id": row.conversation_id,
+                "sender_id": row.sender_id,
+                "is_mine": row.sender_id == user_id,
+                "snippet": row.snippet,
+                "timestamp": timestamp.isoformat(),
+                "rank": float(row.rank)
+            })
+        
+        return {
+            "results": results,
+            "next_offset": offset + limit if len(rows) > limit else None
+        }
+    
+    async def _search(self, query: str, user_id: str, db: AsyncSession, limit: int, offset: int,
+                      conversation_ids: Optional[List[str]] = None) -> List[Any]:
+        """Matching rows from one database, in the user's conversations or `conversation_ids`"""
+        dialect = db.bind.dialect.name
+        # On a shard the conversations are not there to join, so their ids are passed in
+        if conversation_ids is None:
+            scope = "JOIN conversations c ON c.id = m.conversation_id"
+            condition = "(c.user1_id = :user_id OR c.user2_id = :user_id)"
+        else:
+            scope = ""
+            condition = "m.conversation_id IN :conversation_ids"
+        
+        if dialect == "sqlite":
+            match = self.build_fts5_query(query)
+            if not match:
+                return []
+            # bm25 is lower-is-better; snippet column -1 picks the best matching column
+            stmt = text(f"""
+                SELECT m.id, m.conversation_id, m.sender_id, m.timestamp,
+                       snippet(messages_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet,
+                       bm25(messages_fts) AS rank
+                FROM messages_fts
+                JOIN message_search_docs d ON d.doc_id = messages_fts.rowid
+                JOIN messages m ON m.id = d.message_id
+                {scope}
+                WHERE messages_fts MATCH :match
+                  AND {condition}
+                ORDER BY rank
+                LIMIT :limit OFFSET :offset
+            """)
+        elif dialect == "postgresql":
+            match = query.strip()
+            if not match:
+                return []
+            stmt = text(f"""
+                SELECT m.id, m.conversation_id, m.sender_id, m.timestamp,
+                       ts_headline('simple', m.transformed_content || ' ' || m.original_content,
+                                   websearch_to_tsquery('simple', :match),
+                                   'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords=24, MinWords=8') AS snippet,
+                       ts_rank({MESSAGE_SEARCH_VECTOR}, websearch_to_tsquery('simple', :match)) AS rank
+                FROM messages m
+                {scope}
+                WHERE {MESSAGE_SEARCH_VECTOR} @@ websearch_to_tsquery('simple', :match)
+                  AND {condition}
+                ORDER BY rank DESC
+                LIMIT :limit OFFSET :offset
+            """)
+        else:
+            raise NotImplementedError(f"Message search is not supported on {dialect}")
+        
+        # Ids are stored as uuid/blob, so raw SQL needs the column type to convert them
+        params = {"match": match, "limit": limit, "offset": offset}
+        if conversation_ids is None:
+            stmt = stmt.bindparams(bindparam("user_id", type_=GUID))
+            params["user_id"] = user_id
+        else:
+            stmt = stmt.bindparams(bindparam("conversation_ids", type_=GUID, expanding=True))
+            params["conversation_ids"] = conversation_ids
+        stmt = stmt.columns(id=GUID, conversation_id=GUID, sender_id=GUID)
+        result = await db.execute(stmt, params)
+        return result.all()
+    
+    async def rebuild_index(self, db: AsyncSession) -> int:
+        """Create the search structures if missing and re-index every message.
+        
+        Needed once for databases created before search existed.
+        """
+        dialect = db.bind.dialect.name
+        if dialect == "postgresql":
+            for statement in MESSAGE_SEARCH_POSTGRES_DDL:
+                await db.execute(text(statement))
+            await db.commit()
+            count = await db.execute(text("SELECT count(*) FROM messages"))
+            return count.scalar_one()
+        
+        for statement in MESSAGE_SEARCH_SQLITE_DDL:
+            await db.execute(text(statement))
+        await db.execute(text("DELETE FROM messages_fts"))
+        await db.execute(text("DELETE FROM message_search_docs"))
+        await db.execute(text(
+            "INSERT INTO message_search_docs (message_id) SELECT id FROM messages"
+        ))
+        result = await db.execute(text("""
+            INSERT INTO messages_fts (rowid, original_content, transformed_content)
+            SELECT d.doc_id, m.original_content, m.transformed_content
+            FROM message_search_docs d JOIN messages m ON m.id = d.message_id
+        """))
+        await db.commit()
+        return result.rowcount
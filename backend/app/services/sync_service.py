@@ -0,0 +1,93 @@
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from sqlalchemy import select, delete, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings, LazyInstance
+from ..database.models import SyncLogEntry
+
+class SyncService:
+    """Per-user change log that lets a reconnecting client catch up cheaply.
+    
+    Every outbox event (new messages, reads, tone changes, new conversations)
+    is copied into `sync_log` once per recipient as the dispatcher drains it.
+    Drains are serialized, so seqs are handed out in commit order and a client
+    that has seen seq N has seen everything before it. `changes` pages
+    through one user's entries after a seq using ix_sync_log_user_seq.
+    
+    Entries older than the retention are pruned; a client whose cursor falls
+    behind the oldest kept seq is told to reset and refetch everything.
+    """
+    
+    MAX_LIMIT = 1000
+    
+    def __init__(self, retention: timedelta, batch_size: int):
+        self.retention = retention
+        self.batch_size = batch_size
+    
+    async def append(self, db: AsyncSession, events: List[Dict[str, Any]]):
+        """Log drained events in the dispatcher's transaction, in batch order"""
+        rows = []
+        next_seq = (await db.execute(select(func.max(SyncLogEntry.seq)))).scalar() or 0
+        now = datetime.utcnow()
+        for event in events:
+            data = event["data"]
+            payload = json.dumps(data)
+            for user_id in event["recipients"]:
+                next_seq += 1
+                rows.append({
+                    "seq": next_seq,
+                    "user_id": user_id,
+                    "event_id": data["event_id"],
+                    "event_type": data["type"],
+                    "conversation_id": data["conversation_id"],
+                    "payload": payload,
+                    "created_at": now
+                })
+        if rows:
+            await db.execute(insert(SyncLogEntry), rows)
+    
+    async def changes(self, user_id: str, after: int, db: AsyncSession, limit: int = 500) -> Dict[str, Any]:
+        """Get one page of a user's changes with seq > after"""
+        limit = max(1, min(limit, self.MAX_LIMIT))
+        oldest = (await db.execute(select(func.min(SyncLogEntry.seq)))).scalar()
+        if oldest is not None and after < oldest - 1:
+            # Entries past the cursor may have been pruned
+            latest = (await db.execute(select(func.max(SyncLogEntry.seq)))).scalar()
+            return {"changes": [], "next": latest, "has_more": False, "reset": True}
+        
+        result = await db.execute(
+            select(SyncLogEntry.seq, SyncLogEntry.payload)
+            .where(SyncLogEntry.user_id == user_id, SyncLogEntry.seq > after)
+            .order_by(SyncLogEntry.seq)
+            .limit(limit + 1)
+        )
+        rows = result.all()
+        changes = []
+        for seq, payload in rows[:limit]:
+            change = json.loads(payload)
+            change["seq"] = seq
+            changes.append(change)
+        return {
+            "changes": changes,
+            "next": changes[-1]["seq"] if changes else after,
+            "has_more": len(rows) > limit,
+            "reset": False
+        }
+    
+    async def prune(self, db: AsyncSession):
+        """Delete one batch of entries past retention, always keeping the newest"""
+        cutoff = datetime.utcnow() - self.retention
+        latest = select(func.max(SyncLogEntry.seq)).scalar_subquery()
+        seqs = select(SyncLogEntry.seq).where(
+            SyncLogEntry.created_at < cutoff,
+            SyncLogEntry.seq < latest
+        ).order_by(SyncLogEntry.seq).limit(self.batch_size * 10)
+        await db.execute(delete(SyncLogEntry).where(SyncLogEntry.seq.in_(seqs)))
+        await db.commit()
+
+# Global sync log instance
+sync_log = LazyInstance(lambda: SyncService(
+    retention=timedelta(days=settings.SYNC_LOG_RETENTION_DAYS),
+    batch_size=settings.OUTBOX_BATCH_SIZE
+))
@@ -0,0 +1,245 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import select, func, insert, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings, LazyInstance
+from ..database.connection import AsyncSessionLocal
+from ..database.models import User, LlmUsage
+
+# Rough English average, used when the API does not report counts and to
+# size a call before it is made
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+class TokenUsage(NamedTuple):
+    prompt_tokens: int
+    completion_tokens: int
+    truncated: bool = False
+    estimated: bool = False
+    
+    @property
+    def total(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+def usage_from_response(resp_json: Dict[str, Any], prompt: str, completion: str) -> TokenUsage:
+    """Token counts from a Llama API response, estimated if it has none"""
+    # Llama API reports a list of metrics; OpenAI-compatible endpoints a usage object
+    metrics = {
+        metric.get("metric"): metric.get("value")
+        for metric in resp_json.get("metrics") or []
+        if isinstance(metric, dict)
+    }
+    usage = resp_json.get("usage") or {}
+    prompt_tokens = metrics.get("num_prompt_tokens", usage.get("prompt_tokens"))
+    completion_tokens = metrics.get("num_completion_tokens", usage.get("completion_tokens"))
+    stop_reason = (resp_json.get("completion_message") or {}).get("stop_reason")
+    truncated = stop_reason in ("length", "max_tokens")
+    if prompt_tokens is None or completion_tokens is None:
+        return TokenUsage(estimate_tokens(prompt), estimate_tokens(completion), truncated, estimated=True)
+    return TokenUsage(int(prompt_tokens), int(completion_tokens), truncated)
+
+def start_of_day(now: datetime) -> datetime:
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+class TokenBudgetExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Daily token budget exceeded")
+        self.retry_after = retry_after
+
+class UsageTracker:
+    """Token accounting for Llama calls, with per-user daily budgets.
+    
+    `record` keeps a row per call in memory; a background task writes them
+    to llm_usage with one INSERT per batch. `reserve` runs before a call:
+    it adds the user's tokens for the UTC day (from llm_usage, re-read every
+    `refresh_interval`), this worker's unwritten rows and its in-flight
+    reservations, and refuses the call if its worst case would go over
+    budget. The worst case stays reserved until the call finishes, so
+    concurrent sends cannot overshoot together. Across workers a budget can
+    be exceeded by what the others used since the last refresh.
+    """
+    
+    def __init__(self, default_budget: int, batch_size: int, flush_interval: float,
+                 refresh_interval: float):
+        self.default_budget = default_budget
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        # Rows not yet committed, including a batch being written
+        self.pending: List[Dict[str, Any]] = []
+        self.writing: List[Dict[str, Any]] = []
+        self.reserved: Dict[str, int] = {}
+        # user_id -> (day, tokens in llm_usage that day, budget override, read at)
+        self.stored: Dict[str, Tuple[datetime, int, Optional[int], float]] = {}
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+    
+    def unwritten_tokens(self, user_id: str) -> int:
+        return sum(
+            row["prompt_tokens"] + row["completion_tokens"]
+            for row in self.writing + self.pending
+            if row["user_id"] == user_id
+        )
+    
+    async def _stored_usage(self, user_id: str) -> Tuple[int, Optional[int]]:
+        """The user's committed tokens today and their budget override"""
+        day = start_of_day(datetime.utcnow())
+        cached = self.stored.get(user_id)
+        if cached and cached[0] == day and time.monotonic() - cached[3] < self.refresh_interval:
+            return cached[1], cached[2]
+        async with AsyncSessionLocal() as db:
+            used = (await db.execute(
+                select(func.coalesce(func.sum(LlmUsage.prompt_tokens + LlmUsage.completion_tokens), 0))
+                .where(LlmUsage.user_id == user_id, LlmUsage.created_at >= day)
+            )).scalar()
+            budget = (await db.execute(select(User.daily_token_budget).where(User.id == user_id))).scalar()
+        self.stored[user_id] = (day, used, budget, time.monotonic())
+        return used, budget
+    
+    def forget(self, user_id: str):
+        """Re-read the user's usage and budget on their next call"""
+        self.stored.pop(user_id, None)
+    
+    async def budget_status(self, user_id: str) -> Dict[str, Optional[int]]:
+        used, budget = await self._stored_usage(user_id)
+        budget = self.default_budget if budget is None else budget
+        used += self.unwritten_tokens(user_id) + self.reserved.get(user_id, 0)
+        return {
+            "budget": budget or None,
+            "used": used,
+            "remaining": max(budget - used, 0) if budget else None
+        }
+    
+    @asynccontextmanager
+    async def reserve(self, user_id: str, tokens: int):
+        """Hold `tokens` against the user's budget for the duration of a call"""
+        status = await self.budget_status(user_id)
+        if status["budget"] and status["used"] + tokens > status["budget"]:
+            now = datetime.utcnow()
+            raise TokenBudgetExceeded((start_of_day(now) + timedelta(days=1) - now).total_seconds())
+        self.reserved[user_id] = self.reserved.get(user_id, 0) + tokens
+        try:
+            yield
+        finally:
+            self.reserved[user_id] -= tokens
+            if not self.reserved[user_id]:
+                del self.reserved[user_id]
+    
+    def record(self, user_id: str, tone: str, usage: TokenUsage, max_tokens: int, latency: float,
+               message_id: Optional[str] = None, message_count: int = 1):
+        self.pending.append({
+            "user_id": user_id,
+            "message_id": message_id,
+            "message_count": message_count,
+            "tone": tone,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "max_tokens": max_tokens,
+            "truncated": usage.truncated,
+            "estimated": usage.estimated,
+            "latency_ms": round(latency * 1000),
+            "created_at": datetime.utcnow()
+        })
+        if len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+    
+    async def flush(self):
+        """Write everything recorded so far"""
+        while self.pending:
+            self.writing, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(LlmUsage), self.writing)
+                    await db.commit()
+                # Committed rows now count through the cached totals
+                for row in self.writing:
+                    cached = self.stored.get(row["user_id"])
+                    if cached and row["created_at"] >= cached[0]:
+                        tokens = row["prompt_tokens"] + row["completion_tokens"]
+                        self.stored[row["user_id"]] = (cached[0], cached[1] + tokens, cached[2], cached[3])
+            except BaseException:
+                # Keep the rows for the next attempt, also when cancelled mid-write
+                self.pending = self.writing + self.pending
+                raise
+            finally:
+                self.writing = []
+    
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Usage flush error: {type(e).__name__}: {e}")
+            # Drop cached totals nobody has used for a while
+            cutoff = time.monotonic() - self.refresh_interval * 10
+            for user_id in [user_id for user_id, entry in self.stored.items() if entry[3] < cutoff]:
+                del self.stored[user_id]
+    
+    async def summary(self, db: AsyncSession, since: datetime,
+                      user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Calls and tokens per user and tone since `since`, committed rows only"""
+        stmt = (
+            select(
+                LlmUsage.user_id,
+                LlmUsage.tone,
+                func.count(LlmUsage.id),
+                func.sum(LlmUsage.message_count),
+                func.sum(LlmUsage.prompt_tokens),
+                func.sum(LlmUsage.completion_tokens),
+                func.sum(case((LlmUsage.truncated, 1), else_=0))
+            )
+            .where(LlmUsage.created_at >= since)
+            .group_by(LlmUsage.user_id, LlmUsage.tone)
+        )
+        if user_id:
+            stmt = stmt.where(LlmUsage.user_id == user_id)
+        return [
+            {
+                "user_id": row[0],
+                "tone": row[1],
+                "calls": row[2],
+                "messages": row[3],
+                "prompt_tokens": row[4],
+                "completion_tokens": row[5],
+                "truncated": row[6]
+            }
+            for row in (await db.execute(stmt)).all()
+        ]
+    
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Usage flush error: {type(e).__name__}: {e}")
+
+# Global usage tracker instance
+usage_tracker = LazyInstance(lambda: UsageTracker(
+    default_budget=settings.LLM_DAILY_TOKEN_BUDGET,
+    batch_size=settings.USAGE_FLUSH_BATCH_SIZE,
+    flush_interval=settings.USAGE_FLUSH_INTERVAL_SECONDS,
+    refresh_interval=settings.USAGE_BUDGET_REFRESH_SECONDS
+))
@@ -1,39 +1,213 @@
-from typing import Dict, List
+from typing import Dict, Iterable, Optional, Set
 from fastapi import WebSocket
+import asyncio
 import json
+from ..config import settings, LazyInstance
+
+# What to do when a client's outbound queue is full
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DISCONNECT = "disconnect"
+
+class ClientConnection:
+    """A WebSocket with its own bounded outbound queue and writer task.
+    
+    Senders only ever enqueue, so one slow or dead client cannot stall
+    delivery to anyone else.
+    """
+    
+    def __init__(self, websocket: WebSocket, user_id: str, queue_size: int, send_timeout: float):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.send_timeout = send_timeout
+        self.last_seen = asyncio.get_running_loop().time()
+        self.dropped = 0
+        self.writer_task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.sending = False
+    
+    def enqueue(self, message: str, overflow_policy: str) -> bool:
+        """Queue a serialized message; returns False if the client must be dropped"""
+        if self.closed:
+            return False
+        if self.queue.full():
+            if overflow_policy == OVERFLOW_DISCONNECT:
+                return False
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+        return True
+    
+    def touch(self):
+        """Record that the client is alive (any inbound frame counts as a pong)"""
+        self.last_seen = asyncio.get_running_loop().time()
+    
+    async def run_writer(self, on_failure):
+        try:
+            while True:
+                message = await self.queue.get()
+                self.sending = True
+                await asyncio.wait_for(self.websocket.send_text(message), self.send_timeout)
+                self.sending = False
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Send failed or timed out: treat the socket as dead
+            on_failure(self)
+    
+    async def close(self, code: int = 1000):
+        self.closed = True
+        if self.writer_task and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), self.send_timeout)
+        except Exception:
+            pass
 
 class ConnectionManager:
-    def __init__(self):
-        # Store active connections by user_id
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    def __init__(self, subscriber_queue_size: int = 100, send_queue_size: int = 256,
+                 send_timeout: float = 10.0, overflow_policy: str = OVERFLOW_DROP_OLDEST,
+                 ping_interval: float = 20.0, pong_timeout: float = 60.0):
+        # Store active connections by user_id, keyed by socket for O(1) removal
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        # In-process event queues by user_id (SSE streams and long-polls)
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.subscriber_queue_size = subscriber_queue_size
+        self.send_queue_size = send_queue_size
+        self.send_timeout = send_timeout
+        self.overflow_policy = overflow_policy
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        # Strong references to background close tasks until they finish
+        self.closing_tasks: Set[asyncio.Task] = set()
     
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def connect(self, websocket: WebSocket, user_id: str) -> ClientConnection:
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+        connection = ClientConnection(websocket, user_id, self.send_queue_size, self.send_timeout)
+        connection.writer_task = asyncio.create_task(connection.run_writer(self._drop))
+        self.active_connections.setdefault(user_id, {})[websocket] = connection
+        return connection
     
     def disconnect(self, websocket: WebSocket, user_id: str):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
+        connections = self.active_connections.get(user_id)
+        if connections is None:
+            return
+        connection = connections.pop(websocket, None)
+        if not connections:
+            del self.active_connections[user_id]
+        if connection:
+            connection.closed = True
+            if connection.writer_task and connection.writer_task is not asyncio.current_task():
+                connection.writer_task.cancel()
+    
+    def _drop(self, connection: ClientConnection, code: int = 1011):
+        """Remove a failed or overflowing client and close its socket in the background"""
+        self.disconnect(connection.websocket, connection.user_id)
+        task = asyncio.create_task(connection.close(code=code))
+        self.closing_tasks.add(task)
+        task.add_done_callback(self.closing_tasks.discard)
+    
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self.active_connections.values())
+    
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        """Register an in-process listener for a user's events"""
+        queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue, user_id: str):
+        if user_id in self.subscribers:
+            self.subscribers[user_id].discard(queue)
+            if not self.subscribers[user_id]:
+                del self.subscribers[user_id]
+    
+    def publish_to_subscribers(self, data: dict, user_id: str):
+        for queue in self.subscribers.get(user_id, ()):
+            if queue.full():
+                # Slow listener: drop its oldest event rather than block the sender
+                queue.get_nowait()
+            queue.put_nowait(data)
+    
+    def _fan_out(self, message: str, connections: Iterable[ClientConnection]):
+        # Snapshot first: dropping a client mutates the connection dicts
+        for connection in list(connections):
+            if not connection.enqueue(message, self.overflow_policy):
+                # 1008 (policy violation) tells the client it fell too far behind
+                self._drop(connection, code=1008)
     
     async def send_personal_message(self, message: str, user_id: str):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                await connection.send_text(message)
+        self._fan_out(message, self.active_connections.get(user_id, {}).values())
     
     async def send_json_to_user(self, data: dict, user_id: str):
+        self.publish_to_subscribers(data, user_id)
         if user_id in self.active_connections:
-            message = json.dumps(data)
-            for connection in self.active_connections[user_id]:
-                await connection.send_text(message)
+            # Serialized once, shared by every socket of the user
+            self._fan_out(json.dumps(data), self.active_connections[user_id].values())
+    
+    async def send_json_to_users(self, data: dict, user_ids: Iterable[str]):
+        message = None
+        for user_id in user_ids:
+            self.publish_to_subscribers(data, user_id)
+            if user_id in self.active_connections:
+                message = message or json.dumps(data)
+                self._fan_out(message, self.active_connections[user_id].values())
     
     async def broadcast(self, message: str):
-        for user_connections in self.active_connections.values():
-            for connection in user_connections:
-                await connection.send_text(message)
+        for user_connections in list(self.active_connections.values()):
+            self._fan_out(message, user_connections.values())
+    
+    async def heartbeat(self):
+        """Ping every client periodically and reap the ones that stopped answering"""
+        ping = json.dumps({"type": "ping"})
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            deadline = loop.time() - self.pong_timeout
+            for user_connections in list(self.active_connections.values()):
+                for connection in list(user_connections.values()):
+                    if connection.last_seen < deadline:
+                        self._drop(connection, code=1001)
+                    elif not connection.enqueue(ping, self.overflow_policy):
+                        self._drop(connection, code=1008)
+    
+    async def drain(self, timeout: float, code: int = 1001):
+        """Let every client's queued events go out, then close all sockets"""
+        connections = [
+            connection
+            for user_connections in list(self.active_connections.values())
+            for connection in list(user_connections.values())
+        ]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline and any(
+            not connection.closed and (connection.sending or not connection.queue.empty())
+            for connection in connections
+        ):
+            await asyncio.sleep(0.05)
+        for connection in connections:
+            self.disconnect(connection.websocket, connection.user_id)
+            await connection.close(code=code)
+    
+    def start(self):
+        if self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(self.heartbeat())
+    
+    async def stop(self):
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+        for user_connections in list(self.active_connections.values()):
+            for connection in list(user_connections.values()):
+                self.disconnect(connection.websocket, connection.user_id)
+                await connection.close(code=1001)
 
 # Global connection manager instance
-manager = ConnectionManager() 
\ No newline at end of file
+manager = LazyInstance(lambda: ConnectionManager(
+    send_queue_size=settings.WS_SEND_QUEUE_SIZE,
+    send_timeout=settings.WS_SEND_TIMEOUT_SECONDS,
+    overflow_policy=settings.WS_OVERFLOW_POLICY,
+    ping_interval=settings.WS_PING_INTERVAL_SECONDS,
+    pong_timeout=settings.WS_PONG_TIMEOUT_SECONDS
+))
@@ -0,0 +1,273 @@
+from typing import Dict, Iterable, Optional, Set, Tuple
+import asyncio
+import json
+import time
+import uuid
+from ..config import settings, LazyInstance
+from .manager import manager, ConnectionManager
+
+PRESENCE_CHANNEL = "agent_chat:presence"
+TYPING_CHANNEL = "agent_chat:typing"
+
+class PresenceService:
+    """Online presence and typing indicators, kept entirely in memory.
+    
+    Presence is a TTL table refreshed by socket connects and heartbeats.
+    Going offline is announced only after a grace period, so page reloads
+    and reconnects do not flap. Typing events are rate-limited per user and
+    conversation: the first one goes out at once, later ones inside the
+    window collapse into a single trailing update.
+    
+    Events only reach users who share a conversation with the subject. The
+    participant map is filled when a user's socket connects and when
+    conversations are created, never on the presence/typing path itself.
+    
+    With a Redis URL, presence is also stored per worker in Redis and
+    changes are relayed between workers over pub/sub. A user only goes
+    offline once no worker has a live entry for them, and heartbeats
+    refresh Redis at most every ttl/3 rather than on every frame.
+    """
+    
+    def __init__(self, connections: ConnectionManager, ttl: float, offline_grace: float,
+                 typing_interval: float, redis_url: Optional[str] = None):
+        self.connections = connections
+        self.ttl = ttl
+        self.offline_grace = offline_grace
+        self.typing_interval = typing_interval
+        self.redis_url = redis_url
+        self.redis = None
+        self.worker_id = uuid.uuid4().hex
+        # user_id -> monotonic expiry
+        self.expiry: Dict[str, float] = {}
+        # user_id -> monotonic time of the last Redis refresh
+        self.refreshed: Dict[str, float] = {}
+        # conversation_id -> participants, and user_id -> conversation ids
+        self.participants: Dict[str, Tuple[str, str]] = {}
+        self.user_conversations: Dict[str, Set[str]] = {}
+        self.pending_offline: Dict[str, asyncio.TimerHandle] = {}
+        # (user_id, conversation_id) -> last sent time / pending trailing update
+        self.typing_sent: Dict[Tuple[str, str], float] = {}
+        self.typing_pending: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self.tasks: Set[asyncio.Task] = set()
+    
+    def register_conversation(self, conversation_id: str, user1_id: str, user2_id: str):
+        self.participants[conversation_id] = (user1_id, user2_id)
+        self.user_conversations.setdefault(user1_id, set()).add(conversation_id)
+        self.user_conversations.setdefault(user2_id, set()).add(conversation_id)
+    
+    def get_partners(self, user_id: str) -> Set[str]:
+        partners = set()
+        for conversation_id in self.user_conversations.get(user_id, ()):
+            user1_id, user2_id = self.participants[conversation_id]
+            partners.add(user2_id if user1_id == user_id else user1_id)
+        return partners
+    
+    def _forget_user(self, user_id: str):
+        """Drop conversations where neither participant is connected here any more"""
+        for conversation_id in self.user_conversations.pop(user_id, set()):
+            user1_id, user2_id = self.participants[conversation_id]
+            other = user2_id if user1_id == user_id else user1_id
+            if other in self.connections.active_connections:
+                # Keep it for the partner, who may still receive our updates
+                self.user_conversations.setdefault(user_id, set()).add(conversation_id)
+                continue
+            del self.participants[conversation_id]
+            other_conversations = self.user_conversations.get(other)
+            if other_conversations is not None:
+                other_conversations.discard(conversation_id)
+                if not other_conversations:
+                    del self.user_conversations[other]
+    
+    def is_online(self, user_id: str) -> bool:
+        expires_at = self.expiry.get(user_id)
+        return expires_at is not None and expires_at > time.monotonic()
+    
+    async def online_partners(self, user_id: str) -> Set[str]:
+        partners = self.get_partners(user_id)
+        online = {partner for partner in partners if self.is_online(partner)}
+        if self.redis is not None:
+            remote = [partner for partner in partners if partner not in online]
+            online.update(await self._redis_online(remote))
+        return online
+    
+    async def connected(self, user_id: str):
+        was_online = self.is_online(user_id) or user_id in self.pending_offline
+        handle = self.pending_offline.pop(user_id, None)
+        if handle:
+            handle.cancel()
+        self.expiry[user_id] = time.monotonic() + self.ttl
+        await self._redis_refresh(user_id)
+        if not was_online:
+            await self._announce(user_id, True)
+    
+    async def heartbeat(self, user_id: str):
+        if user_id in self.expiry:
+            now = time.monotonic()
+            self.expiry[user_id] = now + self.ttl
+            if now - self.refreshed.get(user_id, 0.0) >= self.ttl / 3:
+                await self._redis_refresh(user_id)
+    
+    async def disconnected(self, user_id: str):
+        """Call after a socket closes; schedules offline if it was the user's last one"""
+        if user_id in self.connections.active_connections or user_id in self.pending_offline:
+            return
+        loop = asyncio.get_running_loop()
+        self.pending_offline[user_id] = loop.call_later(
+            self.offline_grace, lambda: self._spawn(self._go_offline(user_id))
+        )
+    
+    async def _go_offline(self, user_id: str):
+        self.pending_offline.pop(user_id, None)
+        if user_id in self.connections.active_connections:
+            return
+        self.expiry.pop(user_id, None)
+        self.refreshed.pop(user_id, None)
+        if self.redis is not None:
+            await self.redis.zrem(f"presence:{user_id}", self.worker_id)
+            # Still connected through another worker: nothing changed for partners
+            if await self._redis_online([user_id]):
+                self._forget_user(user_id)
+                return
+        await self._announce(user_id, False)
+        self._forget_user(user_id)
+    
+    async def typing(self, user_id: str, conversation_id: str, active: bool = True):
+        participants = self.participants.get(conversation_id)
+        if not participants or user_id not in participants:
+            return
+        key = (user_id, conversation_id)
+        pending = self.typing_pending.pop(key, None)
+        if pending:
+            pending.cancel()
+        
+        now = time.monotonic()
+        last_sent = self.typing_sent.get(key, 0.0)
+        if not active or now - last_sent >= self.typing_interval:
+            self.typing_sent[key] = now
+            await self._send_typing(user_id, conversation_id, active)
+        else:
+            # Coalesce: one trailing update at the end of the window
+            loop = asyncio.get_running_loop()
+            self.typing_pending[key] = loop.call_later(
+                self.typing_interval - (now - last_sent),
+                lambda: self._spawn(self._flush_typing(key))
+            )
+    
+    async def _flush_typing(self, key: Tuple[str, str]):
+        self.typing_pending.pop(key, None)
+        self.typing_sent[key] = time.monotonic()
+        await self._send_typing(key[0], key[1], True)
+    
+    async def _send_typing(self, user_id: str, conversation_id: str, active: bool):
+        event = {
+            "type": "typing",
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "active": active,
+            # Clients clear the indicator if no refresh arrives in time
+            "expires_in": self.typing_interval * 2
+        }
+        other = [uid for uid in self.participants[conversation_id] if uid != user_id]
+        await self.connections.send_json_to_users(event, other)
+        if self.redis is not None:
+            await self.redis.publish(TYPING_CHANNEL, json.dumps({"origin": self.worker_id, "users": other, "event": event}))
+    
+    async def _announce(self, user_id: str, online: bool):
+        event = {"type": "presence", "user_id": user_id, "online": online}
+        await self.connections.send_json_to_users(event, self.get_partners(user_id))
+        if self.redis is not None:
+            await self.redis.publish(PRESENCE_CHANNEL, json.dumps({"origin": self.worker_id, "event": event}))
+    
+    async def sweep(self):
+        """Expire users whose heartbeats stopped without a clean disconnect"""
+        while True:
+            await asyncio.sleep(self.ttl / 2)
+            now = time.monotonic()
+            await self.expire(now)
+            # Forget typing windows that have long closed
+            for key, sent_at in list(self.typing_sent.items()):
+                if now - sent_at > self.typing_interval * 10 and key not in self.typing_pending:
+                    del self.typing_sent[key]
+    
+    async def expire(self, now: float):
+        """Renew users whose sockets are open; take the rest offline once their TTL lapses"""
+        for user_id, expires_at in list(self.expiry.items()):
+            if user_id in self.connections.active_connections:
+                # A quiet client whose socket is still open (the connection
+                # manager reaps dead ones) stays online until it closes
+                if expires_at - now <= self.ttl / 2:
+                    self.expiry[user_id] = now + self.ttl
+                    await self._redis_refresh(user_id)
+            elif expires_at <= now and user_id not in self.pending_offline:
+                await self._go_offline(user_id)
+    
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+    
+    async def _redis_refresh(self, user_id: str):
+        if self.redis is None:
+            return
+        self.refreshed[user_id] = time.monotonic()
+        key = f"presence:{user_id}"
+        # One member per worker, scored by its expiry time
+        await self.redis.zadd(key, {self.worker_id: time.time() + self.ttl})
+        await self.redis.expire(key, int(self.ttl) + 1)
+    
+    async def _redis_online(self, user_ids: Iterable[str]) -> Set[str]:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        now = time.time()
+        pipe = self.redis.pipeline()
+        for user_id in user_ids:
+            pipe.zcount(f"presence:{user_id}", now, "+inf")
+        counts = await pipe.execute()
+        return {user_id for user_id, count in zip(user_ids, counts) if count}
+    
+    async def _relay(self):
+        """Deliver presence and typing events published by other workers"""
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(PRESENCE_CHANNEL, TYPING_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                payload = json.loads(message["data"])
+                if payload["origin"] == self.worker_id:
+                    continue
+                event = payload["event"]
+                if message["channel"] == PRESENCE_CHANNEL:
+                    recipients = self.get_partners(event["user_id"])
+                else:
+                    recipients = payload["users"]
+                local = [uid for uid in recipients if uid in self.connections.active_connections]
+                await self.connections.send_json_to_users(event, local)
+        finally:
+            await pubsub.close()
+    
+    async def start(self):
+        if self.redis_url and self.redis is None:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(self.redis_url, decode_responses=True)
+            self._spawn(self._relay())
+        self._spawn(self.sweep())
+    
+    async def stop(self):
+        for handle in list(self.pending_offline.values()) + list(self.typing_pending.values()):
+            handle.cancel()
+        for task in list(self.tasks):
+            task.cancel()
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+# Global presence service instance
+presence = LazyInstance(lambda: PresenceService(
+    manager,
+    ttl=settings.PRESENCE_TTL_SECONDS,
+    offline_grace=settings.PRESENCE_OFFLINE_GRACE_SECONDS,
+    typing_interval=settings.TYPING_INTERVAL_SECONDS,
+    redis_url=settings.REDIS_URL if settings.PRESENCE_USE_REDIS else None
+))
@@ -0,0 +1,98 @@
+"""Benchmark encoding message history responses.
+
+Compares the previous path (a MessageResponse model per row, re-validated
+against response_model and rendered by JSONResponse) with plain dicts from
+Core rows encoded by ORJSONResponse. Run from the backend directory:
+
+    python benchmarks/bench_json.py --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app.api.chat import MessageResponse
+
+def build_rows(count: int):
+    """Tuples shaped like ChatService.get_conversation_message_rows' query"""
+    users = [(str(uuid.uuid4()), "alice"), (str(uuid.uuid4()), "bob")]
+    start = datetime(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        sender_id, username = users[i % 2]
+        rows.append((
+            str(uuid.uuid4()), sender_id, username,
+            f"message number {i} with some ordinary text in it",
+            f"a warmer, friendlier rendition of message number {i}",
+            start + timedelta(seconds=i, microseconds=i % 1000),
+            i % 3 == 0
+        ))
+    return rows, users[0][0]
+
+async def previous_path(rows, user_id: str, field) -> bytes:
+    models = [
+        MessageResponse(
+            id=message_id,
+            sender_id=sender_id,
+            sender_username=username,
+            original_content=original_content,
+            transformed_content=transformed_content,
+            timestamp=timestamp.isoformat(),
+            is_mine=sender_id == user_id,
+            is_read=is_read
+        )
+        for message_id, sender_id, username, original_content, transformed_content, timestamp, is_read in rows
+    ]
+    content = await serialize_response(field=field, response_content=models)
+    return JSONResponse(content).body
+
+async def fast_path(rows, user_id: str, field) -> bytes:
+    content = [
+        {
+            "id": message_id,
+            "sender_id": sender_id,
+            "sender_username": username,
+            "original_content": original_content,
+            "transformed_content": transformed_content,
+            "timestamp": timestamp,
+            "is_mine": sender_id == user_id,
+            "is_read": is_read
+        }
+        for message_id, sender_id, username, original_content, transformed_content, timestamp, is_read in rows
+    ]
+    return ORJSONResponse(content).body
+
+async def measure(encode, rows, user_id, field, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = await encode(rows, user_id, field)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), len(body)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    
+    field = create_response_field(name="Response_get_messages", type_=List[MessageResponse])
+    for size in args.sizes:
+        rows, user_id = build_rows(size)
+        previous, previous_size = await measure(previous_path, rows, user_id, field, args.repeat)
+        fast, fast_size = await measure(fast_path, rows, user_id, field, args.repeat)
+        print(f"{size:>7} messages: previous {previous * 1000:9.1f} ms ({previous_size} B), "
+              f"orjson {fast * 1000:8.1f} ms ({fast_size} B), {previous / fast:5.1f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""Benchmark the dev server against the production launcher on this machine.
+
+Starts each setup in turn on a free port: `uvicorn --reload` as run_local.sh
+does, then serve.py with the requested workers. Each setup is loaded from
+several client processes with keep-alive connections, and the benchmark
+reports requests/sec and p99 latency for GET /health and for an
+authenticated GET /api/chat/conversations. Run from the backend directory:
+
+    python benchmarks/bench_server.py --workers 4 --seconds 10
+    python benchmarks/bench_server.py --workers 4 --reuse-port --clients 8
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND = Path(__file__).parent.parent
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+def register(base_url: str) -> str:
+    response = httpx.post(f"{base_url}/api/auth/register",
+                          json={"username": f"bench_{time.time_ns()}", "password": "bench"})
+    return response.json()["access_token"]
+
+async def load(base_url: str, path: str, headers, concurrency: int, seconds: float):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + seconds
+        
+        async def user():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    response.read()
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+        
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return latencies, errors
+
+def client_process(args):
+    base_url, path, headers, concurrency, seconds = args
+    return asyncio.run(load(base_url, path, headers, concurrency, seconds))
+
+def measure(base_url: str, path: str, headers, clients: int, concurrency: int, seconds: float):
+    with multiprocessing.get_context("spawn").Pool(clients) as pool:
+        results = pool.map(client_process, [(base_url, path, headers, concurrency, seconds)] * clients)
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0
+    return len(latencies) / seconds, statistics.median(latencies) * 1000 if latencies else 0.0, p99, errors
+
+def run_setup(name: str, command, env, args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [part.format(port=port) for part in command], cwd=BACKEND, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(base_url)
+        headers = {"Authorization": f"Bearer {register(base_url)}"}
+        for path in ("/health", "/api/chat/conversations"):
+            rps, p50, p99, errors = measure(base_url, path, headers, args.clients, args.concurrency, args.seconds)
+            print(f"{name:<26} {path:<24} {rps:>8.0f} req/s   p50 {p50:>6.1f} ms   p99 {p99:>6.1f} ms   errors {errors}")
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: a temporary SQLite file)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--reuse-port", action="store_true")
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per client process")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+    
+    env = dict(os.environ, DEBUG="false")
+    env["DATABASE_URL"] = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench_server.db"
+    subprocess.run(["alembic", "upgrade", "head"], cwd=BACKEND, env=env, capture_output=True, check=True)
+    print(f"{os.cpu_count()} CPUs, {args.clients} client processes x {args.concurrency} connections, {args.seconds:.0f}s each")
+    
+    run_setup("dev (uvicorn --reload)", ["uvicorn", "app.main:app", "--reload", "--port", "{port}"], env, args)
+    launcher = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", "{port}", "--workers", str(args.workers)]
+    if args.reuse_port:
+        launcher.append("--reuse-port")
+    run_setup(f"serve.py ({args.workers} workers)", launcher, env, args)
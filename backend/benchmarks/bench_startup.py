@@ -0,0 +1,75 @@
+"""Benchmark worker cold start: importing the app and running its lifespan.
+
+Each sample is a fresh interpreter, as a new worker would be. It reports
+the time to `import app.main` and the time for import plus lifespan startup
+and shutdown. The schema is created once beforehand with Alembic and is not
+measured. Run from the backend directory:
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --importtime   # slowest imports
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND = Path(__file__).parent.parent
+
+SAMPLE = """
+import asyncio, time
+start = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def boot():
+    async with app.router.lifespan_context(app):
+        pass
+
+asyncio.run(boot())
+print(imported - start, time.perf_counter() - start)
+"""
+
+def sample(env) -> tuple:
+    output = subprocess.run(
+        [sys.executable, "-c", SAMPLE], cwd=BACKEND, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    import_time, boot_time = output.strip().splitlines()[-1].split()
+    return float(import_time), float(boot_time)
+
+def slowest_imports(env, count: int):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=BACKEND, env=env,
+        capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    for cumulative, name in sorted(rows, reverse=True)[:count]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="database URL (default: a temporary SQLite file)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports")
+    args = parser.parse_args()
+    
+    env = dict(os.environ, DEBUG="false")
+    env["DATABASE_URL"] = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench_startup.db"
+    subprocess.run(["alembic", "upgrade", "head"], cwd=BACKEND, env=env, capture_output=True, check=True)
+    
+    if args.importtime:
+        slowest_imports(env, 20)
+        sys.exit()
+    
+    samples = [sample(env) for _ in range(args.runs)]
+    for label, values in (("import", [s[0] for s in samples]), ("import + lifespan", [s[1] for s in samples])):
+        values = [value * 1000 for value in values]
+        print(f"{label:<18} median {statistics.median(values):>7.1f} ms   min {min(values):>7.1f} ms")
@@ -0,0 +1,123 @@
+"""Benchmark the message transform path against the Llama API simulator.
+
+Starts llama_simulator.py on a free port with the given latency model, then
+runs ChatService.transform_message at each concurrency level for a fixed
+number of calls and reports transforms/sec, p50/p95/p99 latency and
+failures. The simulator is seeded, so runs with the same arguments are
+comparable across machines and commits. Run from the backend directory:
+
+    python benchmarks/bench_transform.py --latency lognormal:300,0.5 --concurrency 1,10,50,200
+    python benchmarks/bench_transform.py --max-concurrency 32 --rate-limit-rate 0.02 --calls 2000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+import httpx
+
+BACKEND = Path(__file__).parent.parent
+sys.path.append(str(BACKEND))
+
+from bench_server import free_port
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1000, help="transforms per concurrency level")
+    parser.add_argument("--concurrency", default="1,10,50,200", help="comma-separated levels")
+    parser.add_argument("--latency", default="lognormal:300,0.5", help="simulated time to first token")
+    parser.add_argument("--token-latency-ms", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=0, help="simulated upstream cap (0 = none)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+args = parse_args()
+port = free_port()
+os.environ["LLAMA_API_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+os.environ.setdefault("DEBUG", "false")
+
+from app.database.models import AgentTone
+from app.services.chat_service import ChatService
+from app.services.http_client import close_http_client
+
+chat_service = ChatService()
+MESSAGES = [
+    "Hey what's up",
+    "Can you send me the report before the meeting tomorrow?",
+    "I really appreciate you covering for me last week, it meant a lot and I owe you one.",
+]
+
+def wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/stats").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"simulator at {base_url} did not start")
+
+async def measure(concurrency: int, calls: int):
+    latencies = []
+    failures = 0
+    remaining = iter(range(calls))
+    
+    async def caller():
+        nonlocal failures
+        for i in remaining:
+            start = time.perf_counter()
+            try:
+                await chat_service.transform_message(MESSAGES[i % len(MESSAGES)], AgentTone.PROFESSIONAL)
+            except Exception:
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+    
+    started = time.perf_counter()
+    # ChatService logs every transformation and failure; keep the report readable
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    
+    def percentile(p: float) -> float:
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else 0.0
+    
+    print(f"concurrency {concurrency:>4}   {len(latencies) / elapsed:>8.1f} transforms/s   "
+          f"p50 {percentile(0.5):>7.1f} ms   p95 {percentile(0.95):>7.1f} ms   "
+          f"p99 {percentile(0.99):>7.1f} ms   failures {failures}")
+
+async def main():
+    for concurrency in [int(level) for level in args.concurrency.split(",")]:
+        await measure(concurrency, args.calls)
+    await close_http_client()
+
+if __name__ == "__main__":
+    simulator = subprocess.Popen(
+        [
+            sys.executable, "llama_simulator.py", "--port", str(port),
+            "--latency", args.latency,
+            "--token-latency-ms", str(args.token_latency_ms),
+            "--error-rate", str(args.error_rate),
+            "--rate-limit-rate", str(args.rate_limit_rate),
+            "--max-concurrency", str(args.max_concurrency),
+            "--seed", str(args.seed)
+        ],
+        cwd=BACKEND, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(os.environ["LLAMA_API_BASE_URL"])
+        print(f"Simulator: {args.latency}, {args.token_latency_ms} ms/token, "
+              f"errors {args.error_rate:.0%}, 429s {args.rate_limit_rate:.0%}, "
+              f"upstream cap {args.max_concurrency or 'none'}; {args.calls} calls per level")
+        asyncio.run(main())
+    finally:
+        simulator.terminate()
+        simulator.wait(timeout=30)
@@ -0,0 +1,126 @@
+"""Benchmark WebSocket fan-out latency with some slow and dead clients.
+
+Compares the old sequential `await send_text` loop with the queued
+ConnectionManager. Run from the backend directory:
+
+    python benchmarks/bench_ws_fanout.py --sockets 5000 --slow 0.05 --dead 0.01
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.websocket.manager import ConnectionManager
+
+class SimulatedWebSocket:
+    """Stands in for a client socket; slow ones take `delay` per send, dead ones never finish"""
+    
+    def __init__(self, delay: float = 0.0, dead: bool = False):
+        self.delay = delay
+        self.dead = dead
+        self.latencies = []
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, message: str):
+        if self.dead:
+            await asyncio.sleep(3600)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        sent_at = json.loads(message).get("sent_at")
+        if sent_at is not None:
+            self.latencies.append(time.perf_counter() - sent_at)
+    
+    async def close(self, code: int = 1000):
+        pass
+
+class SequentialManager:
+    """The previous manager: awaits every socket in turn"""
+    
+    def __init__(self):
+        self.active_connections = {}
+    
+    async def connect(self, websocket, user_id):
+        await websocket.accept()
+        self.active_connections.setdefault(user_id, []).append(websocket)
+    
+    async def broadcast(self, message: str):
+        for user_connections in self.active_connections.values():
+            for connection in user_connections:
+                await connection.send_text(message)
+
+def build_sockets(count: int, slow_ratio: float, dead_ratio: float, slow_delay: float):
+    sockets = []
+    slow_every = int(1 / slow_ratio) if slow_ratio else 0
+    dead_every = int(1 / dead_ratio) if dead_ratio else 0
+    for i in range(count):
+        if dead_every and i % dead_every == dead_every - 1:
+            sockets.append(SimulatedWebSocket(dead=True))
+        elif slow_every and i % slow_every == 0:
+            sockets.append(SimulatedWebSocket(delay=slow_delay))
+        else:
+            sockets.append(SimulatedWebSocket())
+    return sockets
+
+async def run(manager, sockets, events: int, interval: float, budget: float):
+    for i, websocket in enumerate(sockets):
+        await manager.connect(websocket, f"user-{i}")
+    
+    async def publish():
+        for _ in range(events):
+            await manager.broadcast(json.dumps({"type": "new_message", "sent_at": time.perf_counter()}))
+            await asyncio.sleep(interval)
+    
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(publish(), budget)
+        # Let queued writers drain
+        await asyncio.sleep(0.5)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - start
+    
+    fast = [ws for ws in sockets if not ws.delay and not ws.dead]
+    latencies = [latency for ws in fast for latency in ws.latencies]
+    delivered = len(latencies) / (len(fast) * events) if fast else 0
+    return elapsed, delivered, latencies
+
+def report(name, elapsed, delivered, latencies):
+    if not latencies:
+        print(f"{name:>10}: nothing delivered to fast clients in {elapsed:.1f}s")
+        return
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:>10}: {delivered:6.1%} delivered to fast clients, "
+          f"p50 {p50:8.2f} ms, p99 {p99:8.2f} ms, max {latencies[-1] * 1000:8.2f} ms ({elapsed:.1f}s)")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between events")
+    parser.add_argument("--slow", type=float, default=0.05, help="fraction of slow clients")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="per-send delay of slow clients")
+    parser.add_argument("--dead", type=float, default=0.01, help="fraction of clients that never ack")
+    parser.add_argument("--budget", type=float, default=15.0, help="max seconds per run")
+    args = parser.parse_args()
+    
+    print(f"{args.sockets} sockets, {args.slow:.0%} slow, {args.dead:.0%} dead, {args.events} broadcasts")
+    
+    sockets = build_sockets(args.sockets, args.slow, args.dead, args.slow_delay)
+    report("sequential", *await run(SequentialManager(), sockets, args.events, args.interval, args.budget))
+    
+    sockets = build_sockets(args.sockets, args.slow, args.dead, args.slow_delay)
+    manager = ConnectionManager(send_timeout=1.0)
+    report("queued", *await run(manager, sockets, args.events, args.interval, args.budget))
+    await manager.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,29 +1,27 @@
 """Clear all data from the database"""
+import argparse
 import asyncio
-from sqlalchemy import delete
 from app.database.connection import AsyncSessionLocal
-from app.database.models import User, Conversation, Message
+from app.services.retention_service import retention
 
-async def clear_all_data():
-    """Clear all data from the database"""
+async def clear_all_data(dry_run: bool = False, job: str = "clear-database"):
+    """Clear all data from the database in small throttled batches"""
     async with AsyncSessionLocal() as session:
         try:
-            # Delete in order to respect foreign key constraints
-            print("Clearing messages...")
-            await session.execute(delete(Message))
-            
-            print("Clearing conversations...")
-            await session.execute(delete(Conversation))
-            
-            print("Clearing users...")
-            await session.execute(delete(User))
-            
-            await session.commit()
-            print("✅ Database cleared successfully!")
+            # Deletes in dependency order; rerunning with the same job name resumes
+            print("Counting rows..." if dry_run else "Clearing messages, conversations and users...")
+            result = await retention.clear_all(session, dry_run=dry_run, job_name=job)
+            for phase, count in result["deleted"].items():
+                print(f"  {phase}: {count}")
+            print("✅ Dry run complete" if dry_run else "✅ Database cleared successfully!")
             
         except Exception as e:
             print(f"❌ Error clearing database: {e}")
             await session.rollback()
 
 if __name__ == "__main__":
-    asyncio.run(clear_all_data()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Delete every message, conversation and user")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be deleted")
+    parser.add_argument("--job", default="clear-database", help="job name used to resume an interrupted run")
+    args = parser.parse_args()
+    asyncio.run(clear_all_data(args.dry_run, args.job))
@@ -0,0 +1,109 @@
+"""Shared fixtures: every test talks to llama_simulator.py unless LLAMA_API_LIVE is set,
+and database tests get a fresh SQLite file"""
+import os
+import socket
+import threading
+import time
+import httpx
+import pytest
+import uvicorn
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.api.auth import create_access_token
+from app.config import settings
+from app.database.connection import AsyncSessionLocal, async_engine_for
+from app.database.ids import new_id
+from app.database.models import Base, User
+from app.main import app
+from app.services import http_client
+from llama_simulator import LlamaSimulator
+
+SIMULATOR_URL = "http://llama-simulator/v1"
+
+@pytest.fixture
+def llama_simulator(monkeypatch):
+    """An in-process simulator behind the app's shared HTTP client.
+    
+    Reconfigure it with `llama_simulator.reset(SimulatorConfig(...))`.
+    """
+    simulator = LlamaSimulator()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=simulator.app))
+    monkeypatch.setattr(http_client, "_client", client)
+    monkeypatch.setattr(settings, "LLAMA_API_BASE_URL", SIMULATOR_URL)
+    return simulator
+
+@pytest.fixture(autouse=True)
+def offline_llama(request):
+    # Never reach the real Llama API by accident
+    if not os.getenv("LLAMA_API_LIVE"):
+        request.getfixturevalue("llama_simulator")
+
+@pytest.fixture(scope="session")
+def llama_server():
+    """A simulator on a real local port, for code that makes its own connections.
+    
+    Yields (simulator, base URL).
+    """
+    simulator = LlamaSimulator()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(simulator.app, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Llama simulator did not start")
+        time.sleep(0.01)
+    yield simulator, f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+    thread.join()
+    sock.close()
+
+@pytest.fixture
+def llama_api_url(request):
+    """Base URL to test against: the real API when LLAMA_API_LIVE is set"""
+    if os.getenv("LLAMA_API_LIVE"):
+        return settings.LLAMA_API_BASE_URL
+    _, base_url = request.getfixturevalue("llama_server")
+    return base_url
+
+@pytest.fixture
+async def db_engine(tmp_path, monkeypatch):
+    """The app's AsyncSessionLocal bound to an empty database with the current schema"""
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    monkeypatch.setattr(settings, "DATABASE_URL", url)
+    monkeypatch.setattr(settings, "DEBUG", False)
+    engine = async_engine_for(url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    monkeypatch.setattr(
+        AsyncSessionLocal, "factory", sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    )
+    yield engine
+    await engine.dispose()
+
+@pytest.fixture
+async def db(db_engine):
+    async with AsyncSessionLocal() as session:
+        yield session
+
+@pytest.fixture
+def make_user(db):
+    """Create users directly, skipping password hashing"""
+    async def make(username: str, **fields) -> User:
+        user = User(id=new_id(), username=username, password_hash="", **fields)
+        db.add(user)
+        await db.commit()
+        return user
+    return make
+
+@pytest.fixture
+async def api(db_engine):
+    """An HTTP client for the app on the test database; the lifespan does not run"""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+def auth_headers(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': str(user.id)})}"}
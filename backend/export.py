@@ -0,0 +1,47 @@
+"""Export conversations as NDJSON or CSV without loading them into memory
+
+Examples:
+    python export.py -o conversation.ndjson conversation <conversation id>
+    python export.py --format csv -o messages.csv user <user id>
+    python export.py user <user id> | gzip > messages.ndjson.gz
+"""
+import argparse
+import asyncio
+import sys
+from app.database.connection import AsyncSessionLocal
+from app.services.export_service import ExportService
+from app.config import settings
+
+async def run(args):
+    service = ExportService(chunk_size=args.chunk_size or settings.EXPORT_CHUNK_SIZE)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async with AsyncSessionLocal() as session:
+            if args.command == "conversation":
+                conversation_ids = [args.conversation_id]
+            else:
+                conversation_ids = await service.user_conversation_ids(args.user_id, session)
+            async for piece in service.export(conversation_ids, session, args.format):
+                output.write(piece)
+        if args.output:
+            print(f"✅ Exported {len(conversation_ids)} conversation(s) to {args.output}", file=sys.stderr)
+    except Exception as e:
+        print(f"❌ Export failed: {e}", file=sys.stderr)
+    finally:
+        if args.output:
+            output.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, help="rows fetched per round trip")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    conversation = commands.add_parser("conversation", help="export a single conversation")
+    conversation.add_argument("conversation_id")
+    
+    user = commands.add_parser("user", help="export every conversation of a user")
+    user.add_argument("user_id")
+    
+    asyncio.run(run(parser.parse_args()))
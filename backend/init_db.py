@@ -1,14 +1,17 @@
 """Initialize the database with tables"""
+from alembic import command
+from alembic.config import Config
 from app.database.models import Base
 from app.database.connection import engine
 
 def init_db():
-    """Drop and recreate all tables"""
+    """Drop and recreate all tables, then mark the schema as migrated"""
     print("Dropping existing tables...")
     Base.metadata.drop_all(bind=engine)
     print("Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    command.stamp(Config("alembic.ini"), "head")
     print("Database tables created successfully!")
 
 if __name__ == "__main__":
-    init_db() 
\ No newline at end of file
+    init_db()
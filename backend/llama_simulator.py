@@ -0,0 +1,217 @@
+"""Deterministic local stand-in for the Llama chat completions API.
+
+Serves POST /v1/chat/completions with the response shape ChatService parses
+(`completion_message.content.text` plus token `metrics`), including
+`"stream": true` server-sent events, so the transform path can be tested
+and benchmarked offline. Latency, injected errors and 429s, and the
+concurrency cap are configurable. The same seed always gives the same
+latencies, errors and output. Run it standalone and point the app at it:
+
+    python llama_simulator.py --port 8090 --latency lognormal:300,0.5 --token-latency-ms 5
+    LLAMA_API_BASE_URL=http://localhost:8090/v1 python serve.py
+
+Tests get an in-process instance from the fixtures in conftest.py.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, NamedTuple
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# The instruction and the message are joined with ": " (see ChatService.transform_message)
+INSTRUCTION_SEPARATOR = ": "
+
+class SimulatorConfig(NamedTuple):
+    latency: str = "fixed:0"  # time to first token: fixed:MS, uniform:LO,HI, normal:MEAN,SD, lognormal:MEDIAN,SIGMA
+    token_latency_ms: float = 0.0  # per generated token
+    error_rate: float = 0.0  # share of requests answered with 500
+    rate_limit_rate: float = 0.0  # share of requests answered with 429
+    max_concurrency: int = 0  # 0 = unlimited
+    overflow: str = "queue"  # past max_concurrency: "queue" or "reject" with 429
+    output_ratio: float = 1.3  # completion words per input word
+    seed: int = 0
+
+def sample_latency(spec: str, rng: random.Random) -> float:
+    """Seconds drawn from a distribution spec in milliseconds"""
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed":
+        ms = values[0] if values else 0.0
+    elif kind == "uniform":
+        ms = rng.uniform(values[0], values[1])
+    elif kind == "normal":
+        ms = rng.gauss(values[0], values[1])
+    elif kind == "lognormal":
+        ms = values[0] * math.exp(rng.gauss(0.0, values[1]))
+    else:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    return max(ms, 0.0) / 1000.0
+
+def count_tokens(text: str) -> int:
+    # One token per word keeps the arithmetic easy to check in tests
+    return len(text.split())
+
+class LlamaSimulator:
+    """Simulated chat completions endpoint.
+    
+    Request n gets its own RNG seeded from (seed, n), so a run is
+    reproducible as long as requests arrive in the same order. `config` can
+    be replaced between requests; `stats` counts responses by status and
+    the highest concurrency seen.
+    """
+    
+    def __init__(self, config: SimulatorConfig = SimulatorConfig()):
+        self.config = config
+        self.requests = 0
+        self.in_flight = 0
+        self.stats: Dict[str, Any] = {"statuses": Counter(), "max_in_flight": 0}
+        self.slots = asyncio.Semaphore(config.max_concurrency) if config.max_concurrency else None
+        self.app = Starlette(routes=[
+            Route("/v1/chat/completions", self.completions, methods=["POST"]),
+            Route("/v1/stats", self.get_stats, methods=["GET"]),
+        ])
+    
+    def reset(self, config: SimulatorConfig = None):
+        """Start over with a new config, as if freshly created"""
+        self.config = config or self.config
+        self.requests = 0
+        self.stats = {"statuses": Counter(), "max_in_flight": 0}
+        self.slots = asyncio.Semaphore(self.config.max_concurrency) if self.config.max_concurrency else None
+    
+    def transform(self, prompt: str, rng: random.Random) -> List[str]:
+        """Deterministic completion: the message's words, padded to output_ratio"""
+        message = prompt.partition(INSTRUCTION_SEPARATOR)[2] or prompt
+        words = message.split() or ["ok"]
+        length = max(1, math.ceil(len(words) * self.config.output_ratio))
+        return [words[i] if i < len(words) else rng.choice(words) for i in range(length)]
+    
+    def _respond(self, status: int, detail: str, **headers) -> JSONResponse:
+        self.stats["statuses"][status] += 1
+        return JSONResponse({"detail": detail}, status_code=status, headers=headers)
+    
+    async def completions(self, request: Request):
+        config = self.config
+        rng = random.Random(f"{config.seed}:{self.requests}")
+        self.requests += 1
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            return self._respond(401, "Missing API key")
+        body = await request.json()
+        # Draw in a fixed order so the outcome depends only on (seed, n)
+        roll = rng.random()
+        first_token = sample_latency(config.latency, rng)
+        if roll < config.error_rate:
+            return self._respond(500, "Simulated upstream error")
+        if roll < config.error_rate + config.rate_limit_rate:
+            return self._respond(429, "Simulated rate limit", **{"Retry-After": "1"})
+        if self.slots is not None and self.slots.locked() and config.overflow == "reject":
+            return self._respond(429, "Simulated concurrency limit", **{"Retry-After": "1"})
+        
+        messages = body.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        words = self.transform(prompt, rng)
+        max_tokens = body.get("max_tokens") or len(words)
+        stop_reason = "length" if len(words) > max_tokens else "stop"
+        words = words[:max_tokens]
+        metrics = [
+            {"metric": "num_completion_tokens", "value": len(words), "unit": "tokens"},
+            {"metric": "num_prompt_tokens", "value": sum(count_tokens(m.get("content", "")) for m in messages), "unit": "tokens"},
+        ]
+        metrics.append({"metric": "num_total_tokens", "value": metrics[0]["value"] + metrics[1]["value"], "unit": "tokens"})
+        self.stats["statuses"][200] += 1
+        
+        if body.get("stream"):
+            return StreamingResponse(
+                self._stream(words, first_token, stop_reason, metrics),
+                media_type="text/event-stream"
+            )
+        async with self._slot():
+            await asyncio.sleep(first_token + len(words) * config.token_latency_ms / 1000.0)
+        return JSONResponse({
+            "id": f"sim-{self.requests}",
+            "completion_message": {
+                "role": "assistant",
+                "stop_reason": stop_reason,
+                "content": {"type": "text", "text": " ".join(words)}
+            },
+            "metrics": metrics
+        })
+    
+    async def _stream(self, words: List[str], first_token: float, stop_reason: str,
+                      metrics: List[Dict[str, Any]]):
+        def event(data: Dict[str, Any]) -> str:
+            return f"data: {json.dumps(data)}\n\n"
+        
+        async with self._slot():
+            await asyncio.sleep(first_token)
+            yield event({"event": {"event_type": "start", "delta": {"type": "text", "text": ""}}})
+            for i, word in enumerate(words):
+                if i and self.config.token_latency_ms:
+                    await asyncio.sleep(self.config.token_latency_ms / 1000.0)
+                text = word if i == 0 else f" {word}"
+                yield event({"event": {"event_type": "progress", "delta": {"type": "text", "text": text}}})
+            yield event({
+                "event": {
+                    "event_type": "complete",
+                    "stop_reason": stop_reason,
+                    "delta": {"type": "text", "text": ""},
+                    "metrics": metrics
+                }
+            })
+    
+    @asynccontextmanager
+    async def _slot(self):
+        """One of the max_concurrency slots, waiting for it if needed"""
+        if self.slots is not None:
+            await self.slots.acquire()
+        self.in_flight += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self.slots is not None:
+                self.slots.release()
+    
+    async def get_stats(self, request: Request):
+        return JSONResponse({
+            "requests": self.requests,
+            "statuses": {str(status): count for status, count in self.stats["statuses"].items()},
+            "max_in_flight": self.stats["max_in_flight"]
+        })
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Deterministic Llama API simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    defaults = SimulatorConfig()
+    parser.add_argument("--latency", default=defaults.latency, help="time to first token, e.g. lognormal:300,0.5")
+    parser.add_argument("--token-latency-ms", type=float, default=defaults.token_latency_ms)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--max-concurrency", type=int, default=defaults.max_concurrency)
+    parser.add_argument("--overflow", choices=["queue", "reject"], default=defaults.overflow)
+    parser.add_argument("--output-ratio", type=float, default=defaults.output_ratio)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    import uvicorn
+    args = parse_args()
+    simulator = LlamaSimulator(SimulatorConfig(
+        latency=args.latency,
+        token_latency_ms=args.token_latency_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        max_concurrency=args.max_concurrency,
+        overflow=args.overflow,
+        output_ratio=args.output_ratio,
+        seed=args.seed
+    ))
+    uvicorn.run(simulator.app, host=args.host, port=args.port, access_log=False)
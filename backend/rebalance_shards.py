@@ -0,0 +1,89 @@
+"""Set up message shards and move conversations onto the shard hashing places them on
+
+Shards are listed in DATABASE_SHARD_URLS. To shard an existing database,
+list it first so its conversations (all recorded as shard 0) stay valid,
+append the new databases, then migrate and rebalance:
+
+    DATABASE_SHARD_URLS=postgresql://.../main,postgresql://.../shard1 python rebalance_shards.py migrate
+    python rebalance_shards.py status
+    python rebalance_shards.py rebalance --dry-run
+    python rebalance_shards.py rebalance --limit 10000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+from pathlib import Path
+from sqlalchemy import create_engine, inspect, text
+from app.config import settings
+from app.database.connection import AsyncSessionLocal
+from app.database.shards import shards
+from app.services.conversation_cache import conversation_cache
+from app.services.rebalance_service import ShardRebalancer
+
+# Shard-local tables whose foreign keys point at rows that only exist in the main database
+SHARD_TABLES = ["messages", "message_archive"]
+
+def migrate():
+    """Bring every shard to the current schema; shards keep the unused tables empty"""
+    for shard in shards.shards:
+        if shard.local:
+            continue
+        print(f"Migrating shard {shard.index}...")
+        subprocess.run(
+            ["alembic", "upgrade", "head"], cwd=Path(__file__).parent,
+            env=dict(os.environ, DATABASE_URL=shard.url), check=True
+        )
+        engine = create_engine(shard.url)
+        with engine.begin() as connection:
+            # SQLite does not enforce them; PostgreSQL would reject every insert
+            if connection.dialect.name == "postgresql":
+                for table in SHARD_TABLES:
+                    for foreign_key in inspect(connection).get_foreign_keys(table):
+                        connection.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{foreign_key["name"]}"'))
+        engine.dispose()
+    print("✅ Shards migrated")
+
+async def run(args):
+    rebalancer = ShardRebalancer(
+        batch_size=args.batch_size or settings.SHARD_REBALANCE_BATCH_SIZE,
+        settle=settings.SHARD_REBALANCE_SETTLE_SECONDS if args.settle is None else args.settle
+    )
+    # Publishes directory changes to other workers when they share Redis
+    await conversation_cache.start()
+    try:
+        async with AsyncSessionLocal() as session:
+            if args.command == "status":
+                for row in await rebalancer.status(session):
+                    print(f"  shard {row['shard']}: {row['conversations']} conversations "
+                          f"({row['to_move']} to move), {row['messages']} messages")
+            else:
+                result = await rebalancer.rebalance(
+                    session, limit=args.limit, batch=args.conversations_per_batch, dry_run=args.dry_run
+                )
+                verb = "Would move" if args.dry_run else "Moved"
+                print(f"✅ {verb} {result['conversations']} conversations ({result['messages']} messages)")
+    except Exception as e:
+        print(f"❌ Rebalance failed: {e}")
+    finally:
+        await conversation_cache.stop()
+        await shards.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.set_defaults(batch_size=None, settle=None)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="run migrations on every shard")
+    commands.add_parser("status", help="conversations and messages per shard")
+    rebalance = commands.add_parser("rebalance", help="move misplaced conversations")
+    rebalance.add_argument("--dry-run", action="store_true", help="only count conversations to move")
+    rebalance.add_argument("--limit", type=int, help="move at most this many conversations")
+    rebalance.add_argument("--conversations-per-batch", type=int, default=50)
+    rebalance.add_argument("--batch-size", type=int, help="messages copied per transaction")
+    rebalance.add_argument("--settle", type=float, help="seconds to wait before the final catch-up copy")
+    args = parser.parse_args()
+    
+    if args.command == "migrate":
+        migrate()
+    else:
+        asyncio.run(run(args))
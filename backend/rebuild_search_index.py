@@ -0,0 +1,20 @@
+"""Rebuild the full-text message search index"""
+import asyncio
+from app.database.shards import shards
+from app.services.search_service import SearchService
+
+async def rebuild_search_index():
+    """Create missing search tables/indexes and re-index all messages on every shard"""
+    for shard in shards.shards:
+        async with shard.session() as session:
+            try:
+                print(f"Rebuilding message search index on shard {shard.index}...")
+                count = await SearchService().rebuild_index(session)
+                print(f"✅ Indexed {count} messages")
+            except Exception as e:
+                print(f"❌ Error rebuilding search index: {e}")
+                await session.rollback()
+    await shards.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_search_index())
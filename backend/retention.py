@@ -0,0 +1,54 @@
+"""Delete messages or accounts in throttled, resumable batches
+
+Examples:
+    python retention.py messages --older-than-days 365 --dry-run
+    python retention.py messages --conversation <id> --job purge-conv
+    python retention.py user <user id>
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from app.database.connection import AsyncSessionLocal
+from app.services.retention_service import RetentionService
+from app.config import settings
+
+async def run(args):
+    service = RetentionService(
+        batch_size=args.batch_size or settings.RETENTION_BATCH_SIZE,
+        max_rows_per_second=args.rate or settings.RETENTION_MAX_ROWS_PER_SECOND
+    )
+    async with AsyncSessionLocal() as session:
+        try:
+            if args.command == "messages":
+                older_than = datetime.utcnow() - timedelta(days=args.older_than_days) if args.older_than_days else None
+                result = await service.delete_messages(
+                    session, older_than=older_than, conversation_id=args.conversation,
+                    user_id=args.sender, dry_run=args.dry_run, job_name=args.job
+                )
+            else:
+                result = await service.delete_user(session, args.user_id, dry_run=args.dry_run, job_name=args.job)
+            verb = "Would delete" if args.dry_run else "Deleted"
+            for phase, count in result["deleted"].items():
+                print(f"  {verb} {count} {phase.replace('_', ' ')}")
+            print("✅ Done")
+        except Exception as e:
+            print(f"❌ Retention job failed: {e}")
+            await session.rollback()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be deleted")
+    parser.add_argument("--job", help="job name; rerun with the same name to resume")
+    parser.add_argument("--batch-size", type=int, help="rows per transaction")
+    parser.add_argument("--rate", type=float, help="max rows deleted per second")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    messages = commands.add_parser("messages", help="delete messages by age, conversation and/or sender")
+    messages.add_argument("--older-than-days", type=int)
+    messages.add_argument("--conversation")
+    messages.add_argument("--sender", help="user id whose sent messages are deleted")
+    
+    user = commands.add_parser("user", help="delete an account and all its conversations")
+    user.add_argument("user_id")
+    
+    asyncio.run(run(parser.parse_args()))
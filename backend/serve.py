@@ -0,0 +1,35 @@
+"""Run the backend for production: uvloop/httptools, several workers, graceful drain
+
+Use `uvicorn app.main:app --reload` for development. Defaults come from the
+SERVER_* settings; flags override them.
+
+Examples:
+    python serve.py --workers 4
+    python serve.py --workers 0 --reuse-port          # one worker per CPU
+    python serve.py --port 9000 --graceful-timeout 60
+"""
+import argparse
+from app.server import serve
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--workers", type=int, help="worker processes; 0 = one per CPU")
+    parser.add_argument("--reuse-port", action="store_true", default=None,
+                        help="each worker binds its own SO_REUSEPORT socket")
+    parser.add_argument("--backlog", type=int, help="listen queue length")
+    parser.add_argument("--keepalive", type=int, help="seconds to hold idle keep-alive connections")
+    parser.add_argument("--graceful-timeout", type=int, help="seconds to drain in-flight work on SIGTERM")
+    args = parser.parse_args()
+    
+    overrides = {
+        key: value for key, value in {
+            "host": args.host,
+            "port": args.port,
+            "backlog": args.backlog,
+            "timeout_keep_alive": args.keepalive,
+            "timeout_graceful_shutdown": args.graceful_timeout
+        }.items() if value is not None
+    }
+    serve(workers=args.workers, reuse_port=args.reuse_port, **overrides)
@@ -0,0 +1,32 @@
+"""Test who counts as an admin, for the admin routes and the X-Profile header"""
+import pytest
+from app.config import settings
+from conftest import auth_headers
+
+@pytest.fixture
+async def users(make_user):
+    return await make_user("root"), await make_user("mallory")
+
+async def test_admin_routes_check_the_user_id(api, users, monkeypatch):
+    root, mallory = users
+    monkeypatch.setattr(settings, "ADMIN_USER_IDS", f" {str(root.id).upper()} ,")
+    assert (await api.get("/api/admin/loop", headers=auth_headers(root))).status_code == 200
+    assert (await api.get("/api/admin/loop", headers=auth_headers(mallory))).status_code == 403
+
+async def test_a_username_alone_grants_nothing(api, users, monkeypatch):
+    # Logging in as "root" would only create or reuse the account with that name
+    root, _ = users
+    monkeypatch.setattr(settings, "ADMIN_USER_IDS", "root")
+    assert (await api.get("/api/admin/loop", headers=auth_headers(root))).status_code == 403
+
+async def test_profile_header_is_ignored_for_non_admins(api, users, monkeypatch):
+    root, mallory = users
+    monkeypatch.setattr(settings, "ADMIN_USER_IDS", str(root.id))
+    
+    response = await api.get("/health", headers={"X-Profile": "collapsed", **auth_headers(mallory)})
+    assert response.json() == {"status": "healthy"}
+    assert "x-profiled-status" not in response.headers
+    
+    response = await api.get("/health", headers={"X-Profile": "collapsed", **auth_headers(root)})
+    assert response.headers["x-profiled-status"] == "200"
+    assert response.headers["content-type"].startswith("text/plain")
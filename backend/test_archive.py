@@ -0,0 +1,150 @@
+"""Test archiving old messages and reading history across the archive boundary"""
+from datetime import datetime, timedelta
+from typing import Optional
+import pytest
+from sqlalchemy import select, func
+from app.database.ids import new_id
+from app.database.models import Conversation, Message, MessageArchive, User
+from app.services.archive_service import ArchiveService, encode_chunk, decode_chunk
+from app.services.chat_service import ChatService
+from conftest import auth_headers
+
+async def add_messages(db, conversation: Conversation, sender_id: str, count: int, age: timedelta,
+                       prefix: str = "message"):
+    start = datetime.utcnow() - age
+    for n in range(count):
+        db.add(Message(
+            id=new_id(), conversation_id=conversation.id, sender_id=sender_id,
+            original_content=f"{prefix} {n}", transformed_content=f"{prefix} {n} nicely",
+            timestamp=start + timedelta(seconds=n), is_read=n % 2 == 0
+        ))
+    await db.commit()
+
+async def count(db, model) -> int:
+    return (await db.execute(select(func.count()).select_from(model))).scalar()
+
+def archiver(chunk_size: int = 3) -> ArchiveService:
+    return ArchiveService(archive_after=timedelta(days=90), chunk_size=chunk_size, interval=3600)
+
+async def archive(db, conversation: Conversation, service: Optional[ArchiveService] = None) -> int:
+    """Run one archive pass; its rollbacks expire `conversation`, so reload it"""
+    moved = await (service or archiver()).archive_once(db)
+    await db.refresh(conversation)
+    return moved
+
+@pytest.fixture
+async def conversation(db, make_user):
+    alice, bob = await make_user("alice"), await make_user("bob")
+    return await ChatService().get_or_create_conversation(alice.id, bob.id, db)
+
+@pytest.fixture
+async def history(db, conversation):
+    """7 messages past the archive cutoff followed by 2 recent ones"""
+    await add_messages(db, conversation, conversation.user1_id, 7, age=timedelta(days=400), prefix="old")
+    await add_messages(db, conversation, conversation.user2_id, 2, age=timedelta(days=1), prefix="new")
+    return conversation
+
+def contents(messages):
+    return [message["original_content"] for message in messages]
+
+EVERYTHING = [f"old {n}" for n in range(7)] + ["new 0", "new 1"]
+
+def test_chunk_roundtrip():
+    messages = [
+        {"id": new_id(), "sender_id": new_id(), "original_content": "hi \"there\"\nfriend",
+         "transformed_content": "hello", "timestamp": datetime(2024, 5, 1, 12, 30).isoformat(),
+         "status": None, "is_read": True}
+    ]
+    codec, payload = encode_chunk(messages)
+    assert codec in ("zstd", "zlib")
+    decoded = decode_chunk(codec, payload)
+    assert decoded[0]["timestamp"] == datetime(2024, 5, 1, 12, 30)
+    assert decoded[0]["original_content"] == "hi \"there\"\nfriend"
+
+async def test_archive_moves_old_messages_into_chunks(db, history):
+    moved = await archive(db, history)
+    
+    assert moved == 7
+    assert await count(db, Message) == 2
+    chunks = (await db.execute(
+        select(MessageArchive).order_by(MessageArchive.first_timestamp)
+    )).scalars().all()
+    assert [chunk.message_count for chunk in chunks] == [3, 3, 1]
+    assert all(chunk.conversation_id == history.id for chunk in chunks)
+    assert all(chunk.first_timestamp <= chunk.last_timestamp for chunk in chunks)
+    archived = [message for chunk in chunks for message in decode_chunk(chunk.codec, chunk.payload)]
+    assert contents(archived) == EVERYTHING[:7]
+    
+    # Nothing left past the cutoff
+    assert await archive(db, history) == 0
+    assert await count(db, MessageArchive) == 3
+
+async def test_read_whole_history_through_archive(db, history):
+    await archive(db, history)
+    
+    messages = await ChatService().get_conversation_message_rows(history.id, history.user1_id, db)
+    assert contents(messages) == EVERYTHING
+    assert [message["sender_username"] for message in messages] == ["alice"] * 7 + ["bob"] * 2
+    assert [message["is_mine"] for message in messages] == [True] * 7 + [False] * 2
+    assert messages[1]["transformed_content"] == "old 1 nicely"
+    assert [message["is_read"] for message in messages[:7]] == [n % 2 == 0 for n in range(7)]
+    timestamps = [message["timestamp"] for message in messages]
+    assert timestamps == sorted(timestamps)
+
+async def test_read_archived_window(db, history):
+    service = archiver(chunk_size=3)
+    await archive(db, history, service)
+    old = await service.read_archived(history.id, db)
+    assert contents(old) == EVERYTHING[:7]
+    
+    window = await service.read_archived(history.id, db, since=old[1]["timestamp"], before=old[5]["timestamp"])
+    assert contents(window) == ["old 2", "old 3", "old 4"]
+    newest = await service.read_archived(history.id, db, limit=4)
+    assert contents(newest) == ["old 3", "old 4", "old 5", "old 6"]
+
+async def test_page_back_across_archive_boundary(db, history):
+    await archive(db, history)
+    service = ChatService()
+    
+    pages = []
+    before = None
+    while True:
+        page = await service.get_conversation_message_rows(
+            history.id, history.user1_id, db, before=before, limit=2
+        )
+        if not page:
+            break
+        assert len(page) <= 2
+        pages.append(contents(page))
+        before = page[0]["timestamp"]
+    
+    # The first page back from the live rows straddles into the archive
+    assert pages == [["new 0", "new 1"], ["old 5", "old 6"], ["old 3", "old 4"], ["old 1", "old 2"], ["old 0"]]
+    
+    straddling = await service.get_conversation_message_rows(history.id, history.user1_id, db, limit=4)
+    assert contents(straddling) == ["old 5", "old 6", "new 0", "new 1"]
+
+async def test_fully_archived_conversation_keeps_last_message(db, conversation):
+    await add_messages(db, conversation, conversation.user2_id, 4, age=timedelta(days=400))
+    await archive(db, conversation)
+    assert await count(db, Message) == 0
+    
+    conversations = await ChatService().get_user_conversations(conversation.user1_id, db)
+    assert conversations[0]["last_message"]["content"] == "message 3 nicely"
+    assert conversations[0]["last_message"]["is_mine"] is False
+
+async def test_messages_api_pages_into_archive(db, api, history):
+    await archive(db, history)
+    alice = await db.get(User, history.user1_id)
+    url = f"/api/chat/conversation/{history.id}/messages"
+    
+    response = await api.get(url, params={"limit": 3}, headers=auth_headers(alice))
+    assert response.status_code == 200
+    page = response.json()
+    assert contents(page) == ["old 6", "new 0", "new 1"]
+    
+    response = await api.get(url, params={"limit": 5, "before": page[0]["timestamp"]}, headers=auth_headers(alice))
+    assert contents(response.json()) == ["old 1", "old 2", "old 3", "old 4", "old 5"]
+    
+    response = await api.get(url, headers=auth_headers(alice))
+    assert contents(response.json()) == EVERYTHING
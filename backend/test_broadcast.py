@@ -0,0 +1,97 @@
+"""Test broadcasting one message to many conversations"""
+import pytest
+from app.config import settings
+from app.database.ids import new_id
+from app.database.models import AgentTone
+from app.services.chat_service import ChatService
+from conftest import auth_headers
+
+chat_service = ChatService()
+
+@pytest.fixture
+async def alice(make_user):
+    return await make_user("alice")
+
+async def talk_to(db, make_user, alice, username: str, tone: AgentTone, custom_prompt: str = None):
+    """A conversation where alice sends with `tone`"""
+    friend = await make_user(username)
+    conversation = await chat_service.get_or_create_conversation(alice.id, friend.id, db)
+    if conversation.user1_id == alice.id:
+        conversation.user1_agent_tone, conversation.user1_custom_prompt = tone, custom_prompt
+    else:
+        conversation.user2_agent_tone, conversation.user2_custom_prompt = tone, custom_prompt
+    await db.commit()
+    return conversation
+
+async def broadcast(api, user, conversation_ids):
+    return await api.post(
+        "/api/chat/broadcast", json={"conversation_ids": conversation_ids, "content": "party at mine tonight"},
+        headers=auth_headers(user)
+    )
+
+async def test_one_transformation_per_tone(api, db, make_user, alice, llama_simulator):
+    nice = [await talk_to(db, make_user, alice, f"nice{n}", AgentTone.NICER) for n in range(3)]
+    mean = await talk_to(db, make_user, alice, "mean", AgentTone.MEANER)
+    # The custom prompt only counts with the CUSTOM tone
+    ignored = await talk_to(db, make_user, alice, "ignored", AgentTone.NICER, custom_prompt="like a pirate")
+    pirate = await talk_to(db, make_user, alice, "pirate", AgentTone.CUSTOM, custom_prompt="like a pirate")
+    targets = [conversation.id for conversation in nice + [mean, ignored, pirate]]
+    
+    response = await broadcast(api, alice, targets + [nice[0].id])
+    assert response.status_code == 200
+    body = response.json()
+    assert llama_simulator.requests == 3
+    assert body["failed"] == {}
+    sent = {message["conversation_id"]: message["transformed_content"] for message in body["messages"]}
+    assert sorted(sent) == sorted(targets)
+    assert len({sent[conversation.id] for conversation in nice + [ignored]}) == 1
+
+async def test_failures_are_reported_per_conversation(api, db, make_user, alice, monkeypatch):
+    nice = await talk_to(db, make_user, alice, "nice", AgentTone.NICER)
+    mean = await talk_to(db, make_user, alice, "mean", AgentTone.MEANER)
+    bob, carol = await make_user("bob"), await make_user("carol")
+    not_hers = await chat_service.get_or_create_conversation(bob.id, carol.id, db)
+    missing = new_id()
+    
+    transform = ChatService.transform_message
+    async def fail_meaner(self, content, tone, *args, **kwargs):
+        if tone == AgentTone.MEANER:
+            raise RuntimeError("upstream error")
+        return await transform(self, content, tone, *args, **kwargs)
+    monkeypatch.setattr(ChatService, "transform_message", fail_meaner)
+    
+    response = await broadcast(api, alice, [nice.id, mean.id, not_hers.id, missing])
+    assert response.status_code == 200
+    body = response.json()
+    assert [message["conversation_id"] for message in body["messages"]] == [nice.id]
+    assert body["failed"] == {
+        mean.id: "Failed to transform message",
+        not_hers.id: ChatService.NOT_FOUND_REASON,
+        missing: ChatService.NOT_FOUND_REASON
+    }
+
+async def test_nothing_sent_maps_to_an_error_status(api, db, make_user, alice):
+    response = await broadcast(api, alice, [new_id()])
+    assert response.status_code == 404
+    
+    capped = await make_user("capped", daily_token_budget=1)
+    conversation = await talk_to(db, make_user, capped, "friend", AgentTone.NICER)
+    response = await broadcast(api, capped, [conversation.id])
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) > 0
+    
+    response = await broadcast(api, alice, [])
+    assert response.status_code == 400
+
+async def test_too_many_conversations_are_refused_before_transforming(api, db, make_user, alice, llama_simulator,
+                                                                      monkeypatch):
+    monkeypatch.setattr(settings, "MAX_BROADCAST_CONVERSATIONS", 2)
+    conversations = [await talk_to(db, make_user, alice, f"friend{n}", AgentTone.NICER) for n in range(3)]
+    
+    response = await broadcast(api, alice, [conversation.id for conversation in conversations])
+    assert response.status_code == 400
+    assert "more than 2" in response.json()["detail"]
+    assert llama_simulator.requests == 0
+    
+    response = await broadcast(api, alice, [conversation.id for conversation in conversations[:2]])
+    assert response.status_code == 200
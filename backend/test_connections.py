@@ -0,0 +1,98 @@
+"""Test per-connection send queues with fake sockets: overflow policies, send timeouts and heartbeats"""
+import asyncio
+import json
+from app.websocket.manager import ConnectionManager, OVERFLOW_DISCONNECT, OVERFLOW_DROP_OLDEST
+
+class FakeSocket:
+    """Records what it is sent; sends block while `gate` is closed"""
+    
+    def __init__(self, open: bool = True):
+        self.sent = []
+        self.closed_with = None
+        self.gate = asyncio.Event()
+        if open:
+            self.gate.set()
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, message: str):
+        await self.gate.wait()
+        self.sent.append(message)
+    
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+async def settle():
+    # Enough loop turns for writers to pass each message through wait_for
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+def make_manager(**options) -> ConnectionManager:
+    options = {"send_queue_size": 2, "send_timeout": 5.0, **options}
+    return ConnectionManager(**options)
+
+async def test_slow_client_loses_its_oldest_messages_only():
+    manager = make_manager(overflow_policy=OVERFLOW_DROP_OLDEST)
+    slow, fast = FakeSocket(open=False), FakeSocket()
+    slow_connection = await manager.connect(slow, "slow")
+    await manager.connect(fast, "fast")
+    
+    for n in range(5):
+        await manager.send_json_to_users({"n": n}, ["slow", "fast"])
+        await settle()
+    assert [json.loads(message)["n"] for message in fast.sent] == [0, 1, 2, 3, 4]
+    
+    # The writer holds message 0; the queue kept the newest two
+    slow.gate.set()
+    await settle()
+    assert [json.loads(message)["n"] for message in slow.sent] == [0, 3, 4]
+    assert slow_connection.dropped == 2
+    assert manager.connection_count() == 2
+    await manager.stop()
+
+async def test_overflowing_client_is_disconnected():
+    manager = make_manager(overflow_policy=OVERFLOW_DISCONNECT)
+    slow, other = FakeSocket(open=False), FakeSocket()
+    await manager.connect(slow, "slow")
+    await manager.connect(other, "slow")
+    for n in range(4):
+        await manager.send_personal_message(f"m{n}", "slow")
+        await settle()
+    
+    assert slow.closed_with == 1008
+    # The user's other socket is unaffected
+    assert list(manager.active_connections["slow"]) == [other]
+    assert other.sent == ["m0", "m1", "m2", "m3"]
+    await manager.stop()
+
+async def test_send_that_times_out_drops_the_client():
+    manager = make_manager(send_timeout=0.05)
+    stuck = FakeSocket(open=False)
+    await manager.connect(stuck, "stuck")
+    await manager.send_personal_message("hello", "stuck")
+    await asyncio.sleep(0.1)
+    await settle()
+    
+    assert stuck.closed_with == 1011
+    assert manager.connection_count() == 0
+    # Later sends to the user are simply skipped
+    await manager.send_personal_message("anyone there?", "stuck")
+    await manager.stop()
+
+async def test_heartbeat_pings_and_reaps_silent_clients():
+    manager = make_manager(send_queue_size=16, ping_interval=0.02, pong_timeout=0.1)
+    silent, chatty = FakeSocket(), FakeSocket()
+    await manager.connect(silent, "silent")
+    chatty_connection = await manager.connect(chatty, "chatty")
+    manager.start()
+    for _ in range(10):
+        await asyncio.sleep(0.02)
+        chatty_connection.touch()
+    
+    assert silent.closed_with == 1001
+    assert json.loads(silent.sent[0]) == {"type": "ping"}
+    assert chatty.closed_with is None
+    assert list(manager.active_connections) == ["chatty"]
+    await manager.stop()
+    assert chatty.closed_with == 1001
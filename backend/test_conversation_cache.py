@@ -0,0 +1,88 @@
+"""Test that tone changes replace cached conversations, locally and on other workers"""
+import asyncio
+from app import server
+from app.config import settings
+from app.database.models import AgentTone
+from app.services.chat_service import ChatService
+from app.services.conversation_cache import ConversationCache, conversation_cache
+from conftest import auth_headers
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.queue = asyncio.Queue()
+    
+    async def subscribe(self, *channels):
+        self.redis.subscribers.append(self.queue)
+    
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+    
+    async def close(self):
+        self.redis.subscribers.remove(self.queue)
+
+class FakeRedis:
+    """Publish/subscribe between caches standing in for separate workers"""
+    
+    def __init__(self):
+        self.subscribers = []
+    
+    async def publish(self, channel, data):
+        for queue in self.subscribers:
+            queue.put_nowait({"type": "message", "channel": channel, "data": data})
+    
+    def pubsub(self):
+        return FakePubSub(self)
+
+async def test_tone_update_replaces_the_cached_entry(api, db, make_user):
+    alice, bob = await make_user("alice"), await make_user("bob")
+    conversation = await ChatService().get_or_create_conversation(alice.id, bob.id, db)
+    cached = await conversation_cache.get(conversation.id, db)
+    assert cached.user1_agent_tone == AgentTone.NICER
+    
+    user1 = alice if conversation.user1_id == alice.id else bob
+    response = await api.put(
+        f"/api/chat/conversation/{conversation.id}/tone", json={"tone": "custom", "custom_prompt": "like a pirate"},
+        headers=auth_headers(user1)
+    )
+    assert response.status_code == 200
+    cached = conversation_cache.entries[conversation.id]
+    assert cached.user1_agent_tone == AgentTone.CUSTOM
+    assert cached.user1_custom_prompt == "like a pirate"
+
+async def test_update_on_one_worker_invalidates_the_others(db, make_user):
+    alice, bob = await make_user("alice"), await make_user("bob")
+    conversation = await ChatService().get_or_create_conversation(alice.id, bob.id, db)
+    redis = FakeRedis()
+    writer, reader = ConversationCache(10), ConversationCache(10)
+    for cache in (writer, reader):
+        cache.redis = redis
+        cache.relay_task = asyncio.create_task(cache.relay())
+    await asyncio.sleep(0)
+    
+    await reader.get(conversation.id, db)
+    assert conversation.id in reader.entries
+    await writer.invalidate(conversation.id)
+    await asyncio.sleep(0)
+    assert conversation.id not in reader.entries
+    for cache in (writer, reader):
+        cache.redis = None
+        await cache.stop()
+
+def test_launcher_warns_about_unshared_caches(monkeypatch, capsys):
+    class Supervisor:
+        def __init__(self, options, workers, reuse_port):
+            self.workers = workers
+        
+        def run(self):
+            pass
+    monkeypatch.setattr(server, "Supervisor", Supervisor)
+    monkeypatch.setattr(settings, "EVENTS_USE_REDIS", True)
+    monkeypatch.setattr(settings, "CONVERSATION_CACHE_USE_REDIS", False)
+    
+    server.serve(workers=4)
+    assert "CONVERSATION_CACHE_USE_REDIS" in capsys.readouterr().out
+    monkeypatch.setattr(settings, "CONVERSATION_CACHE_USE_REDIS", True)
+    server.serve(workers=4)
+    assert "Warning" not in capsys.readouterr().out
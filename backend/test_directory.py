@@ -0,0 +1,82 @@
+"""Test the user directory: keyset pages in both orders, cursors and search"""
+import base64
+import json
+from datetime import datetime, timedelta
+import pytest
+from app.services.chat_service import ChatService
+from app.services.directory_service import DirectoryService, InvalidCursorError
+from conftest import auth_headers
+
+directory = DirectoryService()
+
+async def walk(db, user_id: str, limit: int, **options):
+    """Every username the directory lists, following next_cursor to the end"""
+    usernames, cursor = [], None
+    while True:
+        page = await directory.list_users(user_id, db, cursor=cursor, limit=limit, **options)
+        assert len(page["users"]) <= limit
+        usernames += [user["username"] for user in page["users"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return usernames
+
+@pytest.fixture
+async def alice(db, make_user):
+    """Alice with five contacts (two last messaged at the same moment) and six strangers"""
+    alice = await make_user("alice")
+    chat_service = ChatService()
+    start = datetime(2024, 1, 1)
+    for n, minutes in enumerate([5, 1, 3, 3, 4]):
+        contact = await make_user(f"contact{n}")
+        conversation = await chat_service.get_or_create_conversation(alice.id, contact.id, db)
+        conversation.last_message_at = start + timedelta(minutes=minutes)
+    for name in ["zoe", "bob", "Mallory", "carol", "dave", "erin"]:
+        await make_user(name)
+    await db.commit()
+    return alice
+
+async def test_name_order_pages_without_gaps(db, alice):
+    expected = sorted(["contact0", "contact1", "contact2", "contact3", "contact4",
+                       "zoe", "bob", "Mallory", "carol", "dave", "erin"])
+    for limit in range(1, 13):
+        assert await walk(db, alice.id, limit) == expected
+
+async def test_recent_order_continues_by_name_without_gaps(db, alice):
+    contacts = await walk(db, alice.id, 100, order="recent")
+    # Contacts first, newest conversation first; the tie is broken by conversation id
+    assert contacts[0] == "contact0" and contacts[1] == "contact4" and contacts[4] == "contact1"
+    assert sorted(contacts[2:4]) == ["contact2", "contact3"]
+    assert contacts[5:] == ["Mallory", "bob", "carol", "dave", "erin", "zoe"]
+    for limit in range(1, 13):
+        # Pages that end exactly where the contacts run out included
+        assert await walk(db, alice.id, limit, order="recent") == contacts
+
+async def test_prefix_and_fuzzy_search(db, alice, make_user):
+    await make_user("ALAN")
+    await make_user("sal")
+    await make_user("al%bert")
+    assert await walk(db, alice.id, 2, query="Al") == ["ALAN", "al%bert"]
+    assert await walk(db, alice.id, 2, query="al%") == ["al%bert"]
+    assert await walk(db, alice.id, 2, query="al", fuzzy=True) == ["ALAN", "Mallory", "al%bert", "sal"]
+    # Searching in recent order keeps the contacts first
+    everyone = await walk(db, alice.id, 100, order="recent")
+    assert await walk(db, alice.id, 2, query="C", order="recent") == [
+        username for username in everyone if username.lower().startswith("c")
+    ]
+
+def encode(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    encode({"name": "bob"}),
+    encode([]),
+    encode(["sideways", "bob"]),
+    encode(["recent", "yesterday", "id"]),
+])
+async def test_bad_cursors_are_rejected(api, alice, cursor):
+    with pytest.raises(InvalidCursorError):
+        directory.decode_cursor(cursor)
+    response = await api.get("/api/chat/users", params={"cursor": cursor}, headers=auth_headers(alice))
+    assert response.status_code == 400
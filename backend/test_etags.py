@@ -0,0 +1,122 @@
+"""Test the ETags on the polled /users, /conversations and /messages endpoints"""
+import sqlite3
+import pytest
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.config import settings
+from app.database.connection import async_engine_for
+from app.database.replicas import get_read_db
+from app.main import app
+from app.services.chat_service import ChatService
+from app.services.retention_service import RetentionService
+from conftest import auth_headers
+
+chat_service = ChatService()
+
+@pytest.fixture
+async def chat(db, make_user):
+    alice, bob = await make_user("alice"), await make_user("bob")
+    conversation = await chat_service.get_or_create_conversation(alice.id, bob.id, db)
+    return alice, bob, conversation
+
+async def get(api, url: str, user, etag: str = None):
+    headers = auth_headers(user)
+    if etag:
+        headers["If-None-Match"] = etag
+    return await api.get(url, headers=headers)
+
+async def assert_unchanged(api, url: str, user, etag: str):
+    response = await get(api, url, user, etag)
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+async def test_conversations_change_with_sends_and_receipts(api, db, chat):
+    alice, bob, conversation = chat
+    url = "/api/chat/conversations"
+    etag = (await get(api, url, alice)).headers["etag"]
+    await assert_unchanged(api, url, alice, etag)
+    
+    await chat_service.send_message(conversation.id, bob.id, "are you there?", db)
+    response = await get(api, url, alice, etag)
+    assert response.status_code == 200
+    assert response.json()[0]["unread_count"] == 1
+    etag = response.headers["etag"]
+    
+    # Alice reading the message changes what Bob sees for the conversation
+    bob_etag = (await get(api, url, bob)).headers["etag"]
+    await get(api, f"/api/chat/conversation/{conversation.id}/messages", alice)
+    assert (await get(api, url, bob, bob_etag)).status_code == 200
+    assert (await get(api, url, alice, etag)).status_code == 200
+
+async def test_messages_change_with_sends_and_receipts(api, db, chat):
+    alice, bob, conversation = chat
+    url = f"/api/chat/conversation/{conversation.id}/messages"
+    await chat_service.send_message(conversation.id, alice.id, "lunch?", db)
+    etag = (await get(api, url, alice)).headers["etag"]
+    await assert_unchanged(api, url, alice, etag)
+    
+    # Bob's first fetch marks the message read, so Alice's copy is out of date
+    response = await get(api, url, bob)
+    assert response.json()[0]["is_read"]
+    response = await get(api, url, alice, etag)
+    assert response.status_code == 200
+    assert response.json()[0]["is_read"]
+    etag = response.headers["etag"]
+    
+    await chat_service.send_message(conversation.id, bob.id, "sure", db)
+    response = await get(api, url, alice, etag)
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+async def test_users_change_after_a_deletion(api, db, chat, make_user):
+    alice, bob, _ = chat
+    url = "/api/chat/users"
+    etag = (await get(api, url, alice)).headers["etag"]
+    await assert_unchanged(api, url, alice, etag)
+    
+    await make_user("carol")
+    response = await get(api, url, alice, etag)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    
+    await RetentionService(batch_size=10, max_rows_per_second=0).delete_user(db, bob.id)
+    response = await get(api, url, alice, etag)
+    assert response.status_code == 200
+    assert [user["username"] for user in response.json()["users"]] == ["carol"]
+
+@pytest.fixture
+async def stale_replica(db_engine, tmp_path):
+    """Serve get_read_db from a snapshot of the database taken by `snapshot()`"""
+    primary_path = make_url(settings.DATABASE_URL).database
+    replica_path = tmp_path / "replica.db"
+    engine = async_engine_for(f"sqlite:///{replica_path}")
+    replica_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    
+    def snapshot():
+        with sqlite3.connect(primary_path) as source, sqlite3.connect(replica_path) as target:
+            source.backup(target)
+    
+    async def read_from_replica():
+        async with replica_session() as session:
+            yield session
+    app.dependency_overrides[get_read_db] = read_from_replica
+    yield snapshot
+    del app.dependency_overrides[get_read_db]
+    await engine.dispose()
+
+async def test_stale_replica_falls_back_to_the_primary(api, db, chat, stale_replica):
+    alice, bob, conversation = chat
+    stale_replica()
+    await chat_service.send_message(conversation.id, bob.id, "only on the primary", db)
+    
+    conversations = (await get(api, "/api/chat/conversations", alice)).json()
+    assert conversations[0]["last_message"]["content"] is not None
+    messages = (await get(api, f"/api/chat/conversation/{conversation.id}/messages", alice)).json()
+    assert [message["original_content"] for message in messages] == ["only on the primary"]
+    
+    # Once the replica has caught up it serves the same answer
+    stale_replica()
+    messages = (await get(api, f"/api/chat/conversation/{conversation.id}/messages", alice)).json()
+    assert [message["original_content"] for message in messages] == ["only on the primary"]
+    assert messages[0]["is_read"]
@@ -0,0 +1,145 @@
+"""Test streaming exports as NDJSON and CSV through the API and the export CLI"""
+import argparse
+import csv
+import io
+from datetime import datetime, timedelta
+import orjson
+import pytest
+from app.config import settings
+from app.database.ids import new_id
+from app.database.models import Message, User
+from app.services import export_service as export_module
+from app.services.archive_service import ArchiveService
+from app.services.chat_service import ChatService
+from app.services.export_service import EXPORT_COLUMNS, export_service
+from conftest import auth_headers
+import export
+
+TRICKY = 'say "hi", then\nleave'
+
+@pytest.fixture
+async def conversation(db, make_user):
+    """4 archived messages (chunks of 3 and 1) followed by 3 hot ones, one of them awkward for CSV"""
+    alice, bob = await make_user("alice"), await make_user("bob")
+    conversation = await ChatService().get_or_create_conversation(alice.id, bob.id, db)
+    # Archiving rolls back and expires loaded objects
+    conversation_id, alice_id, bob_id = conversation.id, alice.id, bob.id
+    start = datetime.utcnow() - timedelta(days=400)
+    contents = [f"old {n}" for n in range(4)]
+    for n, content in enumerate(contents):
+        db.add(Message(
+            id=new_id(), conversation_id=conversation_id, sender_id=alice_id,
+            original_content=content, transformed_content=content, timestamp=start + timedelta(seconds=n)
+        ))
+    await db.commit()
+    await ArchiveService(archive_after=timedelta(days=90), chunk_size=3, interval=3600).archive_once(db)
+    
+    start = datetime.utcnow() - timedelta(minutes=1)
+    for n, content in enumerate(["new 0", TRICKY, "new 2"]):
+        db.add(Message(
+            id=new_id(), conversation_id=conversation_id, sender_id=bob_id,
+            original_content=content, transformed_content=content.upper(), timestamp=start + timedelta(seconds=n),
+            is_read=True
+        ))
+    await db.commit()
+    await db.refresh(conversation)
+    return conversation
+
+EXPORTED = ["old 0", "old 1", "old 2", "old 3", "new 0", TRICKY, "new 2"]
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(export_service, "chunk_size", 2)
+
+def ndjson_rows(body: bytes) -> list:
+    return [orjson.loads(line) for line in body.splitlines()]
+
+def csv_rows(body: bytes) -> list:
+    return list(csv.DictReader(io.StringIO(body.decode(), newline="")))
+
+async def export_body(api, user, **params) -> bytes:
+    response = await api.get("/api/chat/export", params=params, headers=auth_headers(user))
+    assert response.status_code == 200
+    return response.content
+
+async def test_export_streams_a_piece_per_chunk(db, conversation, small_chunks):
+    # Archived chunks as stored, then hot rows `chunk_size` at a time
+    pieces = [piece async for piece in export_service.export([conversation.id], db)]
+    assert [len(ndjson_rows(piece)) for piece in pieces] == [3, 1, 2, 1]
+    
+    pieces = [piece async for piece in export_service.export([conversation.id], db, "csv")]
+    assert pieces[0].decode().splitlines() == [",".join(EXPORT_COLUMNS)]
+    assert [len(csv_rows(pieces[0] + piece)) for piece in pieces[1:]] == [3, 1, 2, 1]
+
+async def test_export_ndjson(db, api, conversation):
+    alice = await db.get(User, conversation.user1_id)
+    response = await api.get("/api/chat/export", params={"conversation_id": conversation.id},
+                             headers=auth_headers(alice))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == f'attachment; filename="messages-{conversation.id}.ndjson"'
+    
+    rows = ndjson_rows(response.content)
+    assert [row["original_content"] for row in rows] == EXPORTED
+    assert list(rows[0]) == EXPORT_COLUMNS
+    assert rows[5]["transformed_content"] == TRICKY.upper()
+    assert [row["sender_username"] for row in rows] == ["alice"] * 4 + ["bob"] * 3
+    assert [row["is_read"] for row in rows] == [False] * 4 + [True] * 3
+    assert {row["conversation_id"] for row in rows} == {conversation.id}
+
+async def test_export_csv_escapes_fields(db, api, conversation):
+    bob = await db.get(User, conversation.user2_id)
+    body = await export_body(api, bob, conversation_id=conversation.id, format="csv")
+    
+    assert body.decode().startswith(",".join(EXPORT_COLUMNS) + "\r\n")
+    assert b'"say ""hi"", then\nleave"' in body
+    rows = csv_rows(body)
+    assert [row["original_content"] for row in rows] == EXPORTED
+    assert rows[5]["transformed_content"] == TRICKY.upper()
+    assert rows[0]["is_read"] == "False"
+
+async def test_export_all_conversations_of_user(db, api, make_user, conversation):
+    alice = await db.get(User, conversation.user1_id)
+    carol = await make_user("carol")
+    other = await ChatService().get_or_create_conversation(alice.id, carol.id, db)
+    db.add(Message(id=new_id(), conversation_id=other.id, sender_id=carol.id,
+                   original_content="from carol", transformed_content="from carol"))
+    await db.commit()
+    
+    rows = ndjson_rows(await export_body(api, alice))
+    assert [row["original_content"] for row in rows] == EXPORTED + ["from carol"]
+    # Bob only gets his own conversation
+    rows = ndjson_rows(await export_body(api, await db.get(User, conversation.user2_id)))
+    assert [row["original_content"] for row in rows] == EXPORTED
+
+async def test_export_requires_participant(db, api, make_user, conversation):
+    mallory = await make_user("mallory")
+    response = await api.get("/api/chat/export", params={"conversation_id": conversation.id},
+                             headers=auth_headers(mallory))
+    assert response.status_code == 403
+    response = await api.get("/api/chat/export", params={"conversation_id": new_id()},
+                             headers=auth_headers(mallory))
+    assert response.status_code == 404
+
+async def test_chunk_size_comes_from_settings(db, conversation, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_CHUNK_SIZE", 1)
+    service = export_module.export_service._build()
+    assert service.chunk_size == 1
+    
+    chunks = [rows async for rows in service.iter_chunks([conversation.id], db)]
+    assert [len(rows) for rows in chunks] == [3, 1, 1, 1, 1]
+
+def cli_args(**args) -> argparse.Namespace:
+    return argparse.Namespace(**{"format": "ndjson", "output": None, "chunk_size": None, **args})
+
+async def test_cli_exports_conversation_to_file(db, conversation, tmp_path):
+    output = tmp_path / "conversation.csv"
+    await export.run(cli_args(command="conversation", conversation_id=conversation.id,
+                              format="csv", output=str(output), chunk_size=2))
+    rows = csv_rows(output.read_bytes())
+    assert [row["original_content"] for row in rows] == EXPORTED
+
+async def test_cli_exports_user_to_stdout(db, conversation, capsysbinary):
+    await export.run(cli_args(command="user", user_id=conversation.user2_id))
+    rows = ndjson_rows(capsysbinary.readouterr().out)
+    assert [row["original_content"] for row in rows] == EXPORTED
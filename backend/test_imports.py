@@ -0,0 +1,16 @@
+"""Test that importing the app and scripts reads no settings"""
+import subprocess
+import sys
+from pathlib import Path
+
+CHECK = """
+import app.config as config
+def fail():
+    raise AssertionError("settings read at import")
+config.get_settings = fail
+import app.main, clear_database, rebalance_shards, rebuild_search_index
+"""
+
+def test_import_has_no_settings_side_effects():
+    result = subprocess.run([sys.executable, "-c", CHECK], cwd=Path(__file__).parent, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
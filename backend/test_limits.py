@@ -0,0 +1,110 @@
+"""Test the token buckets and load shedding behind the rate-limited routes"""
+import pytest
+from fastapi import HTTPException
+from app.api import limits
+from app.services import rate_limiter
+from app.services.rate_limiter import (
+    AdmissionController, LocalTokenBuckets, Overloaded, RateLimiter, RateLimitExceeded, per_minute
+)
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    return clock
+
+def test_bucket_allows_a_burst_then_refills(clock):
+    buckets = LocalTokenBuckets()
+    limit = per_minute(60, 3)
+    assert [buckets.take("send:a", limit) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("send:a", limit) == pytest.approx(1.0)
+    # Other users and routes have their own buckets
+    assert buckets.take("send:b", limit) == 0
+    
+    clock.now += 2.5
+    assert buckets.take("send:a", limit) == 0
+    assert buckets.take("send:a", limit) == 0
+    assert buckets.take("send:a", limit) == pytest.approx(0.5)
+
+def test_refilled_buckets_are_pruned(clock):
+    buckets = LocalTokenBuckets()
+    limit = per_minute(60, 2)
+    buckets.take("idle", limit)
+    clock.now += LocalTokenBuckets.PRUNE_INTERVAL_SECONDS + 1
+    buckets.take("busy", limit)
+    assert list(buckets.buckets) == ["busy"]
+
+async def test_rate_limiter_raises_with_retry_after():
+    limiter = RateLimiter({"send": per_minute(6, 1)})
+    await limiter.check("send", "a")
+    with pytest.raises(RateLimitExceeded) as exceeded:
+        await limiter.check("send", "a")
+    assert exceeded.value.retry_after == pytest.approx(10.0, abs=0.1)
+    # Routes without a limit are never refused
+    await limiter.check("unlisted", "a")
+
+def test_transform_backlog_sheds_sends_only():
+    admission = AdmissionController(max_transform_backlog=1, max_pool_wait=0)
+    admission.transform_backlog = 1
+    admission.transform_seconds = 4.0
+    with pytest.raises(Overloaded) as overloaded:
+        admission.check(transforms=True)
+    assert overloaded.value.retry_after == 4.0
+    admission.check()
+
+def test_slow_pool_sheds_until_the_reading_is_stale(clock):
+    admission = AdmissionController(max_transform_backlog=0, max_pool_wait=0.1)
+    for _ in range(20):
+        admission.record_pool_wait(2.0)
+    with pytest.raises(Overloaded):
+        admission.check()
+    
+    clock.now += AdmissionController.POOL_WAIT_WINDOW_SECONDS + 0.1
+    admission.check()
+    # Fast checkouts bring the average back down
+    for _ in range(40):
+        admission.record_pool_wait(0.0)
+    assert not admission.pool_saturated()
+
+class Session:
+    def __init__(self):
+        self.checkouts = 0
+    
+    async def connection(self):
+        self.checkouts += 1
+
+async def test_admit_answers_503_with_retry_after(monkeypatch):
+    admission = AdmissionController(max_transform_backlog=1, max_pool_wait=0)
+    admission.transform_backlog = 1
+    admission.transform_seconds = 2.5
+    monkeypatch.setattr(limits, "admission", admission)
+    db = Session()
+    
+    with pytest.raises(HTTPException) as refused:
+        await limits.admit(transforms=True)(db)
+    assert refused.value.status_code == 503
+    assert refused.value.headers == {"Retry-After": "3"}
+    assert db.checkouts == 0
+    
+    # Admitted primary routes sample the pool wait on their own checkout
+    await limits.admit()(db)
+    assert db.checkouts == 1 and admission.pool_wait_at > 0
+
+async def test_admit_on_replica_routes_takes_no_primary_connection(monkeypatch):
+    admission = AdmissionController(max_transform_backlog=0, max_pool_wait=0.1)
+    admission.record_pool_wait(5.0)
+    monkeypatch.setattr(limits, "admission", admission)
+    dependency = limits.admit(replica=True)
+    
+    with pytest.raises(HTTPException) as refused:
+        await dependency()
+    assert refused.value.status_code == 503
+    admission.pool_wait = 0.0
+    await dependency()
@@ -0,0 +1,100 @@
+"""Test the Llama API simulator and the transform path against it"""
+import asyncio
+import json
+import os
+import time
+import pytest
+from app.database.models import AgentTone
+from app.services.chat_service import ChatService
+from app.services.http_client import get_http_client
+from app.services.usage_service import usage_from_response
+from llama_simulator import SimulatorConfig
+
+pytestmark = pytest.mark.skipif(
+    bool(os.getenv("LLAMA_API_LIVE")), reason="simulator tests do not run against the live API"
+)
+
+def completion_request(content: str, **extra):
+    return {"model": "test", "messages": [{"role": "user", "content": content}], **extra}
+
+async def post(body, **headers):
+    return await get_http_client().post(
+        "http://llama-simulator/v1/chat/completions",
+        headers={"Authorization": "Bearer test", **headers},
+        json=body
+    )
+
+async def test_response_shape_and_usage(llama_simulator):
+    response = await post(completion_request("Be nice: see you at the meeting", max_tokens=100))
+    assert response.status_code == 200
+    resp_json = response.json()
+    message = resp_json["completion_message"]
+    assert message["content"]["type"] == "text"
+    assert message["content"]["text"].startswith("see you at the meeting")
+    assert message["stop_reason"] == "stop"
+    usage = usage_from_response(resp_json, "", message["content"]["text"])
+    assert not usage.estimated
+    assert usage.prompt_tokens == 7
+    assert usage.completion_tokens == len(message["content"]["text"].split())
+
+async def test_transform_message(llama_simulator):
+    transformed = await ChatService().transform_message("Hey what's up", AgentTone.NICER)
+    assert transformed.startswith("Hey what's up")
+    assert llama_simulator.stats["statuses"][200] == 1
+
+async def test_max_tokens_truncates(llama_simulator):
+    response = await post(completion_request("one two three four five six", max_tokens=3))
+    message = response.json()["completion_message"]
+    assert message["content"]["text"] == "one two three"
+    assert usage_from_response(response.json(), "", "").truncated
+
+async def test_same_seed_same_run(llama_simulator):
+    async def run():
+        llama_simulator.reset(SimulatorConfig(latency="uniform:0,2", error_rate=0.2, rate_limit_rate=0.2, seed=7))
+        responses = [await post(completion_request(f"Be nice: message {i}")) for i in range(20)]
+        return [(r.status_code, r.text) for r in responses]
+    
+    first = await run()
+    assert first == await run()
+    statuses = {status for status, _ in first}
+    assert statuses == {200, 429, 500}
+
+async def test_rate_limit_injection(llama_simulator):
+    llama_simulator.reset(SimulatorConfig(rate_limit_rate=1.0))
+    response = await post(completion_request("hello"))
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    with pytest.raises(Exception, match="429"):
+        await ChatService().transform_message("hello", AgentTone.NICER)
+
+async def test_missing_api_key(llama_simulator):
+    response = await get_http_client().post(
+        "http://llama-simulator/v1/chat/completions", json=completion_request("hello")
+    )
+    assert response.status_code == 401
+
+async def test_concurrency_cap_queues(llama_simulator):
+    llama_simulator.reset(SimulatorConfig(latency="fixed:50", max_concurrency=2))
+    started = time.monotonic()
+    responses = await asyncio.gather(*(post(completion_request("hello")) for _ in range(6)))
+    assert all(r.status_code == 200 for r in responses)
+    assert llama_simulator.stats["max_in_flight"] == 2
+    assert time.monotonic() - started >= 0.15
+
+async def test_concurrency_cap_rejects(llama_simulator):
+    llama_simulator.reset(SimulatorConfig(latency="fixed:50", max_concurrency=2, overflow="reject"))
+    responses = await asyncio.gather(*(post(completion_request("hello")) for _ in range(6)))
+    assert sorted(r.status_code for r in responses) == [200, 200, 429, 429, 429, 429]
+
+async def test_streaming_matches_completion(llama_simulator):
+    body = completion_request("Be nice: thanks for the help today", max_tokens=50)
+    complete = (await post(body)).json()["completion_message"]["content"]["text"]
+    llama_simulator.reset()
+    streamed = await post({**body, "stream": True})
+    events = [
+        json.loads(line[len("data: "):])["event"]
+        for line in streamed.text.splitlines() if line.startswith("data: ")
+    ]
+    assert [e["event_type"] for e in (events[0], events[-1])] == ["start", "complete"]
+    assert "".join(e["delta"]["text"] for e in events) == complete
+    assert events[-1]["stop_reason"] == "stop"
@@ -0,0 +1,175 @@
+"""Test the group-commit message writer: batching, failure isolation and shutdown"""
+import asyncio
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.database.connection import async_engine_for
+from app.database.models import Base, Conversation, Message
+from app.database.shards import ShardRouter, shards
+from app.services import message_writer as message_writer_module
+from app.services.chat_service import ChatService
+from app.services.message_writer import GroupCommitWriter
+
+@pytest.fixture
+async def conversation(db, make_user):
+    alice, bob = await make_user("alice"), await make_user("bob")
+    return await ChatService().get_or_create_conversation(alice.id, bob.id, db)
+
+@pytest.fixture
+async def writer(db_engine):
+    writer = GroupCommitWriter(max_batch=3, max_delay=0.05)
+    batches = []
+    write = writer._write
+    
+    async def recording_write(db, batch):
+        batches.append([row["original_content"] for row, _, _, _ in batch])
+        await write(db, batch)
+    writer._write = recording_write
+    writer.batches = batches
+    yield writer
+    await writer.stop()
+
+def message(conversation: Conversation, content) -> dict:
+    return {
+        "conversation_id": conversation.id,
+        "sender_id": conversation.user1_id,
+        "original_content": content,
+        "transformed_content": content
+    }
+
+async def stored(db, conversation_id: str) -> list:
+    result = await db.execute(
+        select(Message.original_content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.original_content)
+    )
+    return result.scalars().all()
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+async def test_concurrent_sends_share_batches(db, conversation, writer):
+    conversation_id, version = conversation.id, conversation.version
+    sent = await asyncio.gather(*(
+        writer.submit(message(conversation, f"hi {n}"), [conversation.user2_id]) for n in range(5)
+    ))
+    
+    assert [m.original_content for m in sent] == [f"hi {n}" for n in range(5)]
+    assert writer.batches == [["hi 0", "hi 1", "hi 2"], ["hi 3", "hi 4"]]
+    assert await stored(db, conversation_id) == [f"hi {n}" for n in range(5)]
+    await db.refresh(conversation)
+    assert conversation.version == version + 5
+    assert conversation.last_message_at == max(m.timestamp for m in sent)
+
+async def test_failing_row_only_fails_its_sender(db, conversation, writer):
+    conversation_id = conversation.id
+    results = await asyncio.gather(
+        writer.submit(message(conversation, "first"), []),
+        writer.submit(message(conversation, None), []),
+        writer.submit(message(conversation, "third"), []),
+        return_exceptions=True
+    )
+    
+    assert results[0].original_content == "first"
+    assert isinstance(results[1], IntegrityError)
+    assert results[2].original_content == "third"
+    # The whole batch, then each row alone
+    assert writer.batches == [["first", None, "third"], ["first"], [None], ["third"]]
+    assert await stored(db, conversation_id) == ["first", "third"]
+
+async def test_cancelled_waiter_does_not_break_the_writer(db, conversation, writer):
+    conversation_id = conversation.id
+    abandoned = asyncio.create_task(writer.submit(message(conversation, None), []))
+    kept = asyncio.create_task(writer.submit(message(conversation, "kept"), []))
+    await settle()
+    abandoned.cancel()
+    
+    assert (await kept).original_content == "kept"
+    with pytest.raises(asyncio.CancelledError):
+        await abandoned
+    assert not writer.task.done()
+    assert (await writer.submit(message(conversation, "later"), [])).original_content == "later"
+    assert await stored(db, conversation_id) == ["kept", "later"]
+
+async def test_writer_survives_unexpected_errors(db, conversation, writer, monkeypatch):
+    conversation_id = conversation.id
+    calls = 0
+    
+    def notify():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("dispatcher down")
+    monkeypatch.setattr(message_writer_module.dispatcher, "notify", notify)
+    
+    assert (await writer.submit(message(conversation, "first"), [])).original_content == "first"
+    await settle()
+    assert not writer.task.done()
+    assert (await writer.submit(message(conversation, "second"), [])).original_content == "second"
+    assert await stored(db, conversation_id) == ["first", "second"]
+
+async def test_stop_finishes_in_flight_batch_and_queue(db, conversation, writer):
+    conversation_id = conversation.id
+    gate = asyncio.Event()
+    write = writer._write
+    
+    async def slow_write(db, batch):
+        await gate.wait()
+        await write(db, batch)
+    writer._write = slow_write
+    
+    first = asyncio.create_task(writer.submit(message(conversation, "in flight"), []))
+    while writer.in_flight is None:
+        await asyncio.sleep(0.01)
+    queued = asyncio.create_task(writer.submit(message(conversation, "queued"), []))
+    await settle()
+    stopping = asyncio.create_task(writer.stop())
+    await settle()
+    assert not stopping.done()
+    
+    gate.set()
+    await stopping
+    assert writer.task is None
+    assert (await first).original_content == "in flight"
+    assert (await queued).original_content == "queued"
+    assert await stored(db, conversation_id) == ["in flight", "queued"]
+
+@pytest.fixture
+async def shard(db_engine, tmp_path, monkeypatch):
+    """A second, empty SQLite shard next to the main test database"""
+    urls = [settings.DATABASE_URL, f"sqlite:///{tmp_path / 'shard1.db'}"]
+    engine = async_engine_for(urls[1])
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+    router = ShardRouter(urls)
+    monkeypatch.setattr(shards, "shards", router.shards)
+    yield router.shards[1]
+    await router.dispose()
+
+async def test_retry_after_main_failure_skips_rows_already_on_shard(db, conversation, writer, shard, monkeypatch):
+    conversation_id, version = conversation.id, conversation.version
+    add_events = message_writer_module.add_events
+    calls = 0
+    
+    async def flaky_add_events(db, events):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("main database hiccup")
+        await add_events(db, events)
+    monkeypatch.setattr(message_writer_module, "add_events", flaky_add_events)
+    
+    sent = await asyncio.gather(*(
+        writer.submit(message(conversation, f"hi {n}"), [], shard=1) for n in range(2)
+    ))
+    
+    assert [m.original_content for m in sent] == ["hi 0", "hi 1"]
+    assert writer.batches == [["hi 0", "hi 1"], ["hi 0"], ["hi 1"]]
+    async with shard.session() as shard_db:
+        assert await stored(shard_db, conversation_id) == ["hi 0", "hi 1"]
+    assert await stored(db, conversation_id) == []
+    await db.refresh(conversation)
+    assert conversation.version == version + 2
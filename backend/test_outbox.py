@@ -0,0 +1,119 @@
+"""Test the transactional outbox: staging, ordered drains and at-least-once delivery"""
+import asyncio
+import json
+from datetime import timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.config import settings
+from app.database.connection import async_engine_for
+from app.database.ids import new_id
+from app.database.models import OutboxEvent, SyncLogEntry
+from app.services.chat_service import ChatService
+from app.services.outbox import OutboxDispatcher, add_event
+
+class RecordingConnections:
+    """Stands in for the ConnectionManager; can fail once after delivering"""
+    
+    def __init__(self, fail_after: int = 0):
+        self.sent = []
+        self.fail_after = fail_after
+    
+    async def send_json_to_users(self, data, user_ids):
+        self.sent.append((data, list(user_ids)))
+        if self.fail_after and len(self.sent) == self.fail_after:
+            self.fail_after = 0
+            raise ConnectionError("worker died mid-batch")
+
+RECIPIENTS = [new_id()]
+
+def make_dispatcher(connections, batch_size: int = 100) -> OutboxDispatcher:
+    return OutboxDispatcher(connections, batch_size=batch_size, poll_interval=1.0, retention=timedelta(minutes=60))
+
+async def pending(db):
+    result = await db.execute(select(OutboxEvent).where(OutboxEvent.dispatched_at.is_(None)).order_by(OutboxEvent.id))
+    return result.scalars().all()
+
+async def test_event_is_staged_with_its_transaction(db):
+    add_event(db, "typing", None, RECIPIENTS, {"n": 1})
+    await db.rollback()
+    assert await pending(db) == []
+    
+    add_event(db, "typing", None, RECIPIENTS, {"n": 2})
+    await db.commit()
+    rows = await pending(db)
+    assert [json.loads(row.payload) for row in rows] == [{"n": 2}]
+
+async def test_send_message_stages_new_message_event(db, make_user):
+    alice, bob = await make_user("alice"), await make_user("bob")
+    chat_service = ChatService()
+    conversation = await chat_service.get_or_create_conversation(alice.id, bob.id, db)
+    message = await chat_service.send_message(conversation.id, alice.id, "see you soon", db)
+    
+    events = [row for row in await pending(db) if row.event_type == "new_message"]
+    assert len(events) == 1
+    assert json.loads(events[0].payload)["message"]["id"] == message.id
+    assert sorted(json.loads(events[0].recipients)) == sorted([alice.id, bob.id])
+
+async def test_drain_delivers_in_id_order_in_batches(db):
+    for n in range(5):
+        add_event(db, "tick", None, RECIPIENTS, {"n": n})
+    await db.commit()
+    connections = RecordingConnections()
+    dispatcher = make_dispatcher(connections, batch_size=2)
+    
+    assert [await dispatcher.drain_once(db) for _ in range(4)] == [2, 2, 1, 0]
+    assert [data["n"] for data, _ in connections.sent] == [0, 1, 2, 3, 4]
+    event_ids = [data["event_id"] for data, _ in connections.sent]
+    assert event_ids == sorted(event_ids)
+    assert await pending(db) == []
+    
+    # Every drained event is also logged for sync, in the same order
+    logged = (await db.execute(select(SyncLogEntry.event_id).order_by(SyncLogEntry.seq))).scalars().all()
+    assert logged == event_ids
+
+async def test_failed_batch_is_redelivered_with_the_same_event_ids(db):
+    for n in range(3):
+        add_event(db, "tick", None, RECIPIENTS, {"n": n})
+    await db.commit()
+    connections = RecordingConnections(fail_after=2)
+    dispatcher = make_dispatcher(connections)
+    
+    try:
+        await dispatcher.drain_once(db)
+    except ConnectionError:
+        await db.rollback()
+    first = [data["event_id"] for data, _ in connections.sent]
+    assert len(await pending(db)) == 3
+    assert (await db.execute(select(SyncLogEntry))).first() is None
+    
+    assert await dispatcher.drain_once(db) == 3
+    resent = [data["event_id"] for data, _ in connections.sent[len(first):]]
+    # Clients dedupe on event_id: the two already delivered come back unchanged
+    assert resent[:2] == first
+    assert len(set(data["event_id"] for data, _ in connections.sent)) == 3
+    assert await pending(db) == []
+
+async def test_workers_on_sqlite_never_drain_the_same_events(db):
+    for n in range(60):
+        add_event(db, "tick", None, RECIPIENTS, {"n": n})
+    await db.commit()
+    connections = RecordingConnections()
+    
+    async def worker():
+        # Each worker process has its own engine and connection
+        engine = async_engine_for(settings.DATABASE_URL)
+        dispatcher = make_dispatcher(connections, batch_size=7)
+        try:
+            async with sessionmaker(engine, class_=AsyncSession)() as session:
+                while await dispatcher.drain_once(session):
+                    await asyncio.sleep(0)
+        finally:
+            await engine.dispose()
+    await asyncio.gather(*(worker() for _ in range(3)))
+    
+    delivered = [data["n"] for data, _ in connections.sent]
+    assert delivered == list(range(60))
+    logged = (await db.execute(select(SyncLogEntry.seq, SyncLogEntry.event_id).order_by(SyncLogEntry.seq))).all()
+    assert [seq for seq, _ in logged] == list(range(1, 61))
+    assert [event_id for _, event_id in logged] == [data["event_id"] for data, _ in connections.sent]
@@ -0,0 +1,171 @@
+"""Test presence and typing: grace periods, coalescing, partner-only delivery and multiple workers"""
+import asyncio
+import time
+from app.websocket.presence import PresenceService
+
+class Connections:
+    """Stands in for the ConnectionManager: who is connected here, and what they were sent"""
+    
+    def __init__(self):
+        self.active_connections = {}
+        self.sent = []
+    
+    def connect(self, user_id: str):
+        self.active_connections[user_id] = {}
+    
+    def disconnect(self, user_id: str):
+        self.active_connections.pop(user_id, None)
+    
+    async def send_json_to_users(self, data, user_ids):
+        for user_id in user_ids:
+            self.sent.append((user_id, data))
+    
+    def events(self, event_type: str, about: str = "alice"):
+        return [
+            (user_id, data) for user_id, data in self.sent
+            if data["type"] == event_type and data["user_id"] == about
+        ]
+
+class FakeRedis:
+    """The sorted-set and publish calls presence makes, shared by every worker"""
+    
+    def __init__(self):
+        self.sets = {}
+        self.writes = 0
+    
+    async def zadd(self, key, mapping):
+        self.writes += 1
+        self.sets.setdefault(key, {}).update(mapping)
+    
+    async def expire(self, key, seconds):
+        self.writes += 1
+    
+    async def zrem(self, key, member):
+        self.sets.get(key, {}).pop(member, None)
+    
+    async def publish(self, channel, message):
+        pass
+    
+    def pipeline(self):
+        redis, counts = self, []
+        
+        class Pipeline:
+            def zcount(self, key, low, high):
+                counts.append(sum(1 for score in redis.sets.get(key, {}).values() if score >= low))
+            
+            async def execute(self):
+                return counts
+        return Pipeline()
+
+def make_presence(connections, **options) -> PresenceService:
+    options = {"ttl": 30.0, "offline_grace": 0.05, "typing_interval": 0.05, **options}
+    presence = PresenceService(connections, **options)
+    presence.register_conversation("c1", "alice", "bob")
+    return presence
+
+async def join(presence: PresenceService, user_id: str):
+    presence.connections.connect(user_id)
+    await presence.connected(user_id)
+
+async def leave(presence: PresenceService, user_id: str):
+    presence.connections.disconnect(user_id)
+    await presence.disconnected(user_id)
+
+async def test_reconnect_inside_the_grace_period_does_not_flap():
+    connections = Connections()
+    presence = make_presence(connections)
+    await join(presence, "bob")
+    await join(presence, "alice")
+    assert connections.events("presence") == [("bob", {"type": "presence", "user_id": "alice", "online": True})]
+    
+    await leave(presence, "alice")
+    await join(presence, "alice")
+    await asyncio.sleep(0.1)
+    assert len(connections.events("presence")) == 1
+    
+    await leave(presence, "alice")
+    await asyncio.sleep(0.1)
+    assert connections.events("presence")[-1] == ("bob", {"type": "presence", "user_id": "alice", "online": False})
+    assert not presence.is_online("alice")
+    await presence.stop()
+
+async def test_typing_is_coalesced_into_one_trailing_update():
+    connections = Connections()
+    presence = make_presence(connections)
+    for _ in range(5):
+        await presence.typing("alice", "c1")
+    assert len(connections.events("typing")) == 1
+    await asyncio.sleep(0.1)
+    assert len(connections.events("typing")) == 2
+    
+    # Stopping is sent at once and cancels a pending trailing update
+    await presence.typing("alice", "c1")
+    await presence.typing("alice", "c1", active=False)
+    await asyncio.sleep(0.1)
+    assert [data["active"] for _, data in connections.events("typing")] == [True, True, True, False]
+    await presence.stop()
+
+async def test_events_only_reach_conversation_partners():
+    connections = Connections()
+    presence = make_presence(connections)
+    for user_id in ("bob", "mallory"):
+        await join(presence, user_id)
+    connections.sent.clear()
+    await join(presence, "alice")
+    await presence.typing("alice", "c1")
+    # Not a participant: ignored
+    await presence.typing("mallory", "c1")
+    
+    assert {user_id for user_id, _ in connections.sent} == {"bob"}
+    assert await presence.online_partners("bob") == {"alice"}
+    await presence.stop()
+
+async def test_open_socket_outlives_its_ttl():
+    connections = Connections()
+    presence = make_presence(connections, ttl=1.0)
+    await join(presence, "alice")
+    await presence.expire(time.monotonic() + 5)
+    assert presence.expiry["alice"] > time.monotonic() + 4
+    
+    await leave(presence, "alice")
+    await asyncio.sleep(0.1)
+    await presence.expire(time.monotonic() + 5)
+    assert "alice" not in presence.expiry
+    await presence.stop()
+
+async def test_user_on_another_worker_stays_online():
+    redis = FakeRedis()
+    first, second = Connections(), Connections()
+    worker1, worker2 = make_presence(first), make_presence(second)
+    worker1.redis = worker2.redis = redis
+    await join(worker1, "bob")
+    await join(worker1, "alice")
+    await join(worker2, "alice")
+    
+    await leave(worker1, "alice")
+    await asyncio.sleep(0.1)
+    assert ("bob", {"type": "presence", "user_id": "alice", "online": False}) not in first.sent
+    assert await worker1.online_partners("bob") == {"alice"}
+    
+    await leave(worker2, "alice")
+    await asyncio.sleep(0.1)
+    assert await worker1.online_partners("bob") == set()
+    worker1.redis = worker2.redis = None
+    await worker1.stop()
+    await worker2.stop()
+
+async def test_heartbeats_refresh_redis_sparingly():
+    connections = Connections()
+    presence = make_presence(connections, ttl=30.0)
+    presence.redis = redis = FakeRedis()
+    await join(presence, "alice")
+    writes = redis.writes
+    for _ in range(100):
+        await presence.heartbeat("alice")
+    assert redis.writes == writes
+    
+    presence.refreshed["alice"] -= 11
+    await presence.heartbeat("alice")
+    assert redis.writes == writes + 2
+    presence.redis = None
+    await presence.stop()
@@ -0,0 +1,100 @@
+"""Test batched, resumable deletion jobs"""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select, func
+from app.database.ids import new_id
+from app.database.models import Conversation, Message, RetentionJob, User
+from app.services.chat_service import ChatService
+from app.services.conversation_cache import conversation_cache
+from app.services.directory_service import users_generation
+from app.services.retention_service import RetentionService
+
+class Interrupted(Exception):
+    pass
+
+def interrupt_after(service: RetentionService, batches: int):
+    """Make the service fail between batches, after `batches` have committed"""
+    calls = 0
+    
+    async def throttle(rows, started):
+        nonlocal calls
+        calls += 1
+        if calls == batches:
+            raise Interrupted()
+    service._throttle = throttle
+
+async def add_messages(db, conversation: Conversation, sender_id: str, count: int, age: timedelta):
+    start = datetime.utcnow() - age
+    for n in range(count):
+        db.add(Message(
+            id=new_id(), conversation_id=conversation.id, sender_id=sender_id,
+            original_content=f"message {n}", transformed_content=f"message {n}",
+            timestamp=start + timedelta(seconds=n)
+        ))
+    await db.commit()
+
+async def count(db, model) -> int:
+    return (await db.execute(select(func.count()).select_from(model))).scalar()
+
+@pytest.fixture
+async def conversation(db, make_user):
+    alice, bob = await make_user("alice"), await make_user("bob")
+    return await ChatService().get_or_create_conversation(alice.id, bob.id, db)
+
+async def test_delete_messages_in_batches(db, conversation):
+    await add_messages(db, conversation, conversation.user1_id, 5, age=timedelta(days=400))
+    await add_messages(db, conversation, conversation.user1_id, 2, age=timedelta(days=1))
+    service = RetentionService(batch_size=2, max_rows_per_second=0)
+    
+    dry_run = await service.delete_messages(db, older_than=datetime.utcnow() - timedelta(days=365), dry_run=True)
+    assert dry_run["deleted"]["messages"] == 5
+    assert await count(db, Message) == 7
+    
+    result = await service.delete_messages(
+        db, older_than=datetime.utcnow() - timedelta(days=365), job_name="old"
+    )
+    assert result["deleted"]["messages"] == 5
+    assert await count(db, Message) == 2
+    job = await db.get(RetentionJob, "old")
+    assert job.status == "done"
+
+async def test_interrupted_job_resumes_from_its_cursor(db, conversation):
+    await add_messages(db, conversation, conversation.user1_id, 5, age=timedelta(days=1))
+    service = RetentionService(batch_size=2, max_rows_per_second=0)
+    interrupt_after(service, batches=1)
+    
+    with pytest.raises(Interrupted):
+        await service.delete_messages(db, conversation_id=conversation.id, job_name="purge")
+    assert await count(db, Message) == 3
+    
+    # The rerun takes its parameters from the saved job, not the call
+    result = await RetentionService(batch_size=2, max_rows_per_second=0).delete_messages(
+        db, user_id=new_id(), job_name="purge"
+    )
+    assert result["deleted"]["messages"] == 5
+    assert await count(db, Message) == 0
+
+async def test_finished_job_name_starts_a_new_run(db, make_user):
+    service = RetentionService(batch_size=10, max_rows_per_second=0)
+    await make_user("first")
+    assert (await service.clear_all(db, job_name="clear"))["deleted"]["users"] == 1
+    
+    await make_user("second")
+    assert (await service.clear_all(db, job_name="clear"))["deleted"]["users"] == 1
+    assert await count(db, User) == 0
+
+async def test_delete_user_removes_conversations_and_cache(db, conversation, make_user):
+    carol = await make_user("carol")
+    other = await ChatService().get_or_create_conversation(conversation.user2_id, carol.id, db)
+    await add_messages(db, conversation, conversation.user2_id, 3, age=timedelta(days=1))
+    await add_messages(db, other, carol.id, 2, age=timedelta(days=1))
+    assert await conversation_cache.get(conversation.id, db) is not None
+    generation = (await db.execute(select(users_generation()))).scalar()
+    
+    result = await RetentionService(batch_size=2, max_rows_per_second=0).delete_user(db, conversation.user1_id)
+    assert result["deleted"]["messages"] == 3
+    assert await db.get(User, conversation.user1_id) is None
+    assert await conversation_cache.get(conversation.id, db) is None
+    assert await count(db, Message) == 2
+    # The directory ETag changes even if a signup restores the user count
+    assert (await db.execute(select(users_generation()))).scalar() == generation + 1
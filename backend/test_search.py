@@ -0,0 +1,104 @@
+"""Test full-text message search on SQLite: ranking, scoping, query sanitizing and paging"""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+from app.database.ids import new_id
+from app.database.models import Message
+from app.services.chat_service import ChatService
+from app.services.search_service import SearchService
+from conftest import auth_headers
+
+search = SearchService()
+
+@pytest.fixture
+async def people(db, make_user):
+    alice, bob, carol = await make_user("alice"), await make_user("bob"), await make_user("carol")
+    chat_service = ChatService()
+    mine = await chat_service.get_or_create_conversation(alice.id, bob.id, db)
+    theirs = await chat_service.get_or_create_conversation(bob.id, carol.id, db)
+    return alice, bob, mine, theirs
+
+async def add(db, conversation, sender, *contents: str):
+    start = datetime.utcnow()
+    messages = []
+    for n, content in enumerate(contents):
+        messages.append(Message(
+            id=new_id(), conversation_id=conversation.id, sender_id=sender.id,
+            original_content=content, transformed_content=f"kindly: {content}",
+            timestamp=start + timedelta(seconds=n)
+        ))
+    db.add_all(messages)
+    await db.commit()
+    return messages
+
+async def found(user, query: str, db, **options):
+    page = await search.search_messages(user.id, query, db, **options)
+    return [result["message_id"] for result in page["results"]]
+
+async def test_best_match_first_with_snippet(db, people):
+    alice, bob, mine, _ = people
+    passing, focused = await add(
+        db, mine, bob,
+        "we could get pizza or maybe tacos or sushi or anything else you like tonight",
+        "pizza pizza pizza"
+    )
+    page = await search.search_messages(alice.id, "pizza", db)
+    assert [result["message_id"] for result in page["results"]] == [focused.id, passing.id]
+    assert "<mark>pizza</mark>" in page["results"][0]["snippet"]
+    assert not page["results"][0]["is_mine"]
+    # The last word matches as a prefix, and transformed content is searched too
+    assert await found(alice, "piz", db) == [focused.id, passing.id]
+    assert len(await found(alice, "kindly tacos", db)) == 1
+
+async def test_other_peoples_messages_never_match(api, db, people):
+    alice, bob, mine, theirs = people
+    await add(db, theirs, bob, "the secret plan")
+    visible, = await add(db, mine, bob, "no secrets here")
+    assert await found(alice, "secret", db) == [visible.id]
+    
+    response = await api.get("/api/chat/search", params={"q": "plan"}, headers=auth_headers(alice))
+    assert response.status_code == 200
+    assert response.json() == {"results": [], "next_offset": None}
+
+@pytest.mark.parametrize("query", [
+    '"', '"""', "pizza\" OR \"1", "NEAR(pizza tacos)", "-pizza", "pizza*", "col:pizza", "^pizza", "(", "AND",
+])
+async def test_fts_syntax_is_treated_as_words(db, people, query):
+    alice, bob, mine, _ = people
+    await add(db, mine, bob, "pizza and tacos")
+    # Never an FTS5 syntax error; operators are just more words to match
+    await search.search_messages(alice.id, query, db)
+
+async def test_operators_do_not_widen_the_match(db, people):
+    alice, bob, mine, _ = people
+    pizza, _ = await add(db, mine, bob, "pizza tonight", "tacos tonight")
+    assert await found(alice, "pizza OR tacos", db) == []
+    assert await found(alice, 'tonight "pizza', db) == [pizza.id]
+    assert await found(alice, "!!!", db) == []
+
+async def test_next_offset_pages_through_every_match(db, people):
+    alice, bob, mine, _ = people
+    messages = await add(db, mine, bob, *(f"ticket {n}" for n in range(5)))
+    seen, offset, pages = [], 0, 0
+    while offset is not None:
+        page = await search.search_messages(alice.id, "ticket", db, limit=2, offset=offset)
+        seen += [result["message_id"] for result in page["results"]]
+        offset = page["next_offset"]
+        pages += 1
+    assert pages == 3
+    assert sorted(seen) == sorted(message.id for message in messages)
+
+async def test_rebuild_index_restores_search(db, people):
+    alice, bob, mine, _ = people
+    await add(db, mine, bob, "lost and found", "found again")
+    # As if the messages predate the search tables
+    await db.execute(text("DELETE FROM messages_fts"))
+    await db.execute(text("DELETE FROM message_search_docs"))
+    await db.commit()
+    assert await found(alice, "found", db) == []
+    
+    assert await search.rebuild_index(db) == 2
+    assert len(await found(alice, "found", db)) == 2
+    # New messages keep being indexed after a rebuild
+    await add(db, mine, bob, "found once more")
+    assert len(await found(alice, "found", db)) == 3
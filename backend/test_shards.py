@@ -0,0 +1,110 @@
+"""Test messages spread over several SQLite shards: routing, fan-out reads and rebalancing"""
+import pytest
+from sqlalchemy import select, func
+from app.config import settings
+from app.database.connection import async_engine_for
+from app.database.models import Base, Conversation, Message
+from app.database.shards import ShardRouter, shards
+from app.services.chat_service import ChatService
+from app.services.rebalance_service import ShardRebalancer
+
+chat_service = ChatService()
+
+@pytest.fixture
+async def use_shards(db_engine, tmp_path, monkeypatch):
+    """Point the app at the main test database plus `count - 1` empty shard files"""
+    routers = []
+    
+    async def use(count: int) -> ShardRouter:
+        urls = [settings.DATABASE_URL] + [f"sqlite:///{tmp_path / f'shard{n}.db'}" for n in range(1, count)]
+        for url in urls[1:]:
+            engine = async_engine_for(url)
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+            await engine.dispose()
+        monkeypatch.setattr(settings, "DATABASE_SHARD_URLS", ",".join(urls))
+        router = ShardRouter(urls)
+        monkeypatch.setattr(shards, "shards", router.shards)
+        routers.append(router)
+        return router
+    yield use
+    for router in routers:
+        await router.dispose()
+
+async def stored_messages(router: ShardRouter) -> dict:
+    """conversation id -> (shard, message count) for every stored message"""
+    stored = {}
+    for shard in router.shards:
+        async with shard.session() as shard_db:
+            rows = await shard_db.execute(
+                select(Message.conversation_id, func.count()).group_by(Message.conversation_id)
+            )
+            for conversation_id, count in rows.all():
+                assert conversation_id not in stored, "messages split across shards"
+                stored[conversation_id] = (shard.index, count)
+    return stored
+
+async def start_conversations(db, make_user, count: int):
+    alice = await make_user("alice")
+    conversations = []
+    for n in range(count):
+        friend = await make_user(f"friend{n}")
+        conversation = await chat_service.get_or_create_conversation(alice.id, friend.id, db)
+        await chat_service.send_message(conversation.id, friend.id, f"hi alice, from {n}", db)
+        await chat_service.send_message(conversation.id, alice.id, f"hi friend {n}", db)
+        conversations.append(conversation)
+    return alice, conversations
+
+async def test_messages_are_stored_on_the_recorded_shard(db, make_user, use_shards):
+    router = await use_shards(3)
+    alice, conversations = await start_conversations(db, make_user, 12)
+    
+    recorded = {conversation.id: conversation.shard for conversation in conversations}
+    assert len(set(recorded.values())) > 1
+    assert await stored_messages(router) == {
+        conversation_id: (shard, 2) for conversation_id, shard in recorded.items()
+    }
+    
+    # Reads go to the conversation's shard, sender names included
+    conversation = next(conversation for conversation in conversations if conversation.shard != 0)
+    rows = await chat_service.get_conversation_message_rows(conversation.id, alice.id, db)
+    assert [row["sender_username"] for row in rows] == [f"friend{conversations.index(conversation)}", "alice"]
+
+async def test_conversation_list_fans_out_to_every_shard(db, make_user, use_shards):
+    await use_shards(3)
+    alice, conversations = await start_conversations(db, make_user, 9)
+    
+    listed = await chat_service.get_user_conversations(alice.id, db)
+    assert {entry["id"] for entry in listed} == {conversation.id for conversation in conversations}
+    for entry in listed:
+        number = entry["other_user"]["username"].removeprefix("friend")
+        # Alice replied last; her friend's message is the unread one
+        assert entry["last_message"]["content"].startswith(f"hi friend {number}")
+        assert entry["last_message"]["is_mine"]
+        assert entry["unread_count"] == 1
+
+async def test_rebalance_moves_conversations_to_an_added_shard(db, make_user, use_shards):
+    await use_shards(2)
+    alice, conversations = await start_conversations(db, make_user, 12)
+    
+    # Appending a shard only pulls over the conversations it now wins
+    router = await use_shards(3)
+    rebalancer = ShardRebalancer(batch_size=1, settle=0)
+    moves = await rebalancer.misplaced(db)
+    assert moves and {move.target for move in moves} == {2}
+    
+    result = await rebalancer.rebalance(db, batch=5)
+    assert result == {"conversations": len(moves), "messages": 2 * len(moves)}
+    assert await rebalancer.misplaced(db) == []
+    
+    recorded = dict((await db.execute(select(Conversation.id, Conversation.shard))).all())
+    assert await stored_messages(router) == {
+        conversation_id: (shard, 2) for conversation_id, shard in recorded.items()
+    }
+    assert sum(row["conversations"] for row in await rebalancer.status(db)) == 12
+    
+    moved = moves[0].conversation_id
+    rows = await chat_service.get_conversation_message_rows(moved, alice.id, db)
+    assert len(rows) == 2
+    listed = await chat_service.get_user_conversations(alice.id, db)
+    assert all(entry["last_message"]["content"] for entry in listed)
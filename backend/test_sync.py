@@ -0,0 +1,70 @@
+"""Test the per-user sync log: cursors, gaps between a user's seqs, pruning and resets"""
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app.database.ids import new_id
+from app.database.models import SyncLogEntry
+from app.services.sync_service import SyncService
+
+ALICE, BOB = new_id(), new_id()
+
+def event(event_id: int, recipients):
+    return {"recipients": recipients, "data": {"event_id": event_id, "type": "tick", "conversation_id": None}}
+
+async def log(db, service: SyncService, events):
+    await service.append(db, events)
+    await db.commit()
+
+async def test_changes_page_through_one_users_entries(db):
+    service = SyncService(retention=timedelta(days=30), batch_size=100)
+    # Bob's entries leave gaps in Alice's seqs
+    await log(db, service, [event(1, [ALICE, BOB]), event(2, [BOB]), event(3, [ALICE]), event(4, [BOB, ALICE])])
+    
+    page = await service.changes(ALICE, 0, db, limit=2)
+    assert [change["event_id"] for change in page["changes"]] == [1, 3]
+    assert [change["seq"] for change in page["changes"]] == [1, 4]
+    assert page["next"] == 4 and page["has_more"] and not page["reset"]
+    
+    page = await service.changes(ALICE, page["next"], db, limit=2)
+    assert [change["event_id"] for change in page["changes"]] == [4]
+    assert page["next"] == 6 and not page["has_more"]
+    
+    # Caught up: the cursor stays put
+    page = await service.changes(ALICE, 6, db)
+    assert page == {"changes": [], "next": 6, "has_more": False, "reset": False}
+
+async def test_append_continues_after_the_highest_seq(db):
+    service = SyncService(retention=timedelta(days=30), batch_size=100)
+    await log(db, service, [event(1, [ALICE, BOB])])
+    await log(db, service, [event(2, [BOB])])
+    page = await service.changes(BOB, 0, db)
+    assert [change["seq"] for change in page["changes"]] == [2, 3]
+
+async def test_prune_keeps_the_newest_entry(db):
+    service = SyncService(retention=timedelta(days=1), batch_size=100)
+    await log(db, service, [event(n, [ALICE]) for n in range(1, 6)])
+    await db.execute(update(SyncLogEntry).values(created_at=datetime.utcnow() - timedelta(days=2)))
+    await db.commit()
+    
+    await service.prune(db)
+    page = await service.changes(ALICE, 4, db)
+    assert [change["seq"] for change in page["changes"]] == [5]
+    # Seqs continue after pruning
+    await log(db, service, [event(6, [ALICE])])
+    page = await service.changes(ALICE, 5, db)
+    assert [change["seq"] for change in page["changes"]] == [6]
+
+async def test_cursor_behind_pruned_entries_is_told_to_reset(db):
+    service = SyncService(retention=timedelta(days=1), batch_size=100)
+    await log(db, service, [event(n, [ALICE]) for n in range(1, 4)])
+    await db.execute(update(SyncLogEntry).where(SyncLogEntry.seq < 3).values(
+        created_at=datetime.utcnow() - timedelta(days=2)
+    ))
+    await db.commit()
+    await service.prune(db)
+    
+    page = await service.changes(ALICE, 1, db)
+    assert page == {"changes": [], "next": 3, "has_more": False, "reset": True}
+    # A client that had seen seq 2 missed nothing that was pruned
+    page = await service.changes(ALICE, 2, db)
+    assert not page["reset"]
+    assert [change["seq"] for change in page["changes"]] == [3]
@@ -0,0 +1,97 @@
+"""Test token reservations, batched usage writes and daily budgets"""
+import pytest
+from sqlalchemy import select, func
+from app.config import settings
+from app.database.models import LlmUsage
+from app.services.chat_service import ChatService
+from app.services.usage_service import TokenBudgetExceeded, TokenUsage, UsageTracker
+from conftest import auth_headers
+
+def make_tracker(default_budget: int = 100, batch_size: int = 100) -> UsageTracker:
+    return UsageTracker(default_budget=default_budget, batch_size=batch_size, flush_interval=1.0, refresh_interval=60.0)
+
+def record(tracker: UsageTracker, user_id: str, tokens: int):
+    tracker.record(user_id, "nicer", TokenUsage(tokens, 0), max_tokens=tokens, latency=0.1)
+
+async def stored_rows(db) -> int:
+    return (await db.execute(select(func.count()).select_from(LlmUsage))).scalar()
+
+async def test_reservation_is_held_until_the_call_finishes(db, make_user):
+    user = await make_user("alice")
+    tracker = make_tracker()
+    async with tracker.reserve(user.id, 60):
+        assert (await tracker.budget_status(user.id))["remaining"] == 40
+        # A concurrent call cannot spend the same tokens
+        with pytest.raises(TokenBudgetExceeded) as exceeded:
+            async with tracker.reserve(user.id, 50):
+                pass
+        assert 0 < exceeded.value.retry_after <= 24 * 3600
+        record(tracker, user.id, 30)
+    assert await tracker.budget_status(user.id) == {"budget": 100, "used": 30, "remaining": 70}
+    assert tracker.reserved == {}
+
+async def test_flush_writes_batches_and_keeps_the_total(db, make_user):
+    user = await make_user("alice")
+    tracker = make_tracker(batch_size=2)
+    await tracker.budget_status(user.id)
+    for _ in range(5):
+        record(tracker, user.id, 10)
+    assert tracker.wakeup.is_set()
+    
+    await tracker.flush()
+    assert await stored_rows(db) == 5
+    assert tracker.pending == [] and tracker.writing == []
+    # Counted once, from the cached stored total rather than the unwritten rows
+    assert (await tracker.budget_status(user.id))["used"] == 50
+    tracker.forget(user.id)
+    assert (await tracker.budget_status(user.id))["used"] == 50
+
+async def test_failed_flush_keeps_the_rows(db, make_user, monkeypatch):
+    user = await make_user("alice")
+    tracker = make_tracker()
+    record(tracker, user.id, 10)
+    
+    def unavailable():
+        raise ConnectionError("database is down")
+    with monkeypatch.context() as patch:
+        patch.setattr("app.services.usage_service.AsyncSessionLocal", unavailable)
+        with pytest.raises(ConnectionError):
+            await tracker.flush()
+    assert len(tracker.pending) == 1
+    assert (await tracker.budget_status(user.id))["used"] == 10
+    
+    await tracker.flush()
+    assert await stored_rows(db) == 1
+
+async def test_user_budget_overrides_the_default(db, make_user):
+    unlimited = await make_user("unlimited", daily_token_budget=0)
+    capped = await make_user("capped", daily_token_budget=5)
+    tracker = make_tracker()
+    async with tracker.reserve(unlimited.id, 1000):
+        pass
+    with pytest.raises(TokenBudgetExceeded):
+        async with tracker.reserve(capped.id, 6):
+            pass
+
+async def test_send_over_budget_is_refused(api, db, make_user):
+    alice, bob = await make_user("alice", daily_token_budget=5), await make_user("bob")
+    conversation = await ChatService().get_or_create_conversation(alice.id, bob.id, db)
+    
+    response = await api.post(
+        f"/api/chat/conversation/{conversation.id}/send", json={"content": "hello there"}, headers=auth_headers(alice)
+    )
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) > 0
+
+async def test_only_admins_set_budgets(api, make_user, monkeypatch):
+    admin, alice = await make_user("admin"), await make_user("alice")
+    monkeypatch.setattr(settings, "ADMIN_USER_IDS", str(admin.id))
+    
+    url = f"/api/admin/users/{alice.id}/token-budget"
+    # Lifting your own limit takes more than being logged in
+    response = await api.put(url, json={"daily_tokens": 0}, headers=auth_headers(alice))
+    assert response.status_code == 403
+    
+    response = await api.put(url, json={"daily_tokens": 0}, headers=auth_headers(admin))
+    assert response.status_code == 200
+    assert response.json()["budget"] is None
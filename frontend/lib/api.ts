@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { User, Conversation, Message, AgentTone } from './types';
+import { User, UserPage, Conversation, Message, AgentTone } from './types';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
@@ -54,7 +54,16 @@ export const authApi = {
 // Chat API
 export const chatApi = {
   getUsers: async (): Promise<User[]> => {
-    const response = await api.get('/api/chat/users');
+    const response = await api.get('/api/chat/users', {
+      params: { order: 'recent', limit: 100 },
+    });
+    return response.data.users;
+  },
+
+  searchUsers: async (query: string, cursor?: string): Promise<UserPage> => {
+    const response = await api.get('/api/chat/users', {
+      params: { q: query, cursor },
+    });
     return response.data;
   },
 
@@ -80,6 +89,14 @@ export const chatApi = {
     return response.data;
   },
 
+  broadcastMessage: async (conversationIds: string[], content: string) => {
+    const response = await api.post('/api/chat/broadcast', {
+      conversation_ids: conversationIds,
+      content,
+    });
+    return response.data;
+  },
+
   updateTone: async (conversationId: string, tone: AgentTone, customPrompt?: string) => {
     const response = await api.put(`/api/chat/conversation/${conversationId}/tone`, {
       tone,
@@ -4,6 +4,11 @@ export interface User {
   email?: string;
 }
 
+export interface UserPage {
+  users: User[];
+  next_cursor: string | null;
+}
+
 export interface Message {
   id: string;
   sender_id: string;
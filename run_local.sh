@@ -6,6 +6,7 @@ echo "Starting Agent Chat Application..."
 echo "Starting backend server..."
 cd backend
 source venv/bin/activate
+alembic upgrade head
 uvicorn app.main:app --reload --port 8000 &
 BACKEND_PID=$!
 
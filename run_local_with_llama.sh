@@ -9,6 +9,7 @@ export LLAMA_API_KEY='LLM|969038691802156|u86DbGY93yYwAq2wdW-SJRp49AE'
 echo "Starting backend server with Llama API key..."
 cd backend
 source venv/bin/activate
+alembic upgrade head
 LLAMA_API_KEY=$LLAMA_API_KEY uvicorn app.main:app --reload --port 8000 &
 BACKEND_PID=$!
 
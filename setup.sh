@@ -44,7 +44,6 @@ fi
 
 # Run migrations
 echo "Running database migrations..."
-alembic revision --autogenerate -m "Initial migration" 2>/dev/null || true
 alembic upgrade head
 
 cd ..